@@ -0,0 +1,102 @@
+"""
+Benchmark the per-call overhead of the validated lookup functions from
+`bigearthnet_common.base` against their unchecked counterparts from `bigearthnet_common.fast`
+and against plain dictionary and set lookups, which is how the lookups were done
+before the metadata table and the lower bound for the fast functions.
+
+Run with:
+
+    python benchmarks/fast_lookups.py
+"""
+
+import timeit
+from typing import Callable, Dict
+
+import bigearthnet_common.base as ben_base
+import bigearthnet_common.constants as ben_constants
+import bigearthnet_common.fast as ben_fast
+import bigearthnet_common.metadata as ben_metadata
+
+FUNCTIONS = (
+    "is_s1_patch",
+    "is_s2_patch",
+    "is_snowy_patch",
+    "is_cloudy_shadowy_patch",
+    "has_19_class_target",
+    "get_original_split_from_patch_name",
+    "get_country_from_patch_name",
+    "get_season_from_patch_name",
+    "s2_to_s1_patch_name",
+)
+S2_PATCH_NAME = "S2A_MSIL2A_20170613T101031_87_48"
+
+
+def dict_lookups() -> Dict[str, Callable[[str], object]]:
+    """
+    Return the plain dictionary and set lookups of the `FUNCTIONS` that look up metadata,
+    built from the metadata table.
+    """
+    table = ben_base.get_metadata_table()
+    s1_names = table.get_values(ben_metadata.MetadataColumn.s1_name)
+    s2_names = table.get_values(ben_metadata.MetadataColumn.s2_name)
+    names = s1_names + s2_names
+    flags = table.flags.tolist() * 2
+
+    def flag_set(flag: ben_metadata.PatchFlag) -> set:
+        return {name for name, f in zip(names, flags) if f & flag}
+
+    snowy = flag_set(ben_metadata.PatchFlag.seasonal_snow)
+    cloudy = flag_set(ben_metadata.PatchFlag.cloud_and_shadow)
+    no_19_class_target = flag_set(ben_metadata.PatchFlag.no_19_class_target)
+    splits = [ben_constants.Split(split) for split in ben_metadata.SPLIT_NAMES]
+    split = {
+        name: splits[code]
+        for name, code in zip(names, table.split.tolist() * 2)
+        if code != ben_metadata.NO_SPLIT
+    }
+    country = dict(
+        zip(names, table.get_values(ben_metadata.MetadataColumn.country) * 2)
+    )
+    season = dict(zip(names, table.get_values(ben_metadata.MetadataColumn.season) * 2))
+    s2_to_s1 = dict(zip(s2_names, s1_names))
+    return {
+        "is_snowy_patch": snowy.__contains__,
+        "is_cloudy_shadowy_patch": cloudy.__contains__,
+        "has_19_class_target": lambda name: name not in no_19_class_target,
+        "get_original_split_from_patch_name": split.get,
+        "get_country_from_patch_name": country.__getitem__,
+        "get_season_from_patch_name": season.__getitem__,
+        "s2_to_s1_patch_name": s2_to_s1.__getitem__,
+    }
+
+
+def time_per_call(func, number: int = 10_000, repeat: int = 5) -> float:
+    """Return the best per-call time of `func(S2_PATCH_NAME)` in seconds."""
+    return (
+        min(timeit.repeat(lambda: func(S2_PATCH_NAME), number=number, repeat=repeat))
+        / number
+    )
+
+
+def main():
+    references = dict_lookups()
+    print(
+        f"{'function':<36} {'validated [µs]':>15} {'fast [µs]':>10} {'speedup':>8}"
+        f" {'dict [µs]':>10}"
+    )
+    for name in FUNCTIONS:
+        validated = time_per_call(getattr(ben_base, name))
+        fast = time_per_call(getattr(ben_fast, name))
+        reference = (
+            f"{time_per_call(references[name]) * 1e6:>10.2f}"
+            if name in references
+            else f"{'-':>10}"
+        )
+        print(
+            f"{name:<36} {validated * 1e6:>15.2f} {fast * 1e6:>10.2f}"
+            f" {validated / fast:>7.1f}x {reference}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+"""
+Offline benchmark suite for the metadata lookups, set building, JSON reading
+and directory validation of `bigearthnet_common`.
+
+Every benchmark reports the best time of a few repetitions. The results are written
+to a JSON file, which can be passed as a baseline to a later run to spot regressions.
+
+Run with:
+
+    python benchmarks/suite.py --output results.json
+    python benchmarks/suite.py --output new.json --baseline results.json
+    python benchmarks/suite.py --filter lookup
+
+The suite does not need network access. The JSON reading and the directory validation
+run on small synthetic archives from `bigearthnet_common.synthetic`.
+The inputs of the benchmarks, such as the synthetic archives, are only prepared
+for the benchmarks that are selected with `--filter`.
+"""
+
+import argparse
+import contextlib
+import functools
+import io
+import json
+import platform
+import re
+import sys
+import tempfile
+import time
+import timeit
+import warnings
+from pathlib import Path
+from typing import Callable, Dict, Iterator, List, NamedTuple, Optional
+
+import numpy as np
+
+import bigearthnet_common
+import bigearthnet_common.base as ben_base
+import bigearthnet_common.catalog as ben_catalog
+import bigearthnet_common.codec as ben_codec
+import bigearthnet_common.constants as ben_constants
+import bigearthnet_common.fast as ben_fast
+import bigearthnet_common.metadata as ben_metadata
+import bigearthnet_common.sets as ben_sets
+import bigearthnet_common.snapshot as ben_snapshot
+import bigearthnet_common.synthetic as ben_synthetic
+
+# number of patch names of the batch lookups
+BATCH_SIZE = 100_000
+# number of patch directories of the synthetic archives
+TREE_PATCHES = 2_000
+# relative time difference to a baseline that is reported as a regression
+REGRESSION_THRESHOLD = 0.2
+
+
+class Benchmark(NamedTuple):
+    name: str
+    func: Callable[[], object]
+    # number of processed items per call, used to report the throughput
+    items: int = 1
+    number: int = 1
+    repeat: int = 3
+    # prepares the inputs of `func` before every repetition, outside of the timing
+    setup: Optional[Callable[[], object]] = None
+
+
+class Result(NamedTuple):
+    name: str
+    seconds: float
+    items: int
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds > 0 else float("inf")
+
+
+def run_benchmark(benchmark: Benchmark) -> Result:
+    """Return the best time per call of the `benchmark`."""
+    times = []
+    for _ in range(benchmark.repeat):
+        if benchmark.setup is not None:
+            benchmark.setup()
+        times.append(timeit.timeit(benchmark.func, number=benchmark.number))
+    return Result(benchmark.name, min(times) / benchmark.number, benchmark.items)
+
+
+def _quiet(func: Callable[[], object]) -> Callable[[], object]:
+    """Silence the printed reports and warnings of `func`."""
+
+    def _run():
+        with contextlib.redirect_stdout(io.StringIO()), warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            return func()
+
+    return _run
+
+
+def _clear_metadata_table() -> None:
+    """Write the on-disk cache of the metadata table, but drop it from memory."""
+    ben_base.get_metadata_table()
+    ben_base.get_metadata_table.cache_clear()
+
+
+def resource_benchmarks() -> Iterator[Benchmark]:
+    """Cold (decompress and parse) and warm (cached) loading of every resource."""
+    yield Benchmark(
+        "resource/cold/s1_s2_name_country_season",
+        lambda: ben_base._read_header_bz2_csv_resource(ben_base.Resource.s1_s2_mapping),
+    )
+    for resource in sorted(
+        {r.value for r in ben_base.Resource} - {"s1_s2_name_country_season.csv.bz2"}
+    ):
+        yield Benchmark(
+            f"resource/cold/{resource.split('.')[0]}",
+            lambda resource=resource: ben_base._conv_single_col_csv_resource_to_set(
+                resource
+            ),
+        )
+    yield Benchmark(
+        "resource/cold/metadata_table_build", ben_base._build_metadata_table, repeat=1
+    )
+    yield Benchmark(
+        "resource/cold/metadata_table_from_cache",
+        ben_base.get_metadata_table,
+        setup=_clear_metadata_table,
+    )
+    for func in (
+        ben_base.get_metadata_table,
+        ben_base.get_s2_patches_with_seasonal_snow,
+        ben_base.get_s1_patches_from_original_train_split,
+    ):
+        name = (
+            "metadata_table" if func is ben_base.get_metadata_table else func.__name__
+        )
+        yield Benchmark(f"resource/warm/{name}", func, number=100_000, setup=func)
+
+
+@functools.lru_cache()
+def _batch_names() -> List[str]:
+    """Return `BATCH_SIZE` random S2 patch names."""
+    table = ben_base.get_metadata_table()
+    rng = np.random.default_rng(0)
+    ids = rng.choice(len(table), size=BATCH_SIZE, replace=False)
+    return [
+        n.decode()
+        for n in table.get_names(ben_constants.SentinelSource.S2, ids).tolist()
+    ]
+
+
+def lookup_benchmarks() -> Iterator[Benchmark]:
+    """Per-call lookups of the validated and fast functions and batch lookups."""
+    s2_name = "S2A_MSIL2A_20170613T101031_87_48"
+    s1_name = "S1A_IW_GRDH_1SDV_20170613T165043_33UUP_87_48"
+    for module in (ben_base, ben_fast):
+        for func_name, arg in (
+            ("s1_to_s2_patch_name", s1_name),
+            ("s2_to_s1_patch_name", s2_name),
+            ("get_country_from_patch_name", s2_name),
+            ("get_season_from_patch_name", s2_name),
+            ("is_snowy_patch", s2_name),
+            ("get_original_split_from_patch_name", s2_name),
+        ):
+            func = getattr(module, func_name)
+            yield Benchmark(
+                f"lookup/{module.__name__.rsplit('.', 1)[-1]}/{func_name}",
+                lambda func=func, arg=arg: func(arg),
+                number=10_000,
+                repeat=5,
+                setup=ben_base.get_metadata_table,
+            )
+
+    yield Benchmark(
+        "lookup/batch/get_ids",
+        lambda: ben_base.get_metadata_table().get_ids(_batch_names()),
+        BATCH_SIZE,
+        setup=_batch_names,
+    )
+    for func in (
+        ben_base.get_countries_from_patch_names,
+        ben_base.are_snowy_patches,
+        ben_base.get_patches_metadata,
+        ben_codec.parse_patch_names,
+    ):
+        yield Benchmark(
+            f"lookup/batch/{func.__name__}",
+            lambda func=func: func(_batch_names()),
+            BATCH_SIZE,
+            setup=_batch_names,
+        )
+    yield Benchmark(
+        "lookup/batch/get_original_splits_from_patch_names",
+        _quiet(lambda: ben_base.get_original_splits_from_patch_names(_batch_names())),
+        BATCH_SIZE,
+        setup=_batch_names,
+    )
+
+    # acquisition times in the S2 json format
+    times = [f"2017-06-13 10:10:{i % 60:02}" for i in range(BATCH_SIZE)]
+    yield Benchmark(
+        "lookup/parse_datetime",
+        lambda: ben_base.parse_datetime(times[0]),
+        number=10_000,
+        repeat=5,
+    )
+    yield Benchmark(
+        "lookup/batch/parse_datetimes",
+        lambda: ben_base.parse_datetimes(times),
+        BATCH_SIZE,
+    )
+
+
+def set_benchmarks(tmp_dir: Path) -> Iterator[Benchmark]:
+    """`build_set` and `build_csv_sets` for several filter combinations."""
+    filters = {
+        "all": {},
+        "all_with_unrecommended": {"remove_unrecommended_dl_patches": False},
+        "winter": {"seasons": ["Winter"]},
+        "serbia_summer": {"seasons": ["Summer"], "countries": ["Serbia"]},
+        "three_countries": {"countries": ["Austria", "Finland", "Portugal"]},
+    }
+    for source in ("S1", "S2"):
+        for name, kwargs in filters.items():
+            yield Benchmark(
+                f"sets/build_set/{source}/{name}",
+                lambda source=source, kwargs=kwargs: ben_sets.build_set(
+                    source, **kwargs
+                ),
+                setup=ben_base.get_metadata_table,
+            )
+    for name in ("all", "serbia_summer"):
+        yield Benchmark(
+            f"sets/build_csv_sets/S2/{name}",
+            lambda name=name: ben_sets.build_csv_sets(
+                tmp_dir / name, "S2", **filters[name]
+            ),
+            setup=ben_base.get_metadata_table,
+        )
+
+
+@functools.lru_cache()
+def _synthetic_archive(tmp_dir: Path, source: str) -> Path:
+    root_dir = tmp_dir / f"BigEarthNet-{source}"
+    ben_synthetic.generate_synthetic_archive(
+        root_dir, source, fraction=TREE_PATCHES / ben_constants.BEN_COMPLETE_SIZE
+    )
+    return root_dir
+
+
+@functools.lru_cache()
+def _json_files(tmp_dir: Path, source: str) -> List[Path]:
+    return sorted(_synthetic_archive(tmp_dir, source).glob("*/*_labels_metadata.json"))
+
+
+def json_benchmarks(tmp_dir: Path) -> Iterator[Benchmark]:
+    """Throughput of the single-file and bulk JSON readers on synthetic archives."""
+    for source, reader in (
+        ("S1", ben_base.read_S1_json),
+        ("S2", ben_base.read_S2_json),
+    ):
+        yield Benchmark(
+            f"json/{reader.__name__}",
+            lambda reader=reader, source=source: [
+                reader(fp) for fp in _json_files(tmp_dir, source)
+            ],
+            TREE_PATCHES,
+            setup=lambda source=source: _json_files(tmp_dir, source),
+        )
+    for source, reader in (
+        ("S1", ben_base.read_S1_jsons),
+        ("S2", ben_base.read_S2_jsons),
+    ):
+        root_dir = tmp_dir / f"BigEarthNet-{source}"
+        setup = functools.partial(_synthetic_archive, tmp_dir, source)
+        yield Benchmark(
+            f"json/{reader.__name__}",
+            lambda reader=reader, root_dir=root_dir: list(reader(root_dir)),
+            TREE_PATCHES,
+            setup=setup,
+        )
+        yield Benchmark(
+            f"json/{reader.__name__}_intern_strings",
+            lambda reader=reader, root_dir=root_dir: list(
+                reader(root_dir, intern_strings=True)
+            ),
+            TREE_PATCHES,
+            setup=setup,
+        )
+
+
+@functools.lru_cache()
+def _snapshot_file(tmp_dir: Path) -> Path:
+    file_path = tmp_dir / "snapshot.npz"
+    ben_snapshot.write_metadata_snapshot(
+        _synthetic_archive(tmp_dir, "S2"), "S2", file_path
+    )
+    return file_path
+
+
+@functools.lru_cache()
+def _updated_snapshot_file(tmp_dir: Path) -> Path:
+    file_path = tmp_dir / "updated_snapshot.npz"
+    ben_snapshot.update_metadata_snapshot(
+        _synthetic_archive(tmp_dir, "S2"), "S2", file_path
+    )
+    return file_path
+
+
+def snapshot_benchmarks(tmp_dir: Path) -> Iterator[Benchmark]:
+    """Building, loading and querying a metadata snapshot of a synthetic archive."""
+    root_dir = tmp_dir / "BigEarthNet-S2"
+    file_path = tmp_dir / "snapshot.npz"
+    setup = functools.partial(_snapshot_file, tmp_dir)
+    yield Benchmark(
+        "snapshot/write_metadata_snapshot",
+        lambda: ben_snapshot.write_metadata_snapshot(root_dir, "S2", file_path),
+        TREE_PATCHES,
+        setup=setup,
+    )
+    yield Benchmark(
+        "snapshot/load_metadata_snapshot",
+        lambda: ben_snapshot.load_metadata_snapshot(file_path),
+        number=100,
+        setup=setup,
+    )
+    yield Benchmark(
+        "snapshot/has_labels",
+        lambda: ben_snapshot.load_metadata_snapshot(file_path).has_labels(
+            ["Pastures", "Mixed forest"]
+        ),
+        TREE_PATCHES,
+        number=100,
+        setup=setup,
+    )
+    update_path = tmp_dir / "updated_snapshot.npz"
+    yield Benchmark(
+        "snapshot/update_metadata_snapshot_unchanged",
+        lambda: ben_snapshot.update_metadata_snapshot(root_dir, "S2", update_path),
+        TREE_PATCHES,
+        setup=functools.partial(_updated_snapshot_file, tmp_dir),
+    )
+
+
+@functools.lru_cache()
+def _catalog_snapshots(tmp_dir: Path) -> List[ben_snapshot.MetadataSnapshot]:
+    return [ben_snapshot.load_metadata_snapshot(_snapshot_file(tmp_dir))]
+
+
+@functools.lru_cache()
+def _catalog_file(tmp_dir: Path) -> Path:
+    return ben_catalog.build_catalog(
+        tmp_dir / "catalog.sqlite", _catalog_snapshots(tmp_dir)
+    )
+
+
+def catalog_benchmarks(tmp_dir: Path) -> Iterator[Benchmark]:
+    """Building and querying a catalog with the labels of a synthetic archive."""
+    file_path = tmp_dir / "catalog.sqlite"
+    setup = functools.partial(_catalog_file, tmp_dir)
+    yield Benchmark(
+        "catalog/build_catalog",
+        lambda: ben_catalog.build_catalog(file_path, _catalog_snapshots(tmp_dir)),
+        repeat=1,
+        setup=setup,
+    )
+    queries = {
+        "serbia_summer": {"countries": ["Serbia"], "seasons": ["Summer"]},
+        "portugal_summer_agro_forestry_not_snowy": {
+            "countries": ["Portugal"],
+            "seasons": ["Summer"],
+            "labels": ["Agro-forestry areas"],
+            "exclude_flags": ben_metadata.PatchFlag.seasonal_snow,
+        },
+        "july_2017": {"start": "2017-07-01", "end": "2017-08-01"},
+        "recommended": {"exclude_flags": ben_metadata.UNRECOMMENDED_FLAGS},
+    }
+    for name, query in queries.items():
+        yield Benchmark(
+            f"catalog/query/{name}",
+            lambda query=query: ben_catalog.MetadataCatalog(file_path).query(**query),
+            setup=setup,
+        )
+
+
+def validation_benchmarks(tmp_dir: Path) -> Iterator[Benchmark]:
+    """Directory validation on synthetic partial archives."""
+    for source, validate in (
+        ("S1", ben_base.validate_ben_s1_root_directory),
+        ("S2", ben_base.validate_ben_s2_root_directory),
+    ):
+        root_dir = tmp_dir / f"BigEarthNet-{source}"
+        yield Benchmark(
+            f"validation/{validate.__name__}",
+            _quiet(lambda validate=validate, root_dir=root_dir: validate(root_dir)),
+            TREE_PATCHES,
+            setup=functools.partial(_synthetic_archive, tmp_dir, source),
+        )
+
+
+def _environment() -> Dict[str, str]:
+    return {
+        "bigearthnet_common": bigearthnet_common.__version__,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+    }
+
+
+def _print_results(
+    results: List[Result],
+    baseline: Optional[Dict[str, float]] = None,
+    threshold: float = REGRESSION_THRESHOLD,
+) -> int:
+    """Print the `results` and return the number of regressions compared to the `baseline`."""
+    regressions = 0
+    print(f"{'benchmark':<58} {'time':>12} {'items/s':>12} {'vs. baseline':>13}")
+    for result in results:
+        throughput = f"{result.items_per_second:.0f}" if result.items > 1 else "-"
+        line = f"{result.name:<58} {result.seconds * 1e3:>10.3f}ms {throughput:>12}"
+        if baseline is not None and result.name in baseline:
+            change = result.seconds / baseline[result.name] - 1
+            line += f" {change:>+12.0%}"
+            if change > threshold:
+                regressions += 1
+                line += " REGRESSION"
+        print(line)
+    return regressions
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--output", type=Path, help="Write the results to this JSON file."
+    )
+    parser.add_argument(
+        "--baseline", type=Path, help="Compare the results to this results file."
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help="Relative slowdown compared to the baseline that counts as a regression.",
+    )
+    parser.add_argument(
+        "--filter", default="", help="Only run the benchmarks matching this regex."
+    )
+    args = parser.parse_args(argv)
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="ben_benchmark_") as tmp:
+        tmp_dir = Path(tmp)
+        for benchmark in (
+            *resource_benchmarks(),
+            *lookup_benchmarks(),
+            *set_benchmarks(tmp_dir),
+            *json_benchmarks(tmp_dir),
+            *snapshot_benchmarks(tmp_dir),
+            *catalog_benchmarks(tmp_dir),
+            *validation_benchmarks(tmp_dir),
+        ):
+            # the benchmarks only prepare their inputs in `setup`, so skipped
+            # benchmarks do not cost anything
+            if re.search(args.filter, benchmark.name):
+                results.append(run_benchmark(benchmark))
+                print(f"{benchmark.name}: {results[-1].seconds:.6f}s", file=sys.stderr)
+
+    baseline = None
+    if args.baseline is not None:
+        baseline_results = json.loads(args.baseline.read_text())["results"]
+        baseline = {r["name"]: r["seconds"] for r in baseline_results}
+    regressions = _print_results(results, baseline, args.threshold)
+    if args.output is not None:
+        args.output.write_text(
+            json.dumps(
+                {
+                    "environment": _environment(),
+                    "results": [
+                        {
+                            "name": r.name,
+                            "seconds": r.seconds,
+                            "items": r.items,
+                            "items_per_second": r.items_per_second,
+                        }
+                        for r in results
+                    ],
+                },
+                indent=2,
+            )
+        )
+    return 1 if regressions > 0 else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
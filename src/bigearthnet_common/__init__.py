@@ -1,6 +1,14 @@
-import importlib.metadata
 import warnings
 
+from bigearthnet_common._cache import ResourceStats, set_stats_callback, stats
+
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="fastcore")
 
-__version__ = importlib.metadata.version("bigearthnet_common")
+
+def __getattr__(name: str):
+    # `importlib.metadata` is slow to import, so the version is only looked up on access
+    if name == "__version__":
+        import importlib.metadata
+
+        return importlib.metadata.version("bigearthnet_common")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,169 @@
+"""
+Cached resources:
+
+A thread-safe replacement for `functools.lru_cache` on functions without arguments
+that load a resource.
+Unlike `functools.lru_cache`, concurrent first calls do not load the resource multiple times.
+A single caller runs the loader, while all other callers wait for its result (single-flight).
+
+Every cached resource records how often it was loaded and requested, how long the last
+load took and how large the loaded resource is. `stats` returns these statistics
+and `set_stats_callback` registers a function that receives them after every load.
+"""
+
+import functools
+import sys
+import threading
+import time
+import warnings
+from typing import Callable, Dict, NamedTuple, Optional, Sized, TypeVar
+
+_T = TypeVar("_T")
+
+_MISSING = object()
+
+
+class ResourceStats(NamedTuple):
+    """
+    Statistics of a cached resource.
+    `hits` counts the calls that were answered from the cache and `misses`
+    the calls that loaded the resource.
+    The counters are not synchronized, so `hits` can miss a few concurrent calls.
+    `load_seconds`, `rows` and `nbytes` describe the last load and are `None` if the
+    resource was never loaded or if the size is unknown.
+    `nbytes` is the approximate number of bytes that the resource occupies, see `estimate_nbytes`.
+    """
+
+    name: str
+    hits: int
+    misses: int
+    load_seconds: Optional[float]
+    rows: Optional[int]
+    nbytes: Optional[int]
+
+
+class _ResourceCounters:
+    __slots__ = ("name", "hits", "misses", "load_seconds", "rows", "nbytes")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self.load_seconds: Optional[float] = None
+        self.rows: Optional[int] = None
+        self.nbytes: Optional[int] = None
+
+    def snapshot(self) -> ResourceStats:
+        return ResourceStats(
+            self.name,
+            self.hits,
+            self.misses,
+            self.load_seconds,
+            self.rows,
+            self.nbytes,
+        )
+
+
+_RESOURCE_COUNTERS: Dict[str, _ResourceCounters] = {}
+_stats_callback: Optional[Callable[[ResourceStats], None]] = None
+
+
+def stats() -> Dict[str, ResourceStats]:
+    """
+    Return the `ResourceStats` of all cached resources, indexed by the resource name,
+    which is the qualified name of the loader, such as `bigearthnet_common.base.get_metadata_table`.
+    """
+    return {name: c.snapshot() for name, c in _RESOURCE_COUNTERS.items()}
+
+
+def set_stats_callback(callback: Optional[Callable[[ResourceStats], None]]) -> None:
+    """
+    Call `callback` with the `ResourceStats` of a resource after every load of the resource,
+    for example to send them to a monitoring system.
+    The callback is called in the loading thread. Exceptions of the callback are turned into
+    warnings, so that they do not break the loading.
+    Set `callback` to `None` to remove the callback.
+    """
+    global _stats_callback
+    _stats_callback = callback
+
+
+def _notify(resource_stats: ResourceStats) -> None:
+    callback = _stats_callback
+    if callback is None:
+        return
+    try:
+        callback(resource_stats)
+    except Exception as e:
+        warnings.warn(f"The stats callback raised an exception: {e!r}", RuntimeWarning)
+
+
+def estimate_nbytes(resource: object) -> Optional[int]:
+    """
+    Return the approximate number of bytes of the `resource`:
+    The `nbytes` attribute of arrays, tables and views, which report the bytes they own,
+    or the size of builtin sets, lists, tuples and dicts including their items.
+    Returns `None` for all other resources.
+    """
+    nbytes = getattr(resource, "nbytes", None)
+    if nbytes is not None:
+        return nbytes
+    if isinstance(resource, dict):
+        return (
+            sys.getsizeof(resource)
+            + sum(map(sys.getsizeof, resource.keys()))
+            + sum(map(sys.getsizeof, resource.values()))
+        )
+    if isinstance(resource, (set, frozenset, list, tuple)):
+        return sys.getsizeof(resource) + sum(map(sys.getsizeof, resource))
+    return None
+
+
+def cached_resource(loader: Callable[[], _T]) -> Callable[[], _T]:
+    """
+    Cache the result of the `loader` function, which takes no arguments.
+    Concurrent calls on a cold cache wait for a single call of the `loader`.
+    If the `loader` raises an exception, nothing is cached and the next caller retries.
+
+    Like with `functools.lru_cache`, the cache can be cleared with `cache_clear`.
+    The statistics of the resource are reported by `stats` under the module and qualified
+    name of the `loader`, so that loaders with the same name in different modules do not
+    share their statistics.
+    """
+    lock = threading.Lock()
+    value = _MISSING
+    name = f"{loader.__module__}.{loader.__qualname__}"
+    counters = _RESOURCE_COUNTERS.setdefault(name, _ResourceCounters(name))
+
+    def _load():
+        start = time.perf_counter()
+        result = loader()
+        counters.load_seconds = time.perf_counter() - start
+        counters.rows = len(result) if isinstance(result, Sized) else None
+        counters.nbytes = estimate_nbytes(result)
+        counters.misses += 1
+        return result
+
+    @functools.wraps(loader)
+    def wrapper():
+        nonlocal value
+        # the result is read without the lock once it is cached
+        result = value
+        if result is _MISSING:
+            with lock:
+                if value is not _MISSING:
+                    counters.hits += 1
+                    return value
+                value = result = _load()
+            _notify(counters.snapshot())
+            return result
+        counters.hits += 1
+        return result
+
+    def cache_clear() -> None:
+        nonlocal value
+        with lock:
+            value = _MISSING
+
+    wrapper.cache_clear = cache_clear
+    return wrapper
@@ -0,0 +1,55 @@
+"""
+Lazy argument validation:
+
+A drop-in replacement for `pydantic.validate_arguments` that defers importing `pydantic`
+and building the validation model until the decorated function is called for the first time.
+This keeps the import of the core modules lean.
+
+Annotations that refer to `pydantic` types have to be given as strings, such as `"FilePath"`,
+and are resolved when the validation model is built.
+"""
+
+import functools
+from typing import Callable, TypeVar
+
+_F = TypeVar("_F", bound=Callable)
+
+_PYDANTIC_TYPES = ("DirectoryPath", "FilePath")
+
+
+def _resolve_annotations(func: Callable) -> None:
+    import pydantic
+
+    namespace = {
+        **func.__globals__,
+        **{name: getattr(pydantic, name) for name in _PYDANTIC_TYPES},
+    }
+    # update in-place, as `functools.wraps` shares the dictionary with the wrapper
+    func.__annotations__.update(
+        {
+            name: eval(annotation, namespace)
+            if isinstance(annotation, str)
+            else annotation
+            for name, annotation in func.__annotations__.items()
+        }
+    )
+
+
+def validate_arguments(func: _F) -> _F:
+    """
+    Validate the arguments of `func` with `pydantic.validate_arguments`,
+    but only import `pydantic` and build the validation model on the first call.
+    """
+    validated = None
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        nonlocal validated
+        if validated is None:
+            from pydantic import validate_arguments
+
+            _resolve_annotations(func)
+            validated = validate_arguments(func)
+        return validated(*args, **kwargs)
+
+    return wrapper
@@ -5,30 +5,57 @@ A collection of common functions that are frequently used when working with BigE
 """
 
 import bz2
+import collections
+import concurrent.futures
+import contextlib
+import contextvars
 import csv
 import functools
+import hashlib
+import itertools
 import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
 import warnings
-from datetime import datetime
+from datetime import datetime, timezone
 from enum import Enum
 from importlib import resources
 from pathlib import Path
-from typing import Dict, Iterable, List, Literal, Optional, Sequence, Set, Union
+from typing import (
+    TYPE_CHECKING,
+    AbstractSet,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Literal,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Set,
+    Sized,
+    Tuple,
+    Union,
+)
 
 import appdirs
-import dateutil
-import fastcore.all as fc
-import rich
-import typer
-from fastcore.basics import compose
-from fastcore.dispatch import typedispatch
-from pydantic import DirectoryPath, FilePath, validate_arguments
-
-# from importlib_resources import files
-from rich.table import Table
+import numpy as np
 
 import bigearthnet_common
 import bigearthnet_common.constants as ben_constants
+import bigearthnet_common.metadata as ben_metadata
+from bigearthnet_common._cache import cached_resource, estimate_nbytes
+from bigearthnet_common._validation import validate_arguments
+
+if TYPE_CHECKING:
+    from pydantic import DirectoryPath, FilePath
 
 
 class Resource(str, Enum):
@@ -47,7 +74,14 @@ class Resource(str, Enum):
 
 
 USER_DIR = Path(appdirs.user_data_dir("bigearthnet"))
-USER_DIR.mkdir(exist_ok=True, parents=True)
+METADATA_CACHE_DIR = USER_DIR / "metadata_cache"
+METADATA_MMAP_ENV_VAR = "BEN_METADATA_MMAP"
+# increase if the layout of the cached metadata table changes
+_METADATA_CACHE_FORMAT_VERSION = 4
+# temporary cache directories older than this many seconds are left over from crashed writers
+_METADATA_CACHE_TMP_MAX_AGE = 60 * 60
+# names of the cache entries, see `_get_metadata_cache_key`
+_METADATA_CACHE_ENTRY_RE = re.compile(r".+-[0-9a-f]{32}")
 PATCHES_WITH_SNOW_URL = (
     "http://bigearth.net/static/documents/patches_with_seasonal_snow.csv"
 )
@@ -56,36 +90,146 @@ PATCHES_WITH_CLOUD_AND_SHADOW_URL = (
 )
 
 BEN_JSON_DATA = Dict[str, Union[str, Dict[str, int]]]
+# attribute access on enum classes is slow, so the single-name lookups use these aliases
+_S1 = ben_constants.SentinelSource.S1
+_S2 = ben_constants.SentinelSource.S2
+# long json values that are shared by many patches
+INTERNED_JSON_KEYS = ("projection", "scene_source", "tile_source")
+# acquisition times of the json files: `2017-06-13T16:50:43` (S1) and `2017-06-17 11:33:21` (S2)
+_BEN_DATETIME_RE = re.compile(
+    r"[0-9]{4}-[0-9]{2}-[0-9]{2}[T ][0-9]{2}:[0-9]{2}:[0-9]{2}"
+)
+_BEN_DATETIME_TEMPLATE = "0000-00-00T00:00:00"
+_BEN_DATETIME_DIGIT_COLUMNS = [
+    i for i, c in enumerate(_BEN_DATETIME_TEMPLATE) if c == "0"
+]
+_BEN_DATETIME_SEPARATOR_COLUMNS = [4, 7, 13, 16]
+_BEN_DATETIME_SEPARATORS = np.array([ord(c) for c in "--::"], dtype=np.uint32)
 
 
 def parse_datetime(inp: Union[str, datetime]) -> datetime:
     """
     Parses an input into a `datetime` object.
     Will try its best to infer the correct format from a string.
+    The fixed formats of the S1 and S2 json files are parsed directly and only
+    other strings are parsed with the (slow) `dateutil` parser.
     If a `datetime` object is already provided it will be returned.
     Otherwise it will raise an error.
     """
     return _parse_datetime(inp)
 
 
-@typedispatch
-def _parse_datetime(acquisition_date: str) -> datetime:
-    return compose(dateutil.parser.parse, _parse_datetime)(acquisition_date)
+def _to_datetime64(inp: datetime) -> np.datetime64:
+    if inp.tzinfo is not None:
+        inp = inp.astimezone(timezone.utc).replace(tzinfo=None)
+    return np.datetime64(inp, "s")
+
+
+def _parse_fixed_datetimes(strings: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Parse the unicode array `strings` in the fixed json formats from the digits of their code points.
+    Returns the `datetime64[s]` times and a mask of the strings that are valid in a fixed format.
+    """
+    width = strings.dtype.itemsize // 4
+    if len(strings) == 0 or width < len(_BEN_DATETIME_TEMPLATE):
+        return np.empty(len(strings), "datetime64[s]"), np.zeros(len(strings), bool)
+    codes = strings.view(np.uint32).reshape(len(strings), width)
+    # code points below "0" wrap around, so a single comparison checks the digits
+    digits = codes[:, _BEN_DATETIME_DIGIT_COLUMNS] - np.uint32(ord("0"))
+    valid = (digits <= 9).all(axis=1)
+    valid &= (
+        codes[:, _BEN_DATETIME_SEPARATOR_COLUMNS] == _BEN_DATETIME_SEPARATORS
+    ).all(axis=1)
+    valid &= (codes[:, 10] == ord("T")) | (codes[:, 10] == ord(" "))
+    # longer strings are padded with zeros
+    valid &= (codes[:, len(_BEN_DATETIME_TEMPLATE) :] == 0).all(axis=1)
+
+    digits = digits.astype(np.int64)
+
+    def number(start: int, stop: int) -> np.ndarray:
+        return digits[:, start:stop] @ 10 ** np.arange(stop - start - 1, -1, -1)
+
+    year, month, day = number(0, 4), number(4, 6), number(6, 8)
+    hour, minute, second = number(8, 10), number(10, 12), number(12, 14)
+    valid &= (year >= 1) & (month >= 1) & (month <= 12) & (day >= 1)
+    valid &= (hour < 24) & (minute < 60) & (second < 60)
+    months = np.where(valid, (year - 1970) * 12 + month - 1, 0).astype("datetime64[M]")
+    first_day = months.astype("datetime64[D]")
+    valid &= day <= ((months + 1).astype("datetime64[D]") - first_day).astype(np.int64)
+    times = (first_day + (day - 1)).astype("datetime64[s]") + (
+        hour * 3_600 + minute * 60 + second
+    )
+    return times, valid
 
 
-@typedispatch
-def _parse_datetime(acquisition_date: datetime) -> datetime:
-    return acquisition_date
+def parse_datetimes(inputs: Iterable[Union[str, datetime]]) -> np.ndarray:
+    """
+    Parses many inputs like `parse_datetime` into a `datetime64[s]` array.
+    Strings in the fixed formats of the S1 and S2 json files are converted at once
+    with numpy, so that the acquisition times of the complete archive are parsed
+    in a fraction of a second.
+    All other inputs are parsed one by one with `parse_datetime`.
+    Timezone-aware inputs are converted to UTC.
+    """
+    values = list(inputs)
+    strings = np.array(values) if len(values) > 0 else np.empty(0, dtype="U")
+    if strings.ndim == 1 and strings.dtype.kind == "U":
+        times, parsed = _parse_fixed_datetimes(strings)
+    else:
+        times = np.empty(len(values), dtype="datetime64[s]")
+        parsed = np.zeros(len(values), dtype=bool)
+    for i in np.flatnonzero(~parsed):
+        times[i] = _to_datetime64(parse_datetime(values[i]))
+    return times
 
 
-@typedispatch
+@functools.singledispatch
 def _parse_datetime(acquisition_date: object) -> None:
     raise TypeError("Could not parse acquisition_date!")
 
 
+@_parse_datetime.register
+def _(acquisition_date: str) -> datetime:
+    if _BEN_DATETIME_RE.fullmatch(acquisition_date) is not None:
+        try:
+            return datetime.fromisoformat(acquisition_date)
+        except ValueError:
+            # out-of-range values are reported by `dateutil`
+            pass
+    import dateutil.parser
+
+    return _parse_datetime(dateutil.parser.parse(acquisition_date))
+
+
+@_parse_datetime.register
+def _(acquisition_date: datetime) -> datetime:
+    return acquisition_date
+
+
+def _load_json(
+    json_fp: Path, expected_keys: AbstractSet[str], read_only_expected: bool = True
+) -> BEN_JSON_DATA:
+    """
+    Unvalidated version of `_read_json`, used by the bulk readers.
+    """
+    try:
+        complete_data = json.loads(json_fp.read_bytes())
+    except json.JSONDecodeError:
+        raise ValueError(f"Error trying to read json from: ", json_fp)
+
+    missing_elements = expected_keys - complete_data.keys()
+    if len(missing_elements) > 0:
+        raise ValueError(f"{json_fp} is missing entries!", missing_elements)
+
+    # ensure that the original values are loaded, as some users may customize the original json files
+    if read_only_expected:
+        return {k: v for k, v in complete_data.items() if k in expected_keys}
+    return complete_data
+
+
 @validate_arguments
 def _read_json(
-    json_fp: FilePath, expected_keys: Set, read_only_expected: bool = True
+    json_fp: "FilePath", expected_keys: Set, read_only_expected: bool = True
 ) -> BEN_JSON_DATA:
     """
     Parse the json file given with the file path `json_fp`.
@@ -103,22 +247,17 @@ def _read_json(
     Returns:
         [Dict[str, str]]: A dictionary of the keys.
     """
-    try:
-        complete_data = json.loads(json_fp.read_text())
-    except json.JSONDecodeError:
-        raise ValueError(f"Error trying to read json from: ", json_fp)
+    return _load_json(json_fp, expected_keys, read_only_expected)
 
-    missing_elements = expected_keys - complete_data.keys()
-    if len(missing_elements) > 0:
-        raise ValueError(f"{json_fp} is missing entries!", missing_elements)
 
-    # ensure that the original values are loaded, as some users may customize the original json files
-    if read_only_expected:
-        return {k: v for k, v in complete_data.items() if k in expected_keys}
-    return complete_data
+def _fix_s1_coordinates(data: BEN_JSON_DATA) -> BEN_JSON_DATA:
+    # Silently fix key error in S1
+    if "lly" in data["coordinates"]:
+        data["coordinates"]["lry"] = data["coordinates"].pop("lly")
+    return data
 
 
-def read_S1_json(json_fp: FilePath) -> BEN_JSON_DATA:
+def read_S1_json(json_fp: "FilePath") -> BEN_JSON_DATA:
     """
     A helper function that *safely* reads a BigEarthNet-S1 json file.
     It will ensure that all expected entries are present and only read those
@@ -129,14 +268,10 @@ def read_S1_json(json_fp: FilePath) -> BEN_JSON_DATA:
     Note: This function will also silently fix a typo present in the `coordinates` key
     from version: S1_v1.0. A coordinates key is named `lly` and it should be `lry`.
     """
-    data = _read_json(json_fp, ben_constants.BEN_S1_V1_0_JSON_KEYS)
-    # Silently fix key error in S1
-    if "lly" in data["coordinates"]:
-        data["coordinates"]["lry"] = data["coordinates"].pop("lly")
-    return data
+    return _fix_s1_coordinates(_read_json(json_fp, ben_constants.BEN_S1_V1_0_JSON_KEYS))
 
 
-def read_S2_json(json_fp: FilePath) -> BEN_JSON_DATA:
+def read_S2_json(json_fp: "FilePath") -> BEN_JSON_DATA:
     """
     A helper function that *safely* reads a BigEarthNet-S2 json file.
     It will ensure that all expected entries are present and only read those
@@ -147,8 +282,159 @@ def read_S2_json(json_fp: FilePath) -> BEN_JSON_DATA:
     return _read_json(json_fp, ben_constants.BEN_S2_V1_0_JSON_KEYS)
 
 
+def _read_patch_jsons(
+    patch_dirs: Sequence[Path], is_sentinel1: bool
+) -> List[BEN_JSON_DATA]:
+    """
+    Read the `_labels_metadata.json` files of the `patch_dirs`.
+    Defined at the module level, so that it can be sent to worker processes.
+    """
+    expected_keys = (
+        ben_constants.BEN_S1_V1_0_JSON_KEYS
+        if is_sentinel1
+        else ben_constants.BEN_S2_V1_0_JSON_KEYS
+    )
+    records = []
+    for patch_dir in patch_dirs:
+        data = _load_json(
+            patch_dir / f"{patch_dir.name}_labels_metadata.json", expected_keys
+        )
+        records.append(_fix_s1_coordinates(data) if is_sentinel1 else data)
+    return records
+
+
+def _intern_json_strings(
+    records: List[BEN_JSON_DATA], interned: Dict[str, str]
+) -> List[BEN_JSON_DATA]:
+    """
+    Replace the values of the `INTERNED_JSON_KEYS` in the `records` with the equal
+    string object from `interned`, so that all records share a single copy of each value.
+    """
+    for data in records:
+        for key in INTERNED_JSON_KEYS:
+            if key in data:
+                data[key] = interned.setdefault(data[key], data[key])
+    return records
+
+
+def _stream_patch_jsons(
+    patch_dirs: Iterator[Path],
+    is_sentinel1: bool,
+    executor_cls: type,
+    max_workers: int,
+    chunk_size: int,
+    intern_strings: bool,
+) -> Iterator[Tuple[str, BEN_JSON_DATA]]:
+    # bound the number of chunks in flight, so that the records are streamed
+    max_pending = 2 * max_workers
+    pending = collections.deque()
+    chunks = iter(lambda: list(itertools.islice(patch_dirs, chunk_size)), [])
+    # interned in the consuming thread, as records from worker processes are unpickled copies
+    interned: Dict[str, str] = {}
+
+    def next_records() -> Iterator[Tuple[str, BEN_JSON_DATA]]:
+        names, future = pending.popleft()
+        records = future.result()
+        if intern_strings:
+            records = _intern_json_strings(records, interned)
+        return zip(names, records)
+
+    with executor_cls(max_workers) as executor:
+        try:
+            for chunk in chunks:
+                future = executor.submit(_read_patch_jsons, chunk, is_sentinel1)
+                pending.append(([p.name for p in chunk], future))
+                if len(pending) >= max_pending:
+                    yield from next_records()
+            while len(pending) > 0:
+                yield from next_records()
+        finally:
+            # do not wait for the remaining chunks if the consumer stops early
+            for _, future in pending:
+                future.cancel()
+
+
+def _read_jsons(
+    patch_paths: Union[str, Path, Iterable[Union[str, Path]]],
+    is_sentinel1: bool,
+    max_workers: Optional[int],
+    use_processes: bool,
+    chunk_size: int,
+    intern_strings: bool,
+) -> Iterator[Tuple[str, BEN_JSON_DATA]]:
+    if chunk_size < 1:
+        raise ValueError(f"chunk_size must be positive, but is {chunk_size}!")
+    if isinstance(patch_paths, (str, Path)):
+        get_patch_directories = (
+            get_s1_patch_directories if is_sentinel1 else get_s2_patch_directories
+        )
+        patch_dirs = iter(sorted(get_patch_directories(patch_paths)))
+    else:
+        patch_dirs = (Path(p) for p in patch_paths)
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+        max_workers = max_workers if use_processes else min(32, max_workers + 4)
+    executor_cls = (
+        concurrent.futures.ProcessPoolExecutor
+        if use_processes
+        else concurrent.futures.ThreadPoolExecutor
+    )
+    return _stream_patch_jsons(
+        patch_dirs, is_sentinel1, executor_cls, max_workers, chunk_size, intern_strings
+    )
+
+
+def read_S1_jsons(
+    patch_paths: Union[str, Path, Iterable[Union[str, Path]]],
+    max_workers: Optional[int] = None,
+    use_processes: bool = False,
+    chunk_size: int = 256,
+    intern_strings: bool = False,
+) -> Iterator[Tuple[str, BEN_JSON_DATA]]:
+    """
+    Read the json files of many BigEarthNet-S1 patches in parallel.
+    `patch_paths` is either the root directory of the S1 archive or an iterable
+    of patch directories.
+    Yields `(patch_name, data)` pairs in a deterministic order: The order of the given
+    patch directories or, for a root directory, the patch directories sorted by name.
+
+    The files are read in chunks of `chunk_size` patches by a pool of `max_workers`
+    threads or, if `use_processes` is set, processes.
+    The records are streamed, as only a couple of chunks are read ahead of the consumer.
+    The files are checked and fixed like with `read_S1_json`, but the paths are not validated.
+    Errors are raised when the record of the failing file is reached.
+
+    The archive only has a few dozen distinct projections and a bounded number of
+    scene/tile sources, but every record carries its own copy of these long strings.
+    If `intern_strings` is set, the values of the `INTERNED_JSON_KEYS` are shared between
+    all yielded records, which keeps the memory of records that are kept for the complete
+    archive small.
+    For integer codes and a table of the distinct values, build a
+    `snapshot.MetadataSnapshot` instead.
+    """
+    return _read_jsons(
+        patch_paths, True, max_workers, use_processes, chunk_size, intern_strings
+    )
+
+
+def read_S2_jsons(
+    patch_paths: Union[str, Path, Iterable[Union[str, Path]]],
+    max_workers: Optional[int] = None,
+    use_processes: bool = False,
+    chunk_size: int = 256,
+    intern_strings: bool = False,
+) -> Iterator[Tuple[str, BEN_JSON_DATA]]:
+    """
+    Read the json files of many BigEarthNet-S2 patches in parallel.
+    Works like `read_S1_jsons` but checks the files like `read_S2_json`.
+    """
+    return _read_jsons(
+        patch_paths, False, max_workers, use_processes, chunk_size, intern_strings
+    )
+
+
 @validate_arguments
-def get_s2_patch_directories(dir_path: DirectoryPath) -> List[Path]:
+def get_s2_patch_directories(dir_path: "DirectoryPath") -> List[Path]:
     """
     Will find all S2 patch directories in the provided `dir_path`.
     Only directories that strictly cohere to the naming convention will be returned.
@@ -161,7 +447,7 @@ def get_s2_patch_directories(dir_path: DirectoryPath) -> List[Path]:
 
 
 @validate_arguments
-def get_s1_patch_directories(dir_path: DirectoryPath) -> List[Path]:
+def get_s1_patch_directories(dir_path: "DirectoryPath") -> List[Path]:
     """
     Will find all S1 patch directories in the provided `dir_path`.
     Only directories that strictly cohere to the naming convention will be returned.
@@ -173,77 +459,260 @@ def get_s1_patch_directories(dir_path: DirectoryPath) -> List[Path]:
     ]
 
 
-@functools.lru_cache()
-def _conv_header_col_bz2_csv_resource_to_dict(
-    resource, key_column: str, value_column: str
-) -> Dict[str, str]:
+def _read_header_bz2_csv_resource(resource) -> Dict[str, List[str]]:
     """
-    Load a dictionary with the provided `key_column` and `value_column` after uncompressing
-    the `bz2` compressed `resource` csv file.
+    Uncompress and parse the `bz2` compressed `resource` csv file in a single pass
+    and return all columns, indexed by the column names of the header row.
+
+    Multiple `Resource` entries point to the same file (for example `s1_s2_mapping`,
+    `country` and `season`), so all derived columns should be taken from a single
+    call to this function to avoid repeated decompression.
     """
-    # assert False, files(bigearthnet_common) / ""
     if not resources.is_resource(bigearthnet_common, resource):
         raise ValueError(
             f"{resource} resource is not available! This means that it was forgotten to be packaged."
         )
 
     with resources.path(bigearthnet_common, resource) as resource_path:
-        with bz2.open(resource_path, mode="rt") as csv_file:
-            reader = csv.DictReader(
-                csv_file
-            )  # field-names are encoded as first csv row
-            if reader.fieldnames is None:
-                raise ValueError("Loaded empty csv file!")
-            if key_column not in reader.fieldnames:
-                raise ValueError(
-                    f"Key {key_column} is unknown! Resource provides: {reader.fieldnames}"
-                )
-            if value_column not in reader.fieldnames:
-                raise ValueError(
-                    f"Value {value_column} is unknown! Resource provides: {reader.fieldnames}"
-                )
-            return {row[key_column]: row[value_column] for row in reader}
+        # decompressing the complete file at once is considerably faster
+        # than iterating over the lines of the compressed file
+        lines = bz2.decompress(resource_path.read_bytes()).decode().splitlines()
+    reader = csv.reader(lines)
+    # field-names are encoded as first csv row
+    fieldnames = next(reader, None)
+    if fieldnames is None:
+        raise ValueError("Loaded empty csv file!")
+    # skip empty lines, as `csv.DictReader` does
+    columns = list(zip(*(row for row in reader if row)))
+    if len(columns) == 0:
+        columns = [() for _ in fieldnames]
+    return {name: list(column) for name, column in zip(fieldnames, columns)}
+
+
+def _get_csv_column(columns: Dict[str, List[str]], column: str) -> List[str]:
+    """
+    Return the `column` of the parsed csv `columns`.
+    Raises a `ValueError` if the `column` is not part of the header.
+    """
+    if column not in columns:
+        raise ValueError(
+            f"Key {column} is unknown! Resource provides: {list(columns.keys())}"
+        )
+    return columns[column]
 
 
-# FUTURE: Could merge the underlying logic together
-@functools.lru_cache()
-def _conv_header_col_bz2_csv_resource_to_set(resource, key_column: str) -> Set[str]:
+@validate_arguments
+def _conv_single_col_csv_resource_to_set(
+    resource: str,
+) -> Set[str]:
     """
-    Load a dictionary with the provided `key_column` after uncompressing
-    the `bz2` compressed `resource` csv file.
+    Given a `resource` name of an encoded CSV file *without* a header
+    line and only a single column, return the set of
+    all values.
     """
-    print(resource)
     if not resources.is_resource(bigearthnet_common, resource):
-        # if not files(bigearthnet_common) / resource:
-        raise ValueError(
-            f"{resource} resource is not available! This means that it was forgotten to be packaged."
-        )
+        raise ValueError(f"{resource} is an unknown resource!")
 
     with resources.path(bigearthnet_common, resource) as resource_path:
-        with bz2.open(resource_path, mode="rt") as csv_file:
-            reader = csv.DictReader(
-                csv_file
-            )  # field-names are encoded as first csv row
-            if reader.fieldnames is None:
-                raise ValueError("Loaded empty csv file!")
-            if key_column not in reader.fieldnames:
-                raise ValueError(
-                    f"Key {key_column} is unknown! Resource provides: {reader.fieldnames}"
+        lines = bz2.decompress(resource_path.read_bytes()).decode().splitlines()
+    return {row[0] for row in csv.reader(lines) if row}
+
+
+def _build_metadata_table() -> ben_metadata.MetadataTable:
+    """
+    Build the `MetadataTable` by decompressing and parsing all packaged resources.
+    The resources are decompressed in parallel, as `bz2` releases the GIL.
+    """
+    split_resources = {
+        ben_constants.Split.train: Resource.train_csv,
+        ben_constants.Split.validation: Resource.val_csv,
+        ben_constants.Split.test: Resource.test_csv,
+    }
+    flag_resources = {
+        ben_metadata.PatchFlag.seasonal_snow: Resource.patches_with_seasonal_snow,
+        ben_metadata.PatchFlag.cloud_and_shadow: Resource.patches_with_cloud_and_snow,
+        ben_metadata.PatchFlag.no_19_class_target: Resource.patches_with_no_19_class_targets,
+    }
+    with concurrent.futures.ThreadPoolExecutor() as pool:
+        columns = pool.submit(_read_header_bz2_csv_resource, Resource.s1_s2_mapping)
+        split_sets = {
+            split: pool.submit(_conv_single_col_csv_resource_to_set, resource)
+            for split, resource in split_resources.items()
+        }
+        flag_sets = {
+            flag: pool.submit(_conv_single_col_csv_resource_to_set, resource)
+            for flag, resource in flag_resources.items()
+        }
+        columns = columns.result()
+        return ben_metadata.build_metadata_table(
+            s1_names=_get_csv_column(columns, "s1_name"),
+            s2_names=_get_csv_column(columns, "s2_name"),
+            countries=_get_csv_column(columns, "country"),
+            seasons=_get_csv_column(columns, "season"),
+            split_s2_names={k: v.result() for k, v in split_sets.items()},
+            flag_s2_names={k: v.result() for k, v in flag_sets.items()},
+        )
+
+
+def _get_metadata_cache_key() -> str:
+    """
+    Return the key of the metadata cache entry.
+    The key depends on the package version, the cache format and the
+    checksums of all packaged resources, so any change to either
+    invalidates the previous cache entry.
+    The key starts with the package version, so that the entries of other installed
+    versions that share the cache directory can be told apart.
+    """
+    digest = hashlib.sha256()
+    digest.update(bigearthnet_common.__version__.encode())
+    digest.update(str(_METADATA_CACHE_FORMAT_VERSION).encode())
+    for resource in sorted({r.value for r in Resource}):
+        if not resources.is_resource(bigearthnet_common, resource):
+            raise ValueError(
+                f"{resource} resource is not available! This means that it was forgotten to be packaged."
+            )
+        digest.update(resource.encode())
+        digest.update(
+            hashlib.sha256(resources.read_binary(bigearthnet_common, resource)).digest()
+        )
+    return f"{bigearthnet_common.__version__}-{digest.hexdigest()[:32]}"
+
+
+def _write_metadata_cache(table: ben_metadata.MetadataTable, cache_dir: Path) -> None:
+    """
+    Atomically write the `table` to `cache_dir` and remove all stale cache entries:
+    The other entries of the same package version, entries without a version prefix that were
+    written by older package versions and the temporary directories of writers that did not
+    finish within `_METADATA_CACHE_TMP_MAX_AGE` seconds.
+    Entries of other package versions are kept, as they may still be used by other environments.
+    """
+    cache_root = cache_dir.parent
+    cache_root.mkdir(exist_ok=True, parents=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=cache_root, prefix=".tmp-"))
+    try:
+        ben_metadata.save_metadata_table(table, tmp_dir)
+        os.replace(tmp_dir, cache_dir)
+    except OSError:
+        # another process may have written the same entry in the meantime
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        if not cache_dir.exists():
+            raise
+    version_prefix = f"{bigearthnet_common.__version__}-"
+    for entry in cache_root.iterdir():
+        if entry.name.startswith(".tmp-"):
+            try:
+                stale = (
+                    time.time() - entry.stat().st_mtime > _METADATA_CACHE_TMP_MAX_AGE
                 )
-            return {row[key_column] for row in reader}
+            except FileNotFoundError:
+                continue
+        else:
+            stale = entry != cache_dir and (
+                entry.name.startswith(version_prefix)
+                or _METADATA_CACHE_ENTRY_RE.fullmatch(entry.name) is None
+            )
+        if stale:
+            shutil.rmtree(entry, ignore_errors=True)
+
+
+def clear_metadata_cache() -> None:
+    """
+    Remove the persistent metadata cache from `METADATA_CACHE_DIR`.
+    The cache is rebuilt the next time the metadata table is loaded in a new process.
+    """
+    shutil.rmtree(METADATA_CACHE_DIR, ignore_errors=True)
 
 
-def get_all_s2_patch_names() -> Set[str]:
-    resource = Resource.s1_s2_mapping
-    return _conv_header_col_bz2_csv_resource_to_set(resource, "s2_name")
+def _use_metadata_mmap() -> bool:
+    """
+    Memory-map the metadata cache unless disabled via the `METADATA_MMAP_ENV_VAR`.
+    An environment variable is used, as it is inherited by spawned worker processes.
+    """
+    return os.environ.get(METADATA_MMAP_ENV_VAR, "1").strip().lower() not in {
+        "0",
+        "false",
+        "no",
+    }
+
 
+@cached_resource
+def get_metadata_table() -> ben_metadata.MetadataTable:
+    """
+    Load the `MetadataTable` that combines all packaged patch metadata:
+    The Sentinel-1/Sentinel-2 patch names, country, season, original split and the
+    seasonal snow, cloud and shadow and no 19-class target quality flags.
 
-def get_all_s1_patch_names() -> Set[str]:
-    resource = Resource.s1_s2_mapping
-    return _conv_header_col_bz2_csv_resource_to_set(resource, "s1_name")
+    All other patch name lookup functions are views over this table.
+    The function caches the result and concurrent first calls wait for a single load.
 
+    The parsed table is persisted in `METADATA_CACHE_DIR`, so that only the
+    first process has to decompress the packaged resources.
+    The cache entry is invalidated if the package version or any of the
+    packaged resources changes.
 
-def _load_s1_s2_patch_name_mapping(from_s1_to_s2: bool = True) -> Dict[str, str]:
+    By default, the cached table is memory-mapped read-only. All processes,
+    for example the workers of a `DataLoader`, share the same physical memory
+    and attach to the table without copying it, even with spawn-based multiprocessing.
+    Set the environment variable `BEN_METADATA_MMAP=0` to load the table into
+    process-private memory instead.
+    """
+    cache_dir = METADATA_CACHE_DIR / _get_metadata_cache_key()
+    mmap_mode = "r" if _use_metadata_mmap() else None
+    if cache_dir.exists():
+        try:
+            return ben_metadata.load_metadata_table(cache_dir, mmap_mode=mmap_mode)
+        except ValueError:
+            shutil.rmtree(cache_dir, ignore_errors=True)
+
+    table = _build_metadata_table()
+    try:
+        _write_metadata_cache(table, cache_dir)
+    except OSError as e:
+        warnings.warn(f"Could not write the metadata cache: {e}", UserWarning)
+        return table
+    if mmap_mode is not None:
+        # attach to the cache to share the memory with all other processes
+        try:
+            return ben_metadata.load_metadata_table(cache_dir, mmap_mode=mmap_mode)
+        except ValueError:
+            pass
+    return table
+
+
+def _patch_name_set(
+    sentinel_source: ben_constants.SentinelSource, include: int = 0, exclude: int = 0
+) -> AbstractSet[str]:
+    return ben_metadata.PatchNameSetView(
+        get_metadata_table(), sentinel_source, include=include, exclude=exclude
+    )
+
+
+@validate_arguments
+def get_patch_names_by_flags(
+    sentinel_source: ben_constants.SentinelSource, include: int = 0, exclude: int = 0
+) -> AbstractSet[str]:
+    """
+    Return the set of all Sentinel-1/Sentinel-2 patch names that have any of the
+    `include` flags, or all patches if `include` is `0`, and none of the `exclude` flags.
+    The flags are combinations of `metadata.PatchFlag`, which covers the quality flags
+    and the membership in the original train/validation/test split.
+
+    For example, `exclude=metadata.UNRECOMMENDED_FLAGS` returns the patches that are
+    recommended for deep-learning applications and `include=PatchFlag.train` together
+    with `exclude=PatchFlag.seasonal_snow` the train patches without seasonal snow.
+    """
+    return _patch_name_set(sentinel_source, include, exclude)
+
+
+def get_all_s2_patch_names() -> AbstractSet[str]:
+    return _patch_name_set(ben_constants.SentinelSource.S2)
+
+
+def get_all_s1_patch_names() -> AbstractSet[str]:
+    return _patch_name_set(ben_constants.SentinelSource.S1)
+
+
+def _load_s1_s2_patch_name_mapping(from_s1_to_s2: bool = True) -> Mapping[str, str]:
     """
     Load a dictionary which maps the S1 patch name to the S2 patch name (if `from_s1_to_s2`) or
     the S2 patch name to the S1 patch name.
@@ -255,31 +724,63 @@ def _load_s1_s2_patch_name_mapping(from_s1_to_s2: bool = True) -> Dict[str, str]
     >>> raw_gdf = raw_gdf.rename({"name": "s1_name", "corresponding_s2_patch": "s2_name"}, axis=1)
     >>> raw_gdf.to_csv("s1_s2_mapping.csv.bz2", columns=["s1_name", "s2_name"], index=False)
     """
-    resource = Resource.s1_s2_mapping
-    key, value = ("s1_name", "s2_name") if from_s1_to_s2 else ("s2_name", "s1_name")
-    return _conv_header_col_bz2_csv_resource_to_dict(resource, key, value)
+    if from_s1_to_s2:
+        key_source = ben_constants.SentinelSource.S1
+        value_column = ben_metadata.MetadataColumn.s2_name
+    else:
+        key_source = ben_constants.SentinelSource.S2
+        value_column = ben_metadata.MetadataColumn.s1_name
+    return ben_metadata.PatchNameMappingView(
+        get_metadata_table(), key_source, value_column
+    )
 
 
-def get_complete_s1_to_s2_patch_name_mapping() -> Dict[str, str]:
+def get_complete_s1_to_s2_patch_name_mapping() -> Mapping[str, str]:
     """
     Load entire Sentinel-1 to Sentinel-2 BigEarthNet patch name mapping.
 
     Returns:
-        Dict[str, str]: Sentinel-1 patch name keys with corresponding Sentinel-2 patch name as value
+        Mapping[str, str]: Sentinel-1 patch name keys with corresponding Sentinel-2 patch name as value
     """
     return _load_s1_s2_patch_name_mapping(from_s1_to_s2=True)
 
 
-def get_complete_s2_to_s1_patch_name_mapping() -> Dict[str, str]:
+def get_complete_s2_to_s1_patch_name_mapping() -> Mapping[str, str]:
     """
     Load entire Sentinel-2 to Sentinel-1 BigEarthNet patch name mapping.
 
     Returns:
-        Dict[str, str]: Sentinel-2 patch name keys with corresponding Sentinel-1 patch name as value
+        Mapping[str, str]: Sentinel-2 patch name keys with corresponding Sentinel-1 patch name as value
     """
     return _load_s1_s2_patch_name_mapping(from_s1_to_s2=False)
 
 
+def _get_patch_id(
+    patch_name: str, sentinel_source: Optional[ben_constants.SentinelSource] = None
+) -> int:
+    """
+    Return the ID of `patch_name` from the `MetadataTable`.
+    Raises a `KeyError` if the patch name is unknown.
+    """
+    id = get_metadata_table().get_id(patch_name, sentinel_source)
+    if id < 0:
+        raise KeyError(patch_name)
+    return id
+
+
+def _get_patch_ids(patch_names: Iterable[str]) -> np.ndarray:
+    """
+    Vectorized version of `_get_patch_id` for S1 and/or S2 patch names.
+    Raises a `KeyError` with the first unknown patch name.
+    """
+    names = ben_metadata._as_bytes_array(patch_names)
+    ids = get_metadata_table().get_ids(names)
+    unknown = ids < 0
+    if unknown.any():
+        raise KeyError(names[np.argmax(unknown)].decode())
+    return ids
+
+
 def s1_to_s2_patch_name(s1_patch_name: str) -> str:
     """
     Convert BigEarthNet Sentinel-1 patch name to Sentinel-2 patch name.
@@ -292,7 +793,11 @@ def s1_to_s2_patch_name(s1_patch_name: str) -> str:
     Returns:
         str: Corresponding Sentinel-2 patch name
     """
-    return get_complete_s1_to_s2_patch_name_mapping()[s1_patch_name]
+    table = get_metadata_table()
+    id = table.get_id(s1_patch_name, _S1)
+    if id < 0:
+        raise KeyError(s1_patch_name)
+    return table.get_name(_S2, id)
 
 
 def s2_to_s1_patch_name(s2_patch_name: str) -> str:
@@ -307,10 +812,16 @@ def s2_to_s1_patch_name(s2_patch_name: str) -> str:
     Returns:
         str: Corresponding Sentinel-1 patch name
     """
-    return get_complete_s2_to_s1_patch_name_mapping()[s2_patch_name]
+    table = get_metadata_table()
+    id = table.get_id(s2_patch_name, _S2)
+    if id < 0:
+        raise KeyError(s2_patch_name)
+    return table.get_name(_S1, id)
 
 
-def get_patches_to_country_mapping(use_s2_patch_names: bool = True) -> Dict[str, str]:
+def get_patches_to_country_mapping(
+    use_s2_patch_names: bool = True,
+) -> Mapping[str, str]:
     """
     Return a dictionary that maps a patch name to a country.
     If `use_s2_patch_names` is set, use the BigEarthNet Sentinel-2 patch names.
@@ -323,9 +834,14 @@ def get_patches_to_country_mapping(use_s2_patch_names: bool = True) -> Dict[str,
     >>> extended_gdf = raw_gdf.rename({"name": "s1_name", "corresponding_s2_patch": "s2_name"}, axis=1)
     >>> extended_gdf.to_csv("country.csv.bz2", columns=["s1_name", "s2_name", "country"], index=False)
     """
-    resource = Resource.country
-    key = "s2_name" if use_s2_patch_names else "s1_name"
-    return _conv_header_col_bz2_csv_resource_to_dict(resource, key, "country")
+    key_source = (
+        ben_constants.SentinelSource.S2
+        if use_s2_patch_names
+        else ben_constants.SentinelSource.S1
+    )
+    return ben_metadata.PatchNameMappingView(
+        get_metadata_table(), key_source, ben_metadata.MetadataColumn.country
+    )
 
 
 @validate_arguments
@@ -346,12 +862,45 @@ def get_country_from_patch_name(patch_name: str) -> str:
 
     This works for S1 and S2 patch names!
     """
-    if is_s2_patch(patch_name):
-        return get_patches_to_country_mapping(use_s2_patch_names=True)[patch_name]
-    return get_patches_to_country_mapping(use_s2_patch_names=False)[patch_name]
+    id = _get_patch_id(patch_name)
+    return get_metadata_table().get_value(ben_metadata.MetadataColumn.country, id)
+
+
+def get_countries_from_patch_names(patch_names: Iterable[str]) -> np.ndarray:
+    """
+    Vectorized version of `get_country_from_patch_name` for S1 and/or S2 patch names.
+    Returns a `uint8` array of country codes, which index into `metadata.COUNTRY_NAMES`.
 
+    Raises a `KeyError` if any patch name is unknown.
+    """
+    return get_metadata_table().country[_get_patch_ids(patch_names)]
+
+
+def get_patch_metadata(patch_name: str) -> ben_metadata.PatchMetadata:
+    """
+    Return the `PatchMetadata` record of the S1 or S2 patch `patch_name` with the
+    S1 and S2 name, the original split, country, season and all quality flags.
+    All values are resolved through a single lookup.
 
-def get_patches_to_season_mapping(use_s2_patch_names: bool = True) -> Dict[str, str]:
+    Raises a `KeyError` if the patch name is unknown.
+    """
+    return get_metadata_table().get_record(_get_patch_id(patch_name))
+
+
+def get_patches_metadata(patch_names: Iterable[str]) -> np.ndarray:
+    """
+    Vectorized version of `get_patch_metadata` for S1 and/or S2 patch names.
+    Returns a structured array with the dtype `metadata.patch_metadata_dtype`,
+    where the split, country and season are stored as codes.
+
+    Raises a `KeyError` if any patch name is unknown.
+    """
+    return get_metadata_table().get_records(_get_patch_ids(patch_names))
+
+
+def get_patches_to_season_mapping(
+    use_s2_patch_names: bool = True,
+) -> Mapping[str, str]:
     """
     Return a dictionary that maps a patch name to the season of the acquisition date.
     If `use_s2_patch_names` is set, use the BigEarthNet Sentinel-2 patch names.
@@ -364,9 +913,14 @@ def get_patches_to_season_mapping(use_s2_patch_names: bool = True) -> Dict[str,
     >>> extended_gdf = raw_gdf.rename({"name": "s1_name", "corresponding_s2_patch": "s2_name"}, axis=1)
     >>> extended_gdf.to_csv("season.csv.bz2", columns=["s1_name", "s2_name", "season"], index=False)
     """
-    resource = Resource.season
-    key = "s2_name" if use_s2_patch_names else "s1_name"
-    return _conv_header_col_bz2_csv_resource_to_dict(resource, key, "season")
+    key_source = (
+        ben_constants.SentinelSource.S2
+        if use_s2_patch_names
+        else ben_constants.SentinelSource.S1
+    )
+    return ben_metadata.PatchNameMappingView(
+        get_metadata_table(), key_source, ben_metadata.MetadataColumn.season
+    )
 
 
 def get_season_from_patch_name(patch_name: str) -> str:
@@ -375,54 +929,90 @@ def get_season_from_patch_name(patch_name: str) -> str:
 
     This works for S1 and S2 patch names!
     """
-    if is_s2_patch(patch_name):
-        return get_patches_to_season_mapping(use_s2_patch_names=True)[patch_name]
-    return get_patches_to_season_mapping(use_s2_patch_names=False)[patch_name]
+    id = _get_patch_id(patch_name)
+    return get_metadata_table().get_value(ben_metadata.MetadataColumn.season, id)
 
 
-@validate_arguments
-def _conv_single_col_csv_resource_to_set(
-    resource: str,
-) -> Set[str]:
+def get_seasons_from_patch_names(patch_names: Iterable[str]) -> np.ndarray:
     """
-    Given a `resource` name of an encoded CSV file *without* a header
-    line and only a single column, return the set of
-    all values.
+    Vectorized version of `get_season_from_patch_name` for S1 and/or S2 patch names.
+    Returns a `uint8` array of season codes, which index into `metadata.SEASON_NAMES`.
+
+    Raises a `KeyError` if any patch name is unknown.
     """
-    if not resources.is_resource(bigearthnet_common, resource):
-        raise ValueError(f"{resource} is an unknown resource!")
+    return get_metadata_table().season[_get_patch_ids(patch_names)]
+
+
+def match_patch_flags(
+    patch_names: Iterable[str], include: int = 0, exclude: int = 0
+) -> np.ndarray:
+    """
+    Return a boolean array that is `True` for each S1 or S2 patch name that has any of the
+    `include` flags, or any flags if `include` is `0`, and none of the `exclude` flags.
+    Unknown patch names never match.
+    See `get_patch_names_by_flags` for examples of the flags.
+    """
+    include, exclude = int(include), int(exclude)
+    table = get_metadata_table()
+    ids = table.get_ids(patch_names)
+    flags = table.flags[ids]
+    matches = (ids >= 0) & ((flags & exclude) == 0)
+    if include:
+        matches &= (flags & include) != 0
+    return matches
+
+
+def _has_patch_flag(patch_name: str, flag: ben_metadata.PatchFlag) -> bool:
+    """
+    Check whether `patch_name` is a known S1 or S2 patch with the given `flag`.
+    """
+    table = get_metadata_table()
+    id = table.get_id(patch_name)
+    # combining `PatchFlag` members with NumPy scalars is slow, so compare plain ints
+    return id >= 0 and bool(int(table.flags[id]) & flag)
 
-    with resources.path(bigearthnet_common, resource) as resource_path:
-        with bz2.open(resource_path, mode="rt") as csv_file:
-            col_name = "Column"
-            reader = csv.DictReader(csv_file, fieldnames=[col_name])
-            return {row[col_name] for row in reader}
 
+def _have_patch_flag(
+    patch_names: Iterable[str], flag: ben_metadata.PatchFlag
+) -> np.ndarray:
+    """
+    Vectorized version of `_has_patch_flag`, where unknown patch names never have the `flag`.
+    """
+    table = get_metadata_table()
+    ids = table.get_ids(patch_names)
+    return (ids >= 0) & ((table.flags[ids] & flag) != 0)
 
-@functools.lru_cache()
-def get_s2_patches_with_seasonal_snow() -> Set[str]:
+
+@cached_resource
+def get_s2_patches_with_seasonal_snow() -> AbstractSet[str]:
     """List all patches with seasonal snow from **original** BigEarthNet-S2 dataset."""
-    return _conv_single_col_csv_resource_to_set(Resource.patches_with_seasonal_snow)
+    return _patch_name_set(
+        ben_constants.SentinelSource.S2, ben_metadata.PatchFlag.seasonal_snow
+    )
 
 
-@functools.lru_cache()
-def get_s2_patches_with_cloud_and_shadow() -> Set[str]:
+@cached_resource
+def get_s2_patches_with_cloud_and_shadow() -> AbstractSet[str]:
     """List all patches with cloud and shadow from **original** BigEarthNet-S2 dataset."""
-    return _conv_single_col_csv_resource_to_set(Resource.patches_with_cloud_and_snow)
+    return _patch_name_set(
+        ben_constants.SentinelSource.S2, ben_metadata.PatchFlag.cloud_and_shadow
+    )
 
 
-@functools.lru_cache()
-def get_s1_patches_with_seasonal_snow() -> Set[str]:
+@cached_resource
+def get_s1_patches_with_seasonal_snow() -> AbstractSet[str]:
     """List all patches with seasonal snow from **original** BigEarthNet-S1 dataset."""
-    _s2_patches_with_snow = get_s2_patches_with_seasonal_snow()
-    return {s2_to_s1_patch_name(s2_patch) for s2_patch in _s2_patches_with_snow}
+    return _patch_name_set(
+        ben_constants.SentinelSource.S1, ben_metadata.PatchFlag.seasonal_snow
+    )
 
 
-@functools.lru_cache()
-def get_s1_patches_with_cloud_and_shadow() -> Set[str]:
+@cached_resource
+def get_s1_patches_with_cloud_and_shadow() -> AbstractSet[str]:
     """List all patches with cloud and shadow from **original** BigEarthNet-S1 dataset."""
-    _s2_patches_with_clouds = get_s2_patches_with_cloud_and_shadow()
-    return {s2_to_s1_patch_name(s2_patch) for s2_patch in _s2_patches_with_clouds}
+    return _patch_name_set(
+        ben_constants.SentinelSource.S1, ben_metadata.PatchFlag.cloud_and_shadow
+    )
 
 
 @validate_arguments
@@ -433,10 +1023,7 @@ def is_snowy_patch(patch_name: str):
 
     This works for S1 and S2 patch names!
     """
-    return (
-        patch_name in get_s2_patches_with_seasonal_snow()
-        or patch_name in get_s1_patches_with_seasonal_snow()
-    )
+    return _has_patch_flag(patch_name, ben_metadata.PatchFlag.seasonal_snow)
 
 
 @validate_arguments
@@ -447,14 +1034,27 @@ def is_cloudy_shadowy_patch(patch_name: str):
 
     This works for S1 and S2 patch names!
     """
-    return (
-        patch_name in get_s2_patches_with_cloud_and_shadow()
-        or patch_name in get_s1_patches_with_cloud_and_shadow()
-    )
+    return _has_patch_flag(patch_name, ben_metadata.PatchFlag.cloud_and_shadow)
+
+
+def are_snowy_patches(patch_names: Iterable[str]) -> np.ndarray:
+    """
+    Vectorized version of `is_snowy_patch` for S1 and/or S2 patch names.
+    Returns a boolean array.
+    """
+    return _have_patch_flag(patch_names, ben_metadata.PatchFlag.seasonal_snow)
+
+
+def are_cloudy_shadowy_patches(patch_names: Iterable[str]) -> np.ndarray:
+    """
+    Vectorized version of `is_cloudy_shadowy_patch` for S1 and/or S2 patch names.
+    Returns a boolean array.
+    """
+    return _have_patch_flag(patch_names, ben_metadata.PatchFlag.cloud_and_shadow)
 
 
-@functools.lru_cache()
-def get_s2_patches_with_no_19_class_target() -> Set[str]:
+@cached_resource
+def get_s2_patches_with_no_19_class_target() -> AbstractSet[str]:
     """
     List all patches from the BigEarthNet-S2 dataset that
     have _no_ defined classes with the 19-class nomenclature.
@@ -468,13 +1068,13 @@ def get_s2_patches_with_no_19_class_target() -> Set[str]:
     >>> no_19_label_targets = raw_gdf[raw_gdf["new_labels"].isna()]
     >>> no_19_label_targets.to_csv("patches_with_no_19_class_targets.csv.bz2", columns=["name"], index=False, header=False)
     """
-    return _conv_single_col_csv_resource_to_set(
-        Resource.patches_with_no_19_class_targets
+    return _patch_name_set(
+        ben_constants.SentinelSource.S2, ben_metadata.PatchFlag.no_19_class_target
     )
 
 
-@functools.lru_cache()
-def get_s1_patches_with_no_19_class_target() -> Set[str]:
+@cached_resource
+def get_s1_patches_with_no_19_class_target() -> AbstractSet[str]:
     """
     List all patches from the BigEarthNet-S1 dataset that
     have _no_ defined classes with the 19-class nomenclature.
@@ -484,10 +1084,9 @@ def get_s1_patches_with_no_19_class_target() -> Set[str]:
     The patch names are converted from `get_s2patches_with_no_19_class_targets`
     for compactness.
     """
-    s2_patches_no_19_classes = _conv_single_col_csv_resource_to_set(
-        Resource.patches_with_no_19_class_targets
+    return _patch_name_set(
+        ben_constants.SentinelSource.S1, ben_metadata.PatchFlag.no_19_class_target
     )
-    return {s2_to_s1_patch_name(s2_patch) for s2_patch in s2_patches_no_19_classes}
 
 
 @validate_arguments
@@ -498,64 +1097,106 @@ def has_19_class_target(patch_name: str) -> bool:
 
     This works for S1 and S2 patch names!
     """
-    return not (
-        patch_name in get_s1_patches_with_no_19_class_target()
-        or patch_name in get_s2_patches_with_no_19_class_target()
-    )
+    return not _has_patch_flag(patch_name, ben_metadata.PatchFlag.no_19_class_target)
+
+
+def have_19_class_targets(patch_names: Iterable[str]) -> np.ndarray:
+    """
+    Vectorized version of `has_19_class_target` for S1 and/or S2 patch names.
+    Returns a boolean array.
+    """
+    return ~_have_patch_flag(patch_names, ben_metadata.PatchFlag.no_19_class_target)
 
 
 # FUTURE: Remove this bz2 file and repackage it inside of the
 # metadata collection file
 # "https://git.tu-berlin.de/rsim/BigEarthNet-S2_19-classes_models/-/raw/master/splits/train.csv",
-@functools.lru_cache()
-def get_s2_patches_from_original_train_split() -> Set[str]:
+@cached_resource
+def get_s2_patches_from_original_train_split() -> AbstractSet[str]:
     """
     List all Sentinel-2 train patches from the original train/validation/test split.
     """
-    return _conv_single_col_csv_resource_to_set(Resource.train_csv)
+    return _patch_name_set(
+        ben_constants.SentinelSource.S2, ben_metadata.PatchFlag.train
+    )
 
 
-@functools.lru_cache()
-def get_s1_patches_from_original_train_split() -> Set[str]:
+@cached_resource
+def get_s1_patches_from_original_train_split() -> AbstractSet[str]:
     """
     List all Sentinel-1 train patches from the original train/validation/test split.
     """
-    s2_train_patches = get_s2_patches_from_original_train_split()
-    return {s2_to_s1_patch_name(s2_patch) for s2_patch in s2_train_patches}
+    return _patch_name_set(
+        ben_constants.SentinelSource.S1, ben_metadata.PatchFlag.train
+    )
 
 
-@functools.lru_cache()
-def get_s2_patches_from_original_validation_split() -> Set[str]:
+@cached_resource
+def get_s2_patches_from_original_validation_split() -> AbstractSet[str]:
     """
     List all Sentinel-2 validation patches from the original train/validation/test split.
     """
-    return _conv_single_col_csv_resource_to_set(Resource.val_csv)
+    return _patch_name_set(
+        ben_constants.SentinelSource.S2, ben_metadata.PatchFlag.validation
+    )
 
 
-@functools.lru_cache()
-def get_s1_patches_from_original_validation_split() -> Set[str]:
+@cached_resource
+def get_s1_patches_from_original_validation_split() -> AbstractSet[str]:
     """
     List all Sentinel-1 validation patches from the original train/validation/test split.
     """
-    s2_validation_patches = get_s2_patches_from_original_validation_split()
-    return {s2_to_s1_patch_name(s2_patch) for s2_patch in s2_validation_patches}
+    return _patch_name_set(
+        ben_constants.SentinelSource.S1, ben_metadata.PatchFlag.validation
+    )
 
 
-@functools.lru_cache()
-def get_s2_patches_from_original_test_split() -> Set[str]:
+@cached_resource
+def get_s2_patches_from_original_test_split() -> AbstractSet[str]:
     """
     List all Sentinel-2 test patches from the original train/validation/test split.
     """
-    return _conv_single_col_csv_resource_to_set(Resource.test_csv)
+    return _patch_name_set(ben_constants.SentinelSource.S2, ben_metadata.PatchFlag.test)
 
 
-@functools.lru_cache()
-def get_s1_patches_from_original_test_split() -> Set[str]:
+@cached_resource
+def get_s1_patches_from_original_test_split() -> AbstractSet[str]:
     """
     List all Sentinel-1 test patches from the original train/validation/test split.
     """
-    s2_test_patches = get_s2_patches_from_original_test_split()
-    return {s2_to_s1_patch_name(s2_patch) for s2_patch in s2_test_patches}
+    return _patch_name_set(ben_constants.SentinelSource.S1, ben_metadata.PatchFlag.test)
+
+
+# number of patches without split that were seen inside of `summarize_split_warnings`
+_num_patches_without_split = contextvars.ContextVar(
+    "num_patches_without_split", default=None
+)
+
+
+@contextlib.contextmanager
+def summarize_split_warnings() -> Iterator[None]:
+    """
+    Context manager that replaces the `UserWarning` that `get_original_split_from_patch_name`
+    raises for every patch that is not part of the original split with a single
+    `UserWarning` that reports the number of these patches when the context exits.
+
+    ```python
+    with summarize_split_warnings():
+        splits = [get_original_split_from_patch_name(p) for p in patch_names]
+    ```
+    """
+    token = _num_patches_without_split.set(0)
+    try:
+        yield
+    finally:
+        num_without_split = _num_patches_without_split.get()
+        _num_patches_without_split.reset(token)
+    if num_without_split > 0:
+        warnings.warn(
+            f"Provided {num_without_split} input patch names which were not part of the original split.",
+            UserWarning,
+            stacklevel=3,
+        )
 
 
 @validate_arguments
@@ -570,26 +1211,42 @@ def get_original_split_from_patch_name(patch: str) -> Optional[str]:
 
     Note: This works for Sentinel-2 and Sentinel-1 patch names!
     """
-    s1_train = get_s1_patches_from_original_train_split()
-    s2_train = get_s2_patches_from_original_train_split()
-    s1_validation = get_s1_patches_from_original_validation_split()
-    s2_validation = get_s2_patches_from_original_validation_split()
-    s1_test = get_s1_patches_from_original_test_split()
-    s2_test = get_s2_patches_from_original_test_split()
-
-    if patch in s1_train or patch in s2_train:
-        return ben_constants.Split.train
-    elif patch in s1_validation or patch in s2_validation:
-        return ben_constants.Split.validation
-    elif patch in s1_test or patch in s2_test:
-        return ben_constants.Split.test
-    warnings.warn(
-        "Provided an input patch name which was not part of the original split.",
-        UserWarning,
-    )
+    table = get_metadata_table()
+    id = table.get_id(patch)
+    split_code = table.split[id] if id >= 0 else ben_metadata.NO_SPLIT
+    if split_code != ben_metadata.NO_SPLIT:
+        return ben_constants.Split(ben_metadata.SPLIT_NAMES[split_code])
+    num_without_split = _num_patches_without_split.get()
+    if num_without_split is None:
+        warnings.warn(
+            "Provided an input patch name which was not part of the original split.",
+            UserWarning,
+        )
+    else:
+        _num_patches_without_split.set(num_without_split + 1)
     return None
 
 
+def get_original_splits_from_patch_names(patch_names: Iterable[str]) -> np.ndarray:
+    """
+    Vectorized version of `get_original_split_from_patch_name` for S1 and/or S2 patch names.
+    Returns an `int8` array of split codes, which index into `metadata.SPLIT_NAMES`.
+    Patches that are not part of the original split have the code `metadata.NO_SPLIT`.
+    Instead of a warning per patch, a single `UserWarning` reports how many
+    patches are not part of the original split.
+    """
+    table = get_metadata_table()
+    ids = table.get_ids(patch_names)
+    splits = np.where(ids >= 0, table.split[ids], ben_metadata.NO_SPLIT).astype(np.int8)
+    num_without_split = np.count_nonzero(splits == ben_metadata.NO_SPLIT)
+    if num_without_split > 0:
+        warnings.warn(
+            f"Provided {num_without_split} input patch names which were not part of the original split.",
+            UserWarning,
+        )
+    return splits
+
+
 @validate_arguments
 def _old2new_label(old_label: str) -> Optional[str]:
     """
@@ -648,11 +1305,12 @@ def ben_19_labels_to_multi_hot(
         if lex_sorted
         else ben_constants.NEW_LABELS_ORIGINAL_ORDER
     )
-    lbls_to_idx = fc.L(ordered_lbls).val2idx()
+    lbls_to_idx = {lbl: idx for idx, lbl in enumerate(ordered_lbls)}
     idxs = [lbls_to_idx[label] for label in labels]
-    multi_hot = fc.L([0] * len(ben_constants.NEW_LABELS))
-    multi_hot[idxs] = 1.0
-    return list(multi_hot)
+    multi_hot = [0] * len(ben_constants.NEW_LABELS)
+    for idx in idxs:
+        multi_hot[idx] = 1.0
+    return multi_hot
 
 
 @validate_arguments
@@ -678,18 +1336,19 @@ def ben_43_labels_to_multi_hot(
         if lex_sorted
         else ben_constants.OLD_LABELS_ORIGINAL_ORDER
     )
-    lbls_to_idx = fc.L(ordered_lbls).val2idx()
+    lbls_to_idx = {lbl: idx for idx, lbl in enumerate(ordered_lbls)}
     idxs = [lbls_to_idx[label] for label in labels]
-    multi_hot = fc.L([0] * len(ben_constants.OLD_LABELS))
-    multi_hot[idxs] = 1.0
-    return list(multi_hot)
+    multi_hot = [0] * len(ben_constants.OLD_LABELS)
+    for idx in idxs:
+        multi_hot[idx] = 1.0
+    return multi_hot
 
 
-def _are_s1_files_complete(patch_path: DirectoryPath) -> bool:
+def _are_s1_files_complete(patch_path: "DirectoryPath") -> bool:
     """
     Check if all S1-patch files exists (bands and json files) and are not empty.
     """
-    file_suffixes = ["VV", "VH", "_labels_metadata.json"]
+    file_suffixes = ["_VV.tif", "_VH.tif", "_labels_metadata.json"]
     for suffix in file_suffixes:
         file = patch_path / f"{patch_path.name}{suffix}"
         if not file.exists() or file.stat().st_size == 0:
@@ -697,12 +1356,12 @@ def _are_s1_files_complete(patch_path: DirectoryPath) -> bool:
     return True
 
 
-def _are_s2_files_complete(patch_path: DirectoryPath) -> bool:
+def _are_s2_files_complete(patch_path: "DirectoryPath") -> bool:
     """
     Check if all S2-patch files exists (bands and json files) and are not empty.
     """
     file_suffixes = [f"_B{i:02}.tif" for i in range(1, 13) if i != 10] + [
-        "_B8A",
+        "_B8A.tif",
         "_labels_metadata.json",
     ]
     for suffix in file_suffixes:
@@ -713,6 +1372,8 @@ def _are_s2_files_complete(patch_path: DirectoryPath) -> bool:
 
 
 def _print_missing_dirs(missing_dirs, show_num: int = 10) -> None:
+    import rich
+
     rich.print("There are some missing directories!")
     rich.print(
         "The following directories are missing compared to the complete BEN archive."
@@ -725,6 +1386,8 @@ def _print_missing_dirs(missing_dirs, show_num: int = 10) -> None:
 
 
 def _print_dirs_with_missing_files(dirs_with_missing_files, show_num: int = 10) -> None:
+    import rich
+
     rich.print("There are some invalid directories!")
     rich.print("The following directories are missing files.")
     show_num = min(show_num, len(dirs_with_missing_files))
@@ -736,7 +1399,7 @@ def _print_dirs_with_missing_files(dirs_with_missing_files, show_num: int = 10)
 
 @validate_arguments
 def _validate_ben_root_directory(
-    dir_path: DirectoryPath, is_sentinel2: bool
+    dir_path: "DirectoryPath", is_sentinel2: bool
 ) -> Set[str]:
     files = {f for f in dir_path.glob("*")}
     patch_names = get_all_s2_patch_names() if is_sentinel2 else get_all_s1_patch_names()
@@ -750,6 +1413,8 @@ def _validate_ben_root_directory(
         f for f in ben_dirs if not completeness_checker(f)
     }
     if missing_directories == set() and directories_with_missing_files == set():
+        import rich
+
         rich.print("Nothing seems to be missing.")
         rich.print(f"The Sentinel directory {dir_path} looks complete.")
         return set()
@@ -782,67 +1447,126 @@ def validate_ben_s1_root_directory(dir_path: Path) -> Set[str]:
     return _validate_ben_root_directory(dir_path, is_sentinel2=False)
 
 
-def validate_ben_s2_root_directory_cli():
-    app = typer.Typer(rich_markup_mode="markdown")
-    app.command()(validate_ben_s2_root_directory)
-    app()
+class ResourceLoad(NamedTuple):
+    """
+    Load time and size of a resource that was loaded by `prewarm`.
+    `rows` and `nbytes` are `None` if they are not known for the resource.
+    """
+
+    name: str
+    seconds: float
+    rows: Optional[int]
+    nbytes: Optional[int]
+
 
+def _load_metadata_table_pages() -> ben_metadata.MetadataTable:
+    """
+    Load the metadata table and read every memory page of its arrays, so that
+    the first lookups do not have to fault in the pages of the memory-mapped cache.
+    """
+    table = get_metadata_table()
+    for name in ben_metadata.TABLE_ARRAYS:
+        # reading a single byte per page loads the complete page
+        np.bitwise_or.reduce(getattr(table, name).view(np.uint8)[:: mmap.PAGESIZE])
+    return table
 
-def validate_ben_s1_root_directory_cli():
-    app = typer.Typer(rich_markup_mode="markdown")
-    app.command()(validate_ben_s1_root_directory)
-    app()
 
+def _get_metadata_index() -> ben_metadata.MetadataIndex:
+    return get_metadata_table().index
 
-@validate_arguments
-def describe_patch(patch_names: List[str]) -> Table:
-    """
-    Given a list of patch names return a table that summarizes
-    the metadata.
-    """
-    columns = [
-        "Sentinel-1 Name",
-        "Sentinel-2 Name",
-        "Original Split",
-        "Country",
-        "Season",
-        "Snowy",
-        "Cloudy / Shadowy",
-        "Valid 19-label",
-    ]
-    y = "✅"
-    n = "❌"
-    t = Table(
-        title=f"Metadata Summary",
-        caption=f"Patch(es): {patch_names}",
-        expand=True,
-        leading=1,
+
+# all resources that are views over the metadata table
+_PREWARM_VIEW_LOADERS: Dict[str, Callable[[], object]] = {
+    "metadata_index": _get_metadata_index,
+    **{
+        loader.__name__: loader
+        for loader in (
+            get_s2_patches_with_seasonal_snow,
+            get_s1_patches_with_seasonal_snow,
+            get_s2_patches_with_cloud_and_shadow,
+            get_s1_patches_with_cloud_and_shadow,
+            get_s2_patches_with_no_19_class_target,
+            get_s1_patches_with_no_19_class_target,
+            get_s2_patches_from_original_train_split,
+            get_s1_patches_from_original_train_split,
+            get_s2_patches_from_original_validation_split,
+            get_s1_patches_from_original_validation_split,
+            get_s2_patches_from_original_test_split,
+            get_s1_patches_from_original_test_split,
+        )
+    },
+}
+
+
+def _load_resource(name: str, loader: Callable[[], object]) -> ResourceLoad:
+    start = time.perf_counter()
+    resource = loader()
+    # the set views count their patches on the first call
+    rows = len(resource) if isinstance(resource, Sized) else None
+    return ResourceLoad(
+        name=name,
+        seconds=time.perf_counter() - start,
+        rows=rows,
+        nbytes=estimate_nbytes(resource),
     )
-    for c in columns:
-        t.add_column(header=c, overflow="fold", justify="center")
-
-    for patch_name in patch_names:
-        if is_s1_patch(patch_name):
-            s1_name = patch_name
-            s2_name = s1_to_s2_patch_name(s1_name)
-        elif is_s2_patch(patch_name):
-            s2_name = patch_name
-            s1_name = s2_to_s1_patch_name(s2_name)
-        else:
-            raise ValueError(f"Input: {patch_name} is not a valid S1/S2 patch name!")
-
-        split = get_original_split_from_patch_name(s2_name)
-        country = get_country_from_patch_name(s2_name)
-        season = get_season_from_patch_name(s2_name)
-        snowy = y if is_snowy_patch(s2_name) else n
-        cloudy = y if is_cloudy_shadowy_patch(s2_name) else n
-        valid_19 = y if has_19_class_target(s2_name) else n
-        t.add_row(s1_name, s2_name, split, country, season, snowy, cloudy, valid_19)
-    rich.print(t)
-    return t
-
-
-def describe_patch_cli():
-    app = typer.Typer(rich_markup_mode="markdown")
-    app.command()(describe_patch)
-    app()
+
+
+def _prewarm(max_workers: Optional[int] = None) -> Dict[str, ResourceLoad]:
+    # all other resources are views over the metadata table, so it has to be loaded first
+    loads = [_load_resource("metadata_table", _load_metadata_table_pages)]
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+        loads += pool.map(
+            _load_resource, _PREWARM_VIEW_LOADERS.keys(), _PREWARM_VIEW_LOADERS.values()
+        )
+    return {load.name: load for load in loads}
+
+
+def prewarm(
+    background: bool = False, max_workers: Optional[int] = None
+) -> Union[
+    Dict[str, ResourceLoad], "concurrent.futures.Future[Dict[str, ResourceLoad]]"
+]:
+    """
+    Load all cached metadata resources up-front, so that the first lookups,
+    for example in a request handler or in the first training step, do not stall.
+    This loads (or builds) the metadata table, reads all of its memory pages, builds
+    its index and loads all cached patch name sets with up to `max_workers` threads.
+
+    Returns the `ResourceLoad` of every resource, indexed by the resource name:
+    `metadata_table`, `metadata_index` and the names of the cached patch name set functions.
+    If `background` is set, the resources are loaded in a daemon thread and a
+    `concurrent.futures.Future` of the result is returned immediately.
+    """
+    if not background:
+        return _prewarm(max_workers)
+
+    future: concurrent.futures.Future = concurrent.futures.Future()
+
+    def _run():
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(_prewarm(max_workers))
+        except BaseException as e:
+            future.set_exception(e)
+
+    threading.Thread(target=_run, name="bigearthnet-prewarm", daemon=True).start()
+    return future
+
+
+# The CLI and presentation functions live in `bigearthnet_common.cli`
+# and are only imported on access to keep the import of this module lean.
+_CLI_FUNCTIONS = {
+    "describe_patch",
+    "describe_patch_cli",
+    "validate_ben_s1_root_directory_cli",
+    "validate_ben_s2_root_directory_cli",
+}
+
+
+def __getattr__(name: str):
+    if name in _CLI_FUNCTIONS:
+        import bigearthnet_common.cli as ben_cli
+
+        return getattr(ben_cli, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,493 @@
+"""
+BigEarthNet Metadata Catalog:
+
+A SQLite database of the patch metadata for ad-hoc subset queries.
+The catalog is built from the packaged resources and can be enriched with the labels
+and coordinates of `MetadataSnapshot`s of the archive json files.
+The filters of `MetadataCatalog.query` are compiled into SQL that uses the indexes on
+the country, season, split, tile, acquisition time and labels columns,
+so that most queries run in milliseconds without loading the metadata into memory.
+A catalog file can be opened by any number of processes at once.
+
+The `patches` table contains one row per Sentinel-1/Sentinel-2 patch pair with the columns:
+`id` (the ID of the `MetadataTable`), `s1_name`, `s2_name`, `s1_rank` and `s2_rank` (natural sort ranks),
+`country`, `season`, `split` (`NULL` if the patch is not part of the original split),
+`flags` (`metadata.PatchFlag` bits), `tile`, `s1_acquisition_time`, `s2_acquisition_time`
+(Unix timestamps parsed from the patch names, use `datetime(..., 'unixepoch')` to format them)
+and the json values `labels`
+(the `snapshot.labels_to_bits` bitmask), `ulx`, `uly`, `lrx` and `lry`, which are `NULL` without a snapshot.
+The `patch_labels` table contains a `(label, id)` row for every label of a patch,
+where `label` is the index in `snapshot.LABEL_NAMES`.
+"""
+
+import os
+import sqlite3
+import tempfile
+from datetime import datetime
+from pathlib import Path
+from typing import Iterable, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+import bigearthnet_common.base as ben_base
+import bigearthnet_common.codec as ben_codec
+import bigearthnet_common.constants as ben_constants
+import bigearthnet_common.metadata as ben_metadata
+import bigearthnet_common.snapshot as ben_snapshot
+
+# increase if the schema of the catalog changes
+CATALOG_FORMAT_VERSION = 1
+CATALOG_DIR = ben_base.USER_DIR / "catalog"
+
+_SCHEMA = """
+CREATE TABLE meta (key TEXT PRIMARY KEY, value TEXT NOT NULL);
+CREATE TABLE patches (
+    id INTEGER PRIMARY KEY,
+    s1_name TEXT NOT NULL,
+    s2_name TEXT NOT NULL,
+    s1_rank INTEGER NOT NULL,
+    s2_rank INTEGER NOT NULL,
+    country TEXT NOT NULL,
+    season TEXT NOT NULL,
+    split TEXT,
+    flags INTEGER NOT NULL,
+    tile TEXT NOT NULL,
+    s1_acquisition_time INTEGER NOT NULL,
+    s2_acquisition_time INTEGER NOT NULL,
+    labels INTEGER,
+    ulx INTEGER,
+    uly INTEGER,
+    lrx INTEGER,
+    lry INTEGER
+);
+CREATE TABLE label_names (label INTEGER PRIMARY KEY, name TEXT NOT NULL);
+CREATE TABLE patch_labels (
+    label INTEGER NOT NULL,
+    id INTEGER NOT NULL,
+    PRIMARY KEY (label, id)
+) WITHOUT ROWID;
+"""
+# the indexes are created after the rows are inserted, which is considerably faster
+_INDEXES = """
+CREATE INDEX patches_country ON patches (country);
+CREATE INDEX patches_season ON patches (season);
+CREATE INDEX patches_split ON patches (split);
+CREATE INDEX patches_tile ON patches (tile);
+CREATE INDEX patches_s1_acquisition_time ON patches (s1_acquisition_time);
+CREATE INDEX patches_s2_acquisition_time ON patches (s2_acquisition_time);
+CREATE INDEX patch_labels_id ON patch_labels (id);
+ANALYZE;
+"""
+
+
+def _acquisition_times(patch_names: np.ndarray) -> np.ndarray:
+    """Return the acquisition times of the `patch_names` as Unix timestamps."""
+    times = ben_codec.parse_patch_names(patch_names)["acquisition_time"]
+    return times.astype(np.int64)
+
+
+def _time_param(value: Union[str, datetime, np.datetime64]) -> int:
+    return int(np.datetime64(value, "s").astype(np.int64))
+
+
+def _check_values(values: Sequence[str], allowed: Sequence[str], name: str) -> None:
+    unknown = set(values) - set(allowed)
+    if unknown:
+        raise ValueError(f"Unknown {name}: {sorted(unknown)}! Allowed: {allowed}")
+
+
+def build_catalog(
+    file_path: Path, snapshots: Iterable[ben_snapshot.MetadataSnapshot] = ()
+) -> Path:
+    """
+    Atomically build a catalog file at `file_path` from the packaged metadata.
+    The labels and coordinates are added from the `snapshots`.
+    Patches of the snapshots that are not part of BigEarthNet are ignored.
+    """
+    file_path = Path(file_path)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    table = ben_base.get_metadata_table()
+    s1_names = table.get_names(ben_constants.SentinelSource.S1)
+    s2_names = table.get_names(ben_constants.SentinelSource.S2)
+    split_names = (*ben_metadata.SPLIT_NAMES, None)
+    rows = zip(
+        range(len(table)),
+        (n.decode() for n in s1_names.tolist()),
+        (n.decode() for n in s2_names.tolist()),
+        table.s1_rank.tolist(),
+        table.s2_rank.tolist(),
+        (ben_metadata.COUNTRY_NAMES[c] for c in table.country.tolist()),
+        (ben_metadata.SEASON_NAMES[s] for s in table.season.tolist()),
+        # `NO_SPLIT` is -1 and selects `None`
+        (split_names[s] for s in table.split.tolist()),
+        table.flags.tolist(),
+        (n.split(b"_")[5].decode() for n in s1_names.tolist()),
+        _acquisition_times(s1_names).tolist(),
+        _acquisition_times(s2_names).tolist(),
+    )
+
+    fd, tmp_path = tempfile.mkstemp(dir=file_path.parent, prefix=".tmp-")
+    os.close(fd)
+    try:
+        connection = sqlite3.connect(tmp_path)
+        try:
+            # the file only becomes visible after it is complete
+            connection.execute("PRAGMA journal_mode = OFF")
+            connection.execute("PRAGMA synchronous = OFF")
+            connection.executescript(_SCHEMA)
+            connection.executemany(
+                "INSERT INTO patches (id, s1_name, s2_name, s1_rank, s2_rank, country, "
+                "season, split, flags, tile, s1_acquisition_time, s2_acquisition_time) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            connection.executemany(
+                "INSERT INTO label_names VALUES (?, ?)",
+                enumerate(ben_snapshot.LABEL_NAMES),
+            )
+            has_labels = False
+            for snapshot in snapshots:
+                has_labels = True
+                _add_snapshot(connection, table, snapshot)
+            connection.executemany(
+                "INSERT INTO meta VALUES (?, ?)",
+                [
+                    ("format_version", str(CATALOG_FORMAT_VERSION)),
+                    ("metadata_key", ben_base._get_metadata_cache_key()),
+                    ("has_labels", str(int(has_labels))),
+                ],
+            )
+            connection.executescript(_INDEXES)
+            connection.commit()
+        finally:
+            connection.close()
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+    return file_path
+
+
+def _add_snapshot(
+    connection: sqlite3.Connection,
+    table: ben_metadata.MetadataTable,
+    snapshot: ben_snapshot.MetadataSnapshot,
+) -> None:
+    ids = table.get_ids(snapshot.names, snapshot.sentinel_source)
+    known = ids >= 0
+    ids = ids[known]
+    labels = snapshot.labels[known]
+    coordinates = snapshot.coordinates[known]
+    connection.executemany(
+        "UPDATE patches SET labels = ?, ulx = ?, uly = ?, lrx = ?, lry = ? WHERE id = ?",
+        (
+            (bits, *coords, id)
+            for bits, coords, id in zip(
+                labels.tolist(), coordinates.tolist(), ids.tolist()
+            )
+        ),
+    )
+    bits = np.arange(len(ben_snapshot.LABEL_NAMES), dtype=np.uint64)
+    has_label = (labels[:, np.newaxis] >> bits) & np.uint64(1) == 1
+    patch_index, label = np.nonzero(has_label)
+    connection.executemany(
+        "INSERT OR IGNORE INTO patch_labels VALUES (?, ?)",
+        zip(label.tolist(), ids[patch_index].tolist()),
+    )
+
+
+def default_catalog_path() -> Path:
+    """
+    Path of the default catalog in `CATALOG_DIR`.
+    Like the metadata cache, it changes with the package version and the packaged resources.
+    """
+    return (
+        CATALOG_DIR
+        / f"{ben_base._get_metadata_cache_key()}-v{CATALOG_FORMAT_VERSION}.sqlite"
+    )
+
+
+class MetadataCatalog:
+    """
+    Read-only connection to a catalog file.
+    Use one instance per thread. Pickled instances reopen the file,
+    so catalogs can be sent to other processes.
+    """
+
+    def __init__(self, file_path: Path):
+        self.file_path = Path(file_path).absolute()
+        if not self.file_path.exists():
+            raise ValueError(f"The catalog {self.file_path} does not exist!")
+        self._connection = sqlite3.connect(
+            f"{self.file_path.as_uri()}?mode=ro", uri=True
+        )
+        try:
+            meta = dict(self._connection.execute("SELECT key, value FROM meta"))
+        except sqlite3.DatabaseError as e:
+            self._connection.close()
+            raise ValueError(f"{self.file_path} is not a catalog!") from e
+        if meta.get("format_version") != str(CATALOG_FORMAT_VERSION):
+            self._connection.close()
+            raise ValueError(
+                f"{self.file_path} has the format version {meta.get('format_version')}, "
+                f"but {CATALOG_FORMAT_VERSION} is expected!"
+            )
+        self.has_labels = meta["has_labels"] == "1"
+
+    def __reduce__(self):
+        return (self.__class__, (self.file_path,))
+
+    def __enter__(self) -> "MetadataCatalog":
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def __repr__(self) -> str:
+        return (
+            f"{self.__class__.__name__}({self.file_path}, has_labels={self.has_labels})"
+        )
+
+    def close(self) -> None:
+        self._connection.close()
+
+    def execute(self, sql: str, parameters: Sequence = ()) -> List[tuple]:
+        """Run an arbitrary read-only `sql` query and return all rows."""
+        return self._connection.execute(sql, parameters).fetchall()
+
+    def _compile(
+        self,
+        sentinel_source: ben_constants.SentinelSource = ben_constants.SentinelSource.S2,
+        countries: Sequence[str] = (),
+        seasons: Sequence[str] = (),
+        splits: Sequence[str] = (),
+        tiles: Sequence[str] = (),
+        labels: Sequence[str] = (),
+        all_labels: Sequence[str] = (),
+        exclude_labels: Sequence[str] = (),
+        include_flags: int = 0,
+        exclude_flags: int = 0,
+        start: Optional[Union[str, datetime]] = None,
+        end: Optional[Union[str, datetime]] = None,
+    ) -> Tuple[str, List]:
+        """Compile the filters of `query` into the SQL after `SELECT` and its parameters."""
+        sentinel_source = ben_constants.SentinelSource(sentinel_source)
+        prefix = "s1" if sentinel_source == ben_constants.SentinelSource.S1 else "s2"
+        clauses, params = [], []
+
+        def add_in(column: str, values: Sequence, negate: bool = False) -> None:
+            placeholders = ", ".join("?" * len(values))
+            clauses.append(f"{column} {'NOT IN' if negate else 'IN'} ({placeholders})")
+            params.extend(values)
+
+        for column, values, allowed in (
+            ("country", countries, ben_metadata.COUNTRY_NAMES),
+            ("season", seasons, ben_metadata.SEASON_NAMES),
+            ("split", splits, ben_metadata.SPLIT_NAMES),
+        ):
+            if values:
+                values = [str(v) for v in values]
+                _check_values(values, allowed, column)
+                add_in(column, values)
+        if tiles:
+            add_in("tile", list(tiles))
+
+        if (labels or all_labels or exclude_labels) and not self.has_labels:
+            raise ValueError(
+                f"{self.file_path} contains no labels! Build it with metadata snapshots."
+            )
+        label_index = {name: i for i, name in enumerate(ben_snapshot.LABEL_NAMES)}
+        _check_values(
+            [*labels, *all_labels, *exclude_labels], ben_snapshot.LABEL_NAMES, "labels"
+        )
+        labelled = "id IN (SELECT id FROM patch_labels WHERE label IN ({}))"
+        if labels:
+            clauses.append(labelled.format(", ".join("?" * len(labels))))
+            params.extend(label_index[label] for label in labels)
+        for label in all_labels:
+            clauses.append(labelled.format("?"))
+            params.append(label_index[label])
+        if exclude_labels:
+            clauses.append(
+                "id NOT IN (SELECT id FROM patch_labels WHERE label IN ({}))".format(
+                    ", ".join("?" * len(exclude_labels))
+                )
+            )
+            params.extend(label_index[label] for label in exclude_labels)
+
+        if include_flags:
+            clauses.append("flags & ? != 0")
+            params.append(int(include_flags))
+        if exclude_flags:
+            clauses.append("flags & ? = 0")
+            params.append(int(exclude_flags))
+        if start is not None:
+            clauses.append(f"{prefix}_acquisition_time >= ?")
+            params.append(_time_param(start))
+        if end is not None:
+            clauses.append(f"{prefix}_acquisition_time < ?")
+            params.append(_time_param(end))
+        where = f" WHERE {' AND '.join(clauses)}" if clauses else ""
+        return f"{prefix}_name FROM patches{where} ORDER BY {prefix}_rank", params
+
+    def query(
+        self,
+        sentinel_source: ben_constants.SentinelSource = ben_constants.SentinelSource.S2,
+        countries: Sequence[str] = (),
+        seasons: Sequence[str] = (),
+        splits: Sequence[str] = (),
+        tiles: Sequence[str] = (),
+        labels: Sequence[str] = (),
+        all_labels: Sequence[str] = (),
+        exclude_labels: Sequence[str] = (),
+        include_flags: int = 0,
+        exclude_flags: int = 0,
+        start: Optional[Union[str, datetime]] = None,
+        end: Optional[Union[str, datetime]] = None,
+        limit: Optional[int] = None,
+    ) -> List[str]:
+        """
+        Return the naturally sorted `sentinel_source` patch names that match all filters:
+
+        - `countries`, `seasons`, `splits` and `tiles` select patches with any of the given values.
+        - `labels` selects patches with any, `all_labels` patches with all and `exclude_labels`
+          patches with none of the given labels. Label filters require a catalog with labels.
+        - `include_flags` and `exclude_flags` select patches with any and none of
+          the `metadata.PatchFlag` bits, like `base.get_patch_names_by_flags`.
+        - `start` (inclusive) and `end` (exclusive) limit the acquisition time of the `sentinel_source`.
+
+        At most `limit` names are returned.
+        Raises a `ValueError` for unknown countries, seasons, splits or labels.
+        """
+        sql, params = self._compile(
+            sentinel_source,
+            countries,
+            seasons,
+            splits,
+            tiles,
+            labels,
+            all_labels,
+            exclude_labels,
+            include_flags,
+            exclude_flags,
+            start,
+            end,
+        )
+        if limit is not None:
+            sql += " LIMIT ?"
+            params.append(int(limit))
+        return [name for (name,) in self.execute(f"SELECT {sql}", params)]
+
+    def count(self, *args, **kwargs) -> int:
+        """Return the number of patches that match the filters of `query`."""
+        sql, params = self._compile(*args, **kwargs)
+        return self.execute(f"SELECT COUNT(*) FROM (SELECT {sql})", params)[0][0]
+
+    def explain(self, *args, **kwargs) -> str:
+        """Return the SQLite query plan of `query` with the given filters."""
+        sql, params = self._compile(*args, **kwargs)
+        rows = self.execute(f"EXPLAIN QUERY PLAN SELECT {sql}", params)
+        return "\n".join(row[-1] for row in rows)
+
+
+def open_catalog(file_path: Optional[Path] = None) -> MetadataCatalog:
+    """
+    Open the catalog at `file_path`.
+    Without a `file_path`, the default catalog is opened and built from the packaged
+    metadata if it does not exist yet.
+    """
+    if file_path is None:
+        file_path = default_catalog_path()
+        if not file_path.exists():
+            build_catalog(file_path)
+    return MetadataCatalog(file_path)
+
+
+def write_catalog(
+    file_path: Path,
+    snapshots: Optional[List[Path]] = None,
+) -> Path:
+    """
+    Build a catalog file at `file_path` from the packaged metadata and enrich it with
+    the labels and coordinates of the metadata `snapshots` files.
+    """
+    return build_catalog(
+        file_path,
+        [ben_snapshot.load_metadata_snapshot(p) for p in snapshots or []],
+    )
+
+
+def _parse_flags(flag_names: Optional[List[str]]) -> int:
+    flags = 0
+    for name in flag_names or []:
+        if name not in ben_metadata.PatchFlag.__members__:
+            raise ValueError(
+                f"Unknown flag: {name}! Allowed: {list(ben_metadata.PatchFlag.__members__)}"
+            )
+        flags |= ben_metadata.PatchFlag[name]
+    return flags
+
+
+def query_catalog(
+    sentinel_source: ben_constants.SentinelSource = ben_constants.SentinelSource.S2,
+    countries: Optional[List[str]] = None,
+    seasons: Optional[List[str]] = None,
+    splits: Optional[List[str]] = None,
+    tiles: Optional[List[str]] = None,
+    labels: Optional[List[str]] = None,
+    all_labels: Optional[List[str]] = None,
+    exclude_labels: Optional[List[str]] = None,
+    include_flags: Optional[List[str]] = None,
+    exclude_flags: Optional[List[str]] = None,
+    recommended: bool = False,
+    start: Optional[str] = None,
+    end: Optional[str] = None,
+    limit: Optional[int] = None,
+    count: bool = False,
+    catalog: Optional[Path] = None,
+) -> None:
+    """
+    Print the patch names of the `catalog` (by default the packaged metadata) that match all filters,
+    one name per line.
+    The `include_flags` and `exclude_flags` are names of `metadata.PatchFlag` members, such as `seasonal_snow`.
+    `recommended` removes the patches with seasonal snow, cloud and shadow or without a 19-class target.
+    If `count` is set, only the number of matching patches is printed.
+    """
+    filters = dict(
+        sentinel_source=sentinel_source,
+        countries=countries or (),
+        seasons=seasons or (),
+        splits=splits or (),
+        tiles=tiles or (),
+        labels=labels or (),
+        all_labels=all_labels or (),
+        exclude_labels=exclude_labels or (),
+        include_flags=_parse_flags(include_flags),
+        exclude_flags=_parse_flags(exclude_flags)
+        | (ben_metadata.UNRECOMMENDED_FLAGS if recommended else 0),
+        start=start,
+        end=end,
+    )
+    with open_catalog(catalog) as ben_catalog:
+        if count:
+            print(ben_catalog.count(**filters))
+        else:
+            for name in ben_catalog.query(**filters, limit=limit):
+                print(name)
+
+
+def write_catalog_cli():
+    # the command line dependencies are only imported by the entry points
+    import typer
+
+    app = typer.Typer(name="ben_build_catalog", rich_markup_mode="markdown")
+    app.command()(write_catalog)
+    app()
+
+
+def query_catalog_cli():
+    import typer
+
+    app = typer.Typer(name="ben_query_catalog", rich_markup_mode="markdown")
+    app.command()(query_catalog)
+    app()
@@ -0,0 +1,86 @@
+"""
+BigEarthNet Command Line Interfaces:
+
+The command line entry points and the presentation functions of `bigearthnet_common.base`.
+They are kept in a separate module, as they require `typer`, `rich` and `pydantic`,
+which are not needed by the core lookup functions.
+"""
+
+from typing import List
+
+import rich
+import typer
+from pydantic import validate_arguments
+from rich.table import Table
+
+from bigearthnet_common.base import (
+    get_patch_metadata,
+    is_s1_patch,
+    is_s2_patch,
+    validate_ben_s1_root_directory,
+    validate_ben_s2_root_directory,
+)
+
+
+def validate_ben_s2_root_directory_cli():
+    app = typer.Typer(rich_markup_mode="markdown")
+    app.command()(validate_ben_s2_root_directory)
+    app()
+
+
+def validate_ben_s1_root_directory_cli():
+    app = typer.Typer(rich_markup_mode="markdown")
+    app.command()(validate_ben_s1_root_directory)
+    app()
+
+
+@validate_arguments
+def describe_patch(patch_names: List[str]) -> Table:
+    """
+    Given a list of patch names return a table that summarizes
+    the metadata.
+    """
+    columns = [
+        "Sentinel-1 Name",
+        "Sentinel-2 Name",
+        "Original Split",
+        "Country",
+        "Season",
+        "Snowy",
+        "Cloudy / Shadowy",
+        "Valid 19-label",
+    ]
+    y = "✅"
+    n = "❌"
+    t = Table(
+        title=f"Metadata Summary",
+        caption=f"Patch(es): {patch_names}",
+        expand=True,
+        leading=1,
+    )
+    for c in columns:
+        t.add_column(header=c, overflow="fold", justify="center")
+
+    for patch_name in patch_names:
+        if not (is_s1_patch(patch_name) or is_s2_patch(patch_name)):
+            raise ValueError(f"Input: {patch_name} is not a valid S1/S2 patch name!")
+
+        metadata = get_patch_metadata(patch_name)
+        t.add_row(
+            metadata.s1_name,
+            metadata.s2_name,
+            metadata.split,
+            metadata.country,
+            metadata.season,
+            y if metadata.snowy else n,
+            y if metadata.cloudy_shadowy else n,
+            y if metadata.has_19_class_target else n,
+        )
+    rich.print(t)
+    return t
+
+
+def describe_patch_cli():
+    app = typer.Typer(rich_markup_mode="markdown")
+    app.command()(describe_patch)
+    app()
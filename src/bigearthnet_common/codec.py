@@ -0,0 +1,528 @@
+"""
+BigEarthNet Patch Name Codec:
+
+Bijective encoding of BigEarthNet Sentinel-1 and Sentinel-2 patch names into
+fixed-width `uint64` integers and back.
+The codes can be stored, compared, sorted, joined and pickled like any other integer array.
+
+The fields of `constants.BEN_S1_RE` and `constants.BEN_S2_RE` are packed as:
+
+- Sentinel-2: `(((mission * 2 + short_hour) * S2_DAYS_RANGE * TIMES_PER_DAY + time) * 10_000 + grid) + 1`
+- Sentinel-1: `S1_CODE_OFFSET + (((mission * S1_DAYS_RANGE * TIMES_PER_DAY + time) * MGRS_TILES + tile) * 10_000 + grid)`
+
+where `time` is `((days * 24 + hour) * 60 + minute) * 62 + second` with the `days` of the
+acquisition date since `CODEC_EPOCH`, `grid` is `horizontal_id * 100 + vertical_id` and `short_hour`
+marks Sentinel-2 names with the missing leading zero hour bug.
+The time keeps the seconds as they are written, as the archive also contains
+names with the seconds `60` and `61`, such as `S2B_MSIL2A_20180204T94160_0_2`.
+All Sentinel-1 codes are larger than all Sentinel-2 codes and `INVALID_CODE` is never a valid code.
+
+The codec is bijective for all *canonical* patch names, i.e. names with valid
+acquisition times, horizontal/vertical IDs without a leading zero, Sentinel-1 hours with two digits
+and Sentinel-1 tiles from the Military Grid Reference System.
+All patch names of the BigEarthNet archive are canonical.
+
+The same parser also returns the fields of the names as a structured `PATCH_NAME_DTYPE` array
+with `parse_patch_names`, so that the patches can be filtered by acquisition time, tile
+and grid position without reading any json file.
+"""
+
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, NamedTuple
+
+import numpy as np
+
+from bigearthnet_common.metadata import _as_bytes_array
+
+INVALID_CODE = 0
+S1_CODE_OFFSET = 1 << 63
+CODEC_EPOCH = np.datetime64("2014-01-01", "D")
+# seconds `60` and `61` occur in the archive
+_SECONDS_PER_MINUTE = 62
+TIMES_PER_DAY = 24 * 60 * _SECONDS_PER_MINUTE
+# Sentinel-1 dates until 2038-07-13 fit into the upper half of the uint64 range
+S1_DAYS_RANGE = 8_960
+S2_DAYS_RANGE = 1 << 17
+
+_MGRS_BANDS = "CDEFGHJKLMNPQRSTUVWX"
+_MGRS_COLUMNS = "ABCDEFGHJKLMNPQRSTUVWXYZ"
+_MGRS_ROWS = "ABCDEFGHJKLMNPQRSTUV"
+_MGRS_ZONES = 60
+MGRS_TILES = _MGRS_ZONES * len(_MGRS_BANDS) * len(_MGRS_COLUMNS) * len(_MGRS_ROWS)
+
+_MISSIONS = "AB"
+_S1_PREFIX = b"S1?_IW_GRDH_1SDV_"
+_S2_PREFIX = b"S2?_MSIL2A_"
+# maximum length of a canonical patch name
+_MAX_NAME_LENGTH = 44
+_CHUNK_SIZE = 65_536
+
+PATCH_NAME_DTYPE = np.dtype(
+    [
+        ("mission", "U3"),
+        ("acquisition_time", "datetime64[s]"),
+        ("tile", "U5"),
+        ("horizontal_id", np.uint8),
+        ("vertical_id", np.uint8),
+    ]
+)
+
+
+def _char_lut(chars: str) -> np.ndarray:
+    """Map ASCII characters to their index in `chars` and all others to -1."""
+    lut = np.full(256, -1, dtype=np.int64)
+    lut[np.frombuffer(chars.encode(), dtype=np.uint8)] = np.arange(len(chars))
+    return lut
+
+
+_MISSION_LUT = _char_lut(_MISSIONS)
+_BAND_LUT = _char_lut(_MGRS_BANDS)
+_COLUMN_LUT = _char_lut(_MGRS_COLUMNS)
+_ROW_LUT = _char_lut(_MGRS_ROWS)
+_BAND_CHARS = np.frombuffer(_MGRS_BANDS.encode(), dtype=np.uint8)
+_COLUMN_CHARS = np.frombuffer(_MGRS_COLUMNS.encode(), dtype=np.uint8)
+_ROW_CHARS = np.frombuffer(_MGRS_ROWS.encode(), dtype=np.uint8)
+
+
+def _read_digits(
+    chars: np.ndarray, start: np.ndarray, length: np.ndarray, max_length: int
+):
+    """
+    Read the decimal numbers of the given `length` (at most `max_length`) that begin at the
+    column `start` of each row of the `chars` matrix.
+    Returns the values and a boolean mask of rows that only contain digits in the field.
+    """
+    rows = np.arange(len(chars))
+    last_col = chars.shape[1] - 1
+    value = np.zeros(len(chars), dtype=np.int64)
+    ok = (length >= 1) & (length <= max_length)
+    for i in range(max_length):
+        inside = i < length
+        c = chars[rows, np.minimum(start + i, last_col)].astype(np.int64) - ord("0")
+        ok &= ~inside | ((c >= 0) & (c <= 9))
+        value = np.where(inside, value * 10 + c, value)
+    return value, ok
+
+
+def _matches_prefix(chars: np.ndarray, prefix: bytes) -> np.ndarray:
+    """Check if all rows start with `prefix`, where `?` matches any character."""
+    expected = np.frombuffer(prefix, dtype=np.uint8)
+    cols = expected != ord("?")
+    return (chars[:, : len(prefix)][:, cols] == expected[cols]).all(axis=1)
+
+
+def _days_in_month(years: np.ndarray, months: np.ndarray) -> np.ndarray:
+    leap = (years % 4 == 0) & ((years % 100 != 0) | (years % 400 == 0))
+    days = np.array([31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31])[
+        np.clip(months - 1, 0, 11)
+    ]
+    return days + (leap & (months == 2))
+
+
+def _to_epoch_days(fields: Dict[str, np.ndarray]) -> np.ndarray:
+    """
+    Convert the date `fields` to days since `CODEC_EPOCH`.
+    The fields must have been validated before.
+    """
+    months = (fields["year"] - 1970) * 12 + fields["month"] - 1
+    days = months.astype("datetime64[M]").astype("datetime64[D]") + (fields["day"] - 1)
+    return (days - CODEC_EPOCH).astype(np.int64)
+
+
+def _parse_chunk(names: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Parse the fields of the bytes-encoded patch `names` without regular expressions.
+    The returned `valid` mask marks all names that are canonical patch names.
+    """
+    n = len(names)
+    # zero padding guarantees that every row ends with a null character
+    width = max(names.dtype.itemsize, _MAX_NAME_LENGTH) + 1
+    chars = np.zeros((n, width), dtype=np.uint8)
+    chars[:, : names.dtype.itemsize] = (
+        np.ascontiguousarray(names).view(np.uint8).reshape(n, names.dtype.itemsize)
+    )
+    rows = np.arange(n)
+
+    non_null = chars != 0
+    length = np.argmax(~non_null, axis=1)
+    valid = non_null.sum(axis=1) == length
+
+    underscore_rows, underscore_cols = np.nonzero(chars == ord("_"))
+    n_underscores = np.bincount(underscore_rows, minlength=n)
+    underscore_offsets = np.cumsum(n_underscores) - n_underscores
+    # a trailing entry keeps the lookups of rows with too few underscores in bounds
+    underscore_cols = np.append(underscore_cols, 0)
+
+    def underscore_position(k) -> np.ndarray:
+        """Column of the `k`-th underscore of each row or 0 if there is none."""
+        has_k = n_underscores >= k
+        index = np.where(has_k, underscore_offsets + k - 1, len(underscore_cols) - 1)
+        return underscore_cols[index]
+
+    is_s1 = _matches_prefix(chars, _S1_PREFIX) & (n_underscores == 7)
+    is_s2 = _matches_prefix(chars, _S2_PREFIX) & (n_underscores == 4)
+    valid &= is_s1 | is_s2
+    mission = _MISSION_LUT[chars[:, 2]]
+    valid &= mission >= 0
+
+    # Sentinel-1 and Sentinel-2 names only differ by the prefix and the tile field
+    date_start = np.where(is_s1, len(_S1_PREFIX), len(_S2_PREFIX))
+    date, date_ok = _read_digits(chars, date_start, np.full(n, 8), 8)
+    valid &= date_ok & (chars[rows, date_start + 8] == ord("T"))
+    time_start = date_start + 9
+    time_end = underscore_position(np.where(is_s1, 5, 3))
+    time, time_ok = _read_digits(chars, time_start, time_end - time_start, 6)
+    time_length = time_end - time_start
+    valid &= time_ok & (time_length >= 5)
+    short_hour = time_length == 5
+    # Only Sentinel-2 names are affected by the missing leading zero hour bug
+    valid &= ~(is_s1 & short_hour)
+
+    tile_start = time_end + 1
+    tile_zone, tile_zone_ok = _read_digits(chars, tile_start, np.full(n, 2), 2)
+    tile_band = _BAND_LUT[chars[rows, np.minimum(tile_start + 2, width - 1)]]
+    tile_column = _COLUMN_LUT[chars[rows, np.minimum(tile_start + 3, width - 1)]]
+    tile_row = _ROW_LUT[chars[rows, np.minimum(tile_start + 4, width - 1)]]
+    valid &= ~is_s1 | (
+        tile_zone_ok
+        & (tile_zone >= 1)
+        & (tile_zone <= _MGRS_ZONES)
+        & (tile_band >= 0)
+        & (tile_column >= 0)
+        & (tile_row >= 0)
+        & (underscore_position(6) == tile_start + 5)
+    )
+
+    horizontal_start = underscore_position(np.where(is_s1, 6, 3)) + 1
+    vertical_start = underscore_position(np.where(is_s1, 7, 4)) + 1
+    horizontal_id, horizontal_ok = _read_digits(
+        chars, horizontal_start, vertical_start - 1 - horizontal_start, 2
+    )
+    vertical_id, vertical_ok = _read_digits(
+        chars, vertical_start, length - vertical_start, 2
+    )
+    valid &= horizontal_ok & vertical_ok
+    # canonical horizontal/vertical IDs have no leading zero
+    valid &= (chars[rows, horizontal_start] != ord("0")) | (
+        vertical_start - 1 - horizontal_start == 1
+    )
+    valid &= (chars[rows, vertical_start] != ord("0")) | (length - vertical_start == 1)
+
+    fields = {
+        "valid": valid,
+        "is_s1": is_s1,
+        "mission": np.maximum(mission, 0),
+        "year": date // 10_000,
+        "month": date // 100 % 100,
+        "day": date % 100,
+        "hour": time // 10_000,
+        "minute": time // 100 % 100,
+        "second": time % 100,
+        "short_hour": short_hour,
+        "tile": np.where(
+            is_s1,
+            ((tile_zone - 1) * len(_MGRS_BANDS) + tile_band)
+            * len(_MGRS_COLUMNS)
+            * len(_MGRS_ROWS)
+            + tile_column * len(_MGRS_ROWS)
+            + tile_row,
+            0,
+        ),
+        "horizontal_id": horizontal_id,
+        "vertical_id": vertical_id,
+    }
+    valid &= (fields["year"] >= 1970) & (fields["month"] >= 1) & (fields["month"] <= 12)
+    valid &= (fields["day"] >= 1) & (
+        fields["day"] <= _days_in_month(fields["year"], fields["month"])
+    )
+    valid &= (fields["hour"] < 24) & (fields["minute"] < 60)
+    valid &= fields["second"] < _SECONDS_PER_MINUTE
+    # the short hour bug only exists for single digit hours
+    valid &= ~short_hour | (fields["hour"] < 10)
+    # invalid rows are set to the epoch to keep the following computations in range
+    for key, default in (("year", 2014), ("month", 1), ("day", 1)):
+        fields[key] = np.where(valid, fields[key], default)
+    days = _to_epoch_days(fields)
+    valid &= (days >= 0) & (days < np.where(is_s1, S1_DAYS_RANGE, S2_DAYS_RANGE))
+    time = (
+        (days * 24 + fields["hour"]) * 60 + fields["minute"]
+    ) * _SECONDS_PER_MINUTE + fields["second"]
+    fields["time"] = np.where(valid, time, 0)
+    return fields
+
+
+def _parse_names(patch_names: Iterable[str]) -> Dict[str, np.ndarray]:
+    names = _as_bytes_array(patch_names)
+    chunks = [
+        _parse_chunk(names[start : start + _CHUNK_SIZE])
+        for start in range(0, len(names), _CHUNK_SIZE)
+    ]
+    if len(chunks) == 0:
+        chunks = [_parse_chunk(np.empty(0, dtype=f"S{_MAX_NAME_LENGTH}"))]
+    return {key: np.concatenate([c[key] for c in chunks]) for key in chunks[0]}
+
+
+def encode_patch_names(patch_names: Iterable[str], strict: bool = True) -> np.ndarray:
+    """
+    Encode Sentinel-1 and/or Sentinel-2 patch names into a `uint64` array of codes.
+    If `strict` is set (default), a `ValueError` is raised if any name cannot be encoded.
+    Otherwise, the code of these names is set to `INVALID_CODE`.
+    """
+    patch_names = _as_bytes_array(patch_names)
+    fields = _parse_names(patch_names)
+    valid = fields["valid"]
+    if strict and not valid.all():
+        invalid_name = patch_names[np.argmin(valid)].decode(errors="replace")
+        raise ValueError(f"{invalid_name} is not a canonical S1/S2 patch name!")
+    grid = fields["horizontal_id"] * 100 + fields["vertical_id"]
+    s2_codes = (
+        (
+            (fields["mission"] * 2 + fields["short_hour"])
+            * (S2_DAYS_RANGE * TIMES_PER_DAY)
+            + fields["time"]
+        )
+        * 10_000
+        + grid
+        + 1
+    ).astype(np.uint64)
+    s1_codes = (
+        (
+            (fields["mission"] * (S1_DAYS_RANGE * TIMES_PER_DAY) + fields["time"])
+            * MGRS_TILES
+        ).astype(np.uint64)
+        * np.uint64(10_000)
+        + (fields["tile"] * 10_000 + grid).astype(np.uint64)
+        + np.uint64(S1_CODE_OFFSET)
+    )
+    codes = np.where(fields["is_s1"], s1_codes, s2_codes)
+    return np.where(valid, codes, np.uint64(INVALID_CODE)).astype(np.uint64)
+
+
+def _split_tiles(tile: np.ndarray):
+    """Split the tile indices into the zone, band, column and row of the MGRS tiles."""
+    tile_row = tile % len(_MGRS_ROWS)
+    tile = tile // len(_MGRS_ROWS)
+    tile_column = tile % len(_MGRS_COLUMNS)
+    tile = tile // len(_MGRS_COLUMNS)
+    tile_band = tile % len(_MGRS_BANDS)
+    tile_zone = tile // len(_MGRS_BANDS) + 1
+    return tile_zone, tile_band, tile_column, tile_row
+
+
+def _format_tiles(tile: np.ndarray) -> np.ndarray:
+    tile_zone, tile_band, tile_column, tile_row = _split_tiles(tile)
+    chars = np.stack(
+        [
+            tile_zone // 10 + ord("0"),
+            tile_zone % 10 + ord("0"),
+            _BAND_CHARS[tile_band],
+            _COLUMN_CHARS[tile_column],
+            _ROW_CHARS[tile_row],
+        ],
+        axis=1,
+    ).astype(np.uint8)
+    return np.ascontiguousarray(chars).view("S5").ravel().astype("U5")
+
+
+def parse_patch_names(patch_names: Iterable[str], strict: bool = True) -> np.ndarray:
+    """
+    Parse Sentinel-1 and/or Sentinel-2 patch names into a structured `PATCH_NAME_DTYPE` array with the
+    `mission` (`S1A`, `S1B`, `S2A` or `S2B`), the `acquisition_time`, the Sentinel-2 L1C `tile`
+    and the `horizontal_id`/`vertical_id` of the patch in the tile.
+    Only Sentinel-1 names contain the tile, for Sentinel-2 names it is an empty string.
+
+    The acquisition time of Sentinel-2 names with the missing leading zero hour bug is correct,
+    and the seconds `60` and `61` of the archive roll over into the next minute.
+    If `strict` is set (default), a `ValueError` is raised if any name is not a canonical patch name.
+    Otherwise, the fields of these names are empty and their acquisition time is `NaT`.
+    """
+    patch_names = _as_bytes_array(patch_names)
+    fields = _parse_names(patch_names)
+    valid = fields["valid"]
+    if strict and not valid.all():
+        invalid_name = patch_names[np.argmin(valid)].decode(errors="replace")
+        raise ValueError(f"{invalid_name} is not a canonical S1/S2 patch name!")
+    is_s1 = fields["is_s1"]
+
+    parsed = np.zeros(len(valid), dtype=PATCH_NAME_DTYPE)
+    mission = np.stack(
+        [
+            np.full(len(valid), ord("S")),
+            np.where(is_s1, ord("1"), ord("2")),
+            np.frombuffer(_MISSIONS.encode(), dtype=np.uint8)[fields["mission"]],
+        ],
+        axis=1,
+    ).astype(np.uint8)
+    parsed["mission"] = np.where(
+        valid, np.ascontiguousarray(mission).view("S3").ravel().astype("U3"), ""
+    )
+    days = CODEC_EPOCH + _to_epoch_days(fields).astype("timedelta64[D]")
+    seconds = (fields["hour"] * 60 + fields["minute"]) * 60 + fields["second"]
+    parsed["acquisition_time"] = np.where(
+        valid,
+        days.astype("datetime64[s]") + seconds.astype("timedelta64[s]"),
+        np.datetime64("NaT"),
+    )
+    parsed["tile"] = np.where(valid & is_s1, _format_tiles(fields["tile"]), "")
+    parsed["horizontal_id"] = np.where(valid, fields["horizontal_id"], 0)
+    parsed["vertical_id"] = np.where(valid, fields["vertical_id"], 0)
+    return parsed
+
+
+class PatchName(NamedTuple):
+    """Fields of a single patch name, see `parse_patch_names`."""
+
+    mission: str
+    acquisition_time: datetime
+    tile: str
+    horizontal_id: int
+    vertical_id: int
+
+
+def parse_patch_name(patch_name: str) -> PatchName:
+    """
+    Parse a single Sentinel-1 or Sentinel-2 patch name into its fields.
+    Raises a `ValueError` if the name is not a canonical patch name.
+    """
+    mission, acquisition_time, tile, horizontal_id, vertical_id = parse_patch_names(
+        [patch_name]
+    )[0].tolist()
+    return PatchName(mission, acquisition_time, tile, horizontal_id, vertical_id)
+
+
+def encode_patch_name(patch_name: str) -> int:
+    """
+    Encode a single Sentinel-1 or Sentinel-2 patch name.
+    Raises a `ValueError` if the name cannot be encoded.
+    """
+    return int(encode_patch_names([patch_name])[0])
+
+
+def is_s1_code(codes) -> np.ndarray:
+    """Check whether the `codes` encode Sentinel-1 patch names."""
+    return np.asarray(codes, dtype=np.uint64) >= np.uint64(S1_CODE_OFFSET)
+
+
+def _unpack_codes(codes: np.ndarray) -> Dict[str, np.ndarray]:
+    """
+    Unpack the `codes` into their fields.
+    Raises a `ValueError` if any code is invalid.
+    """
+    is_s1 = codes >= np.uint64(S1_CODE_OFFSET)
+    # the Sentinel-1 part is unpacked in uint64 as it does not fit into int64
+    s1 = codes - np.uint64(S1_CODE_OFFSET)
+    s1_grid = (s1 % np.uint64(10_000)).astype(np.int64)
+    s1 = s1 // np.uint64(10_000)
+    s1_tile = (s1 % np.uint64(MGRS_TILES)).astype(np.int64)
+    s1 = (s1 // np.uint64(MGRS_TILES)).astype(np.int64)
+    s1_time = s1 % (S1_DAYS_RANGE * TIMES_PER_DAY)
+    s1_mission = s1 // (S1_DAYS_RANGE * TIMES_PER_DAY)
+
+    s2 = np.where(is_s1, np.uint64(1), codes).astype(np.int64) - 1
+    s2_grid = s2 % 10_000
+    s2 = s2 // 10_000
+    s2_time = s2 % (S2_DAYS_RANGE * TIMES_PER_DAY)
+    s2 = s2 // (S2_DAYS_RANGE * TIMES_PER_DAY)
+    s2_short_hour = s2 % 2
+    s2_mission = s2 // 2
+
+    fields = {
+        "is_s1": is_s1,
+        "mission": np.where(is_s1, s1_mission, s2_mission),
+        "time": np.where(is_s1, s1_time, s2_time),
+        "short_hour": ~is_s1 & (s2_short_hour == 1),
+        "tile": np.where(is_s1, s1_tile, 0),
+        "horizontal_id": np.where(is_s1, s1_grid, s2_grid) // 100,
+        "vertical_id": np.where(is_s1, s1_grid, s2_grid) % 100,
+    }
+    hours = fields["time"] // (60 * _SECONDS_PER_MINUTE) % 24
+    valid = (codes != np.uint64(INVALID_CODE)) & (fields["mission"] < len(_MISSIONS))
+    valid &= ~fields["short_hour"] | (hours < 10)
+    if not valid.all():
+        raise ValueError(f"{codes[np.argmin(valid)]} is not a valid patch name code!")
+    return fields
+
+
+def _format_names(fields: Dict[str, np.ndarray]) -> np.ndarray:
+    time = fields["time"]
+    seconds = time % _SECONDS_PER_MINUTE
+    minutes = time // _SECONDS_PER_MINUTE % 60
+    hours = time // (60 * _SECONDS_PER_MINUTE) % 24
+    days = CODEC_EPOCH + (time // TIMES_PER_DAY).astype("timedelta64[D]")
+    months = days.astype("datetime64[M]")
+    years = months.astype("datetime64[Y]").astype(np.int64) + 1970
+    month = months.astype(np.int64) % 12 + 1
+    day = (days - months.astype("datetime64[D]")).astype(np.int64) + 1
+
+    tile_zone, tile_band, tile_column, tile_row = _split_tiles(fields["tile"])
+
+    n = len(time)
+    rows = np.arange(n)
+    chars = np.zeros((n, _MAX_NAME_LENGTH), dtype=np.uint8)
+    is_s1 = fields["is_s1"]
+
+    def write_chars(position, values, lut=None):
+        chars[rows, position] = values if lut is None else lut[values]
+        return position + 1
+
+    def write_digits(position, values, n_digits):
+        for i in range(n_digits.max(initial=0)):
+            inside = i < n_digits
+            digit = values // 10 ** np.maximum(n_digits - 1 - i, 0) % 10 + ord("0")
+            chars[rows[inside], (position + i)[inside]] = digit[inside]
+        return position + n_digits
+
+    def n_digits(values):
+        return np.where(values >= 10, 2, 1)
+
+    for prefix, mask in ((_S1_PREFIX, is_s1), (_S2_PREFIX, ~is_s1)):
+        chars[mask, : len(prefix)] = np.frombuffer(prefix, dtype=np.uint8)
+    chars[rows, 2] = np.frombuffer(_MISSIONS.encode(), dtype=np.uint8)[
+        fields["mission"]
+    ]
+    position = np.where(is_s1, len(_S1_PREFIX), len(_S2_PREFIX))
+    two = np.full(n, 2)
+    position = write_digits(position, years, np.full(n, 4))
+    position = write_digits(position, month, two)
+    position = write_digits(position, day, two)
+    position = write_chars(position, ord("T"))
+    position = write_digits(
+        position, hours, np.where(fields["short_hour"], n_digits(hours), 2)
+    )
+    position = write_digits(position, minutes, two)
+    position = write_digits(position, seconds, two)
+    position = write_chars(position, ord("_"))
+
+    # only Sentinel-1 names contain the tile, the other rows are overwritten afterwards
+    tile_position = write_digits(position, tile_zone, two)
+    tile_position = write_chars(tile_position, tile_band, _BAND_CHARS)
+    tile_position = write_chars(tile_position, tile_column, _COLUMN_CHARS)
+    tile_position = write_chars(tile_position, tile_row, _ROW_CHARS)
+    tile_position = write_chars(tile_position, ord("_"))
+    position = np.where(is_s1, tile_position, position)
+
+    horizontal_id = fields["horizontal_id"]
+    vertical_id = fields["vertical_id"]
+    position = write_digits(position, horizontal_id, n_digits(horizontal_id))
+    position = write_chars(position, ord("_"))
+    position = write_digits(position, vertical_id, n_digits(vertical_id))
+    # zero the remaining characters of the rows that were shortened
+    chars[np.arange(_MAX_NAME_LENGTH) >= position[:, None]] = 0
+    return chars.view(f"S{_MAX_NAME_LENGTH}").ravel().astype(f"U{_MAX_NAME_LENGTH}")
+
+
+def decode_patch_names(codes) -> np.ndarray:
+    """
+    Decode an array of patch name codes into an array of patch names.
+    Raises a `ValueError` if any code is invalid.
+    """
+    codes = np.asarray(codes, dtype=np.uint64).ravel()
+    return _format_names(_unpack_codes(codes))
+
+
+def decode_patch_name(code: int) -> str:
+    """
+    Decode a single patch name code.
+    Raises a `ValueError` if the code is invalid.
+    """
+    return str(decode_patch_names([code])[0])
@@ -1,9 +1,6 @@
 import re
 from enum import Enum
 
-import natsort
-import rich
-
 
 def _generate_old2new_labels_dict():
     """
@@ -355,7 +352,15 @@ BEN_20m_CHANNELS = (
     "B12",
 )
 
-BEN_10m_20m_CHANNELS = natsort.natsorted(BEN_10m_CHANNELS + BEN_20m_CHANNELS)
+
+def _natural_sort_key(channel: str):
+    # equivalent to `natsort.natsorted` for the channel names without importing `natsort`
+    return [int(t) if t.isdigit() else t for t in re.split(r"(\d+)", channel)]
+
+
+BEN_10m_20m_CHANNELS = sorted(
+    BEN_10m_CHANNELS + BEN_20m_CHANNELS, key=_natural_sort_key
+)
 
 BEN_60m_CHANNELS = (
     "B01",
@@ -560,10 +565,10 @@ PATCH_IN_TERROTORIAL_WATERS = "S2B_MSIL2A_20170814T100029_33_77"
 from collections.abc import Mapping, Sequence
 from functools import reduce, singledispatch
 
-from rich.table import Table
-
 
 def _single_column_table(col_name, rows):
+    from rich.table import Table
+
     t = Table(col_name)
     for row in rows:
         t.add_row(row)
@@ -571,6 +576,8 @@ def _single_column_table(col_name, rows):
 
 
 def _simple_dict_table(header, dictionary):
+    from rich.table import Table
+
     t = Table(title=header, show_header=False)
     for k, v in dictionary.items():
         t.add_row(str(k), str(v))
@@ -578,6 +585,8 @@ def _simple_dict_table(header, dictionary):
 
 
 def _default_pprint(value, name):
+    import rich
+
     rich.print(f"{name}: ", value)
 
 
@@ -589,6 +598,8 @@ def _smart_pprint(value, name):
 @_smart_pprint.register
 def _(value: Mapping, name):
     if all(isinstance(v, (str, int, float)) or v is None for v in value.values()):
+        import rich
+
         t = _simple_dict_table(name, value)
         rich.print(t)
     else:
@@ -604,6 +615,8 @@ def _(value: str, name):
 @_smart_pprint.register
 def _(value: Sequence, name):
     if all(isinstance(entry, str) for entry in value):
+        import rich
+
         t = _single_column_table(name, value)
         rich.print(t)
     else:
@@ -632,8 +645,6 @@ def print_all_constants():
         smart_pprint(k, v)
 
 
-import click
-
 # FUTURE: should use typer with option
 # as it provides an easy interface to generate autocompletions for options
 # with some more advanced features.
@@ -644,6 +655,8 @@ def cli():
     A function that returns a `click` based CLI application.
     Should be called from `__main__`.
     """
+    import click
+
     # where name is selected by user via an option
     # and the value is retrieved from the dictionary
 
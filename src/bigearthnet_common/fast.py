@@ -0,0 +1,130 @@
+"""
+BigEarthNet Fast Lookups:
+
+Unchecked counterparts of the patch lookup functions from `bigearthnet_common.base`
+for hot loops that call them millions of times, such as building datasets.
+
+The functions do the same lookups as their `base` counterparts, but skip the per-call
+argument validation, which costs far more than the lookup itself.
+They expect `str` patch names and do *not* coerce or validate their input.
+All lookups go through `MetadataTable.get_position`, which searches the shared sorted names
+of the table, so they do not build any per-process index.
+Unlike `base.get_original_split_from_patch_name`, `get_original_split_from_patch_name`
+does not raise a `UserWarning` for patches outside of the original split.
+"""
+
+from typing import Optional, Tuple
+
+import bigearthnet_common.constants as ben_constants
+import bigearthnet_common.metadata as ben_metadata
+from bigearthnet_common.base import get_metadata_table
+
+# plain ints, as comparing `PatchFlag` members and NumPy scalars is slow;
+# the lookups read the table columns with `item` for the same reason
+_SEASONAL_SNOW = int(ben_metadata.PatchFlag.seasonal_snow)
+_CLOUD_AND_SHADOW = int(ben_metadata.PatchFlag.cloud_and_shadow)
+_NO_19_CLASS_TARGET = int(ben_metadata.PatchFlag.no_19_class_target)
+_S1 = ben_constants.SentinelSource.S1
+_S2 = ben_constants.SentinelSource.S2
+_SPLITS = tuple(ben_constants.Split(name) for name in ben_metadata.SPLIT_NAMES)
+_BEN_S1_FULLMATCH = ben_constants.BEN_S1_RE.fullmatch
+_BEN_S2_FULLMATCH = ben_constants.BEN_S2_RE.fullmatch
+
+
+def is_s1_patch(patch_name: str) -> bool:
+    """Unchecked version of `base.is_s1_patch`."""
+    return _BEN_S1_FULLMATCH(patch_name) is not None
+
+
+def is_s2_patch(patch_name: str) -> bool:
+    """Unchecked version of `base.is_s2_patch`."""
+    return _BEN_S2_FULLMATCH(patch_name) is not None
+
+
+def _lookup(patch_name: str) -> Tuple[ben_metadata.MetadataTable, int]:
+    """
+    Return the metadata table and the ID of the S1 or S2 `patch_name` or `-1` if it is unknown.
+    """
+    table = get_metadata_table()
+    pos = table.get_position(patch_name)
+    return table, table.name_row.item(pos) if pos >= 0 else -1
+
+
+def _has_patch_flag(patch_name: str, flag: int) -> bool:
+    table, id = _lookup(patch_name)
+    return id >= 0 and table.flags.item(id) & flag != 0
+
+
+def is_snowy_patch(patch_name: str) -> bool:
+    """Unchecked version of `base.is_snowy_patch`."""
+    return _has_patch_flag(patch_name, _SEASONAL_SNOW)
+
+
+def is_cloudy_shadowy_patch(patch_name: str) -> bool:
+    """Unchecked version of `base.is_cloudy_shadowy_patch`."""
+    return _has_patch_flag(patch_name, _CLOUD_AND_SHADOW)
+
+
+def has_19_class_target(patch_name: str) -> bool:
+    """Unchecked version of `base.has_19_class_target`."""
+    return not _has_patch_flag(patch_name, _NO_19_CLASS_TARGET)
+
+
+def get_original_split_from_patch_name(
+    patch_name: str,
+) -> Optional[ben_constants.Split]:
+    """
+    Unchecked version of `base.get_original_split_from_patch_name`.
+    Returns `None` *without* a warning if the patch is not part of the original split.
+    """
+    table, id = _lookup(patch_name)
+    if id < 0:
+        return None
+    split_code = table.split.item(id)
+    return None if split_code == ben_metadata.NO_SPLIT else _SPLITS[split_code]
+
+
+def get_country_from_patch_name(patch_name: str) -> str:
+    """
+    Unchecked version of `base.get_country_from_patch_name`.
+    Raises a `KeyError` if the patch name is unknown.
+    """
+    table, id = _lookup(patch_name)
+    if id < 0:
+        raise KeyError(patch_name)
+    return ben_metadata.COUNTRY_NAMES[table.country.item(id)]
+
+
+def get_season_from_patch_name(patch_name: str) -> str:
+    """
+    Unchecked version of `base.get_season_from_patch_name`.
+    Raises a `KeyError` if the patch name is unknown.
+    """
+    table, id = _lookup(patch_name)
+    if id < 0:
+        raise KeyError(patch_name)
+    return ben_metadata.SEASON_NAMES[table.season.item(id)]
+
+
+def _corresponding_name(patch_name: str, is_s1: bool) -> str:
+    table = get_metadata_table()
+    pos = table.get_position(patch_name)
+    if pos < 0 or (pos < len(table)) != is_s1:
+        raise KeyError(patch_name)
+    return table.get_name(_S2 if is_s1 else _S1, table.name_row.item(pos))
+
+
+def s1_to_s2_patch_name(s1_patch_name: str) -> str:
+    """
+    Unchecked version of `base.s1_to_s2_patch_name`.
+    Raises a `KeyError` if the patch name is unknown.
+    """
+    return _corresponding_name(s1_patch_name, True)
+
+
+def s2_to_s1_patch_name(s2_patch_name: str) -> str:
+    """
+    Unchecked version of `base.s2_to_s1_patch_name`.
+    Raises a `KeyError` if the patch name is unknown.
+    """
+    return _corresponding_name(s2_patch_name, False)
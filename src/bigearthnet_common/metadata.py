@@ -0,0 +1,925 @@
+"""
+BigEarthNet Metadata Table:
+
+A compact, columnar representation of the BigEarthNet patch metadata.
+Every patch, i.e. a pair of a Sentinel-1 and a Sentinel-2 patch, is identified
+by a dense integer ID. Country, season, split and quality flags are stored as
+small integer columns and all patch names are resolved through a single shared index.
+"""
+
+import collections.abc
+import enum
+import threading
+from pathlib import Path
+from typing import Iterable, Iterator, Literal, Mapping, Optional, Sequence, Tuple
+
+import numpy as np
+
+import bigearthnet_common.constants as ben_constants
+
+COUNTRY_NAMES: Tuple[str, ...] = tuple(c.value for c in ben_constants.Country)
+SEASON_NAMES: Tuple[str, ...] = tuple(s.value for s in ben_constants.Season)
+SPLIT_NAMES: Tuple[str, ...] = tuple(s.value for s in ben_constants.Split)
+# split code of patches that are not part of the original train/validation/test split
+NO_SPLIT = -1
+
+# number of names that are decoded at once when iterating over a view
+_ITER_CHUNK_SIZE = 65_536
+
+# names of the arrays that define a `MetadataTable`
+TABLE_ARRAYS = (
+    "names",
+    "name_row",
+    "s1_position",
+    "country",
+    "season",
+    "split",
+    "flags",
+    "hash_keys",
+    "hash_position",
+    "s1_rank",
+    "s2_rank",
+)
+
+
+class PatchFlag(enum.IntFlag):
+    """
+    Quality flags and original split membership of a BigEarthNet patch.
+    Multiple flags are combined into a single bit-mask per patch.
+    """
+
+    seasonal_snow = 1
+    cloud_and_shadow = 2
+    no_19_class_target = 4
+    train = 8
+    validation = 16
+    test = 32
+
+
+# `PatchFlag` of each split code
+SPLIT_FLAGS: Tuple[PatchFlag, ...] = tuple(PatchFlag[s] for s in SPLIT_NAMES)
+# flags of the patches that are not recommended for deep-learning applications
+UNRECOMMENDED_FLAGS = (
+    PatchFlag.seasonal_snow | PatchFlag.cloud_and_shadow | PatchFlag.no_19_class_target
+)
+
+
+class MetadataColumn(str, enum.Enum):
+    """
+    Columns of the `MetadataTable` that can be used as values of a `PatchNameMappingView`.
+    """
+
+    s1_name = "s1_name"
+    s2_name = "s2_name"
+    country = "country"
+    season = "season"
+
+    def __str__(self):
+        return self.value
+
+
+# attribute access on enum classes is slow, so the single-name lookups use these aliases
+_S1 = ben_constants.SentinelSource.S1
+_S2 = ben_constants.SentinelSource.S2
+_S1_NAME = MetadataColumn.s1_name
+_S2_NAME = MetadataColumn.s2_name
+_COUNTRY = MetadataColumn.country
+
+
+class PatchMetadata:
+    """
+    Metadata record of a single BigEarthNet patch, i.e. of a pair of a
+    Sentinel-1 and a Sentinel-2 patch.
+    `split` is `None` if the patch is not part of the original split.
+    """
+
+    __slots__ = (
+        "s1_name",
+        "s2_name",
+        "split",
+        "country",
+        "season",
+        "snowy",
+        "cloudy_shadowy",
+        "has_19_class_target",
+    )
+
+    def __init__(
+        self,
+        s1_name: str,
+        s2_name: str,
+        split: Optional[ben_constants.Split],
+        country: str,
+        season: str,
+        snowy: bool,
+        cloudy_shadowy: bool,
+        has_19_class_target: bool,
+    ):
+        self.s1_name = s1_name
+        self.s2_name = s2_name
+        self.split = split
+        self.country = country
+        self.season = season
+        self.snowy = snowy
+        self.cloudy_shadowy = cloudy_shadowy
+        self.has_19_class_target = has_19_class_target
+
+    def _astuple(self) -> tuple:
+        return tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, PatchMetadata):
+            return NotImplemented
+        return self._astuple() == other._astuple()
+
+    def __repr__(self) -> str:
+        fields = ", ".join(f"{name}={getattr(self, name)!r}" for name in self.__slots__)
+        return f"{self.__class__.__name__}({fields})"
+
+    def __reduce__(self):
+        return (self.__class__, self._astuple())
+
+
+def patch_metadata_dtype(name_length: int = 44) -> np.dtype:
+    """
+    The structured dtype of the patch metadata records returned by `MetadataTable.get_records`.
+    The names are stored as strings with at most `name_length` characters and
+    the categories as codes that index into `SPLIT_NAMES` (or are `NO_SPLIT`),
+    `COUNTRY_NAMES` and `SEASON_NAMES`.
+    """
+    return np.dtype(
+        [
+            ("s1_name", f"U{name_length}"),
+            ("s2_name", f"U{name_length}"),
+            ("split", np.int8),
+            ("country", np.uint8),
+            ("season", np.uint8),
+            ("snowy", np.bool_),
+            ("cloudy_shadowy", np.bool_),
+            ("has_19_class_target", np.bool_),
+        ]
+    )
+
+
+def _as_bytes_array(names: Iterable[str]) -> np.ndarray:
+    """
+    Convert the input `names` into a one-dimensional numpy bytes array.
+    """
+    if isinstance(names, np.ndarray) and names.dtype.kind == "S":
+        return names.ravel()
+    arr = np.asarray(names if isinstance(names, np.ndarray) else list(names))
+    if arr.size == 0:
+        return np.empty(0, dtype="S1")
+    if arr.dtype.kind == "S":
+        return arr.ravel()
+    if arr.dtype.kind != "U":
+        raise TypeError(f"Patch names must be strings, got array of dtype: {arr.dtype}")
+    try:
+        # fast path for ASCII-only names, which includes all valid patch names
+        return arr.ravel().astype("S")
+    except UnicodeEncodeError:
+        return np.char.encode(arr.ravel(), "utf-8")
+
+
+def _hash_names(names: np.ndarray, width: int) -> np.ndarray:
+    """
+    Hash the bytes `names` into `uint64` keys.
+    The names are zero-padded or truncated to `width` bytes, so that the same name
+    results in the same key independent of the item size of the array.
+    """
+    n_words = -(-width // 8)
+    keys = np.empty(len(names), dtype=np.uint64)
+    for start in range(0, len(names), _ITER_CHUNK_SIZE):
+        chunk = np.ascontiguousarray(names[start : start + _ITER_CHUNK_SIZE])
+        chars = np.zeros((len(chunk), n_words * 8), dtype=np.uint8)
+        itemsize = min(chunk.dtype.itemsize, n_words * 8)
+        chars[:, :itemsize] = chunk.view(np.uint8).reshape(
+            len(chunk), chunk.dtype.itemsize
+        )[:, :itemsize]
+        words = chars.view(np.uint64)
+        acc = np.full(len(chunk), 0xCBF29CE484222325, dtype=np.uint64)
+        with np.errstate(over="ignore"):
+            for i in range(n_words):
+                acc = (acc ^ words[:, i]) * np.uint64(0x100000001B3)
+                acc ^= acc >> np.uint64(29)
+        keys[start : start + len(chunk)] = acc
+    return keys
+
+
+def _build_hash_index(names: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Build the sorted hash keys of the `names` and the position of each key in `names`.
+    If two names share the same key, empty arrays are returned and lookups fall back
+    to searching the names directly.
+    """
+    keys = _hash_names(names, names.dtype.itemsize)
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    if _has_duplicates(keys):
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=np.int32)
+    return keys, order.astype(np.int32)
+
+
+class MetadataTable:
+    """
+    Columnar BigEarthNet metadata table.
+
+    The rows are sorted by the Sentinel-2 patch names and the row index is the
+    patch ID that is shared by the Sentinel-1 and Sentinel-2 patch.
+    The Sentinel-1 and Sentinel-2 patch names are stored in a single sorted
+    bytes array, which is used as the index for *both* name types.
+    As all Sentinel-1 names sort before all Sentinel-2 names, the first half
+    of the index contains the Sentinel-1 names and the second half the
+    Sentinel-2 names in row order.
+    Batch lookups go through the sorted 64-bit hash keys of the names (`hash_keys`), as
+    binary searches over the small keys are much more cache friendly than over the names.
+    Single-name lookups (`get_id`, `get_position`) search the sorted names directly.
+    `s1_rank` and `s2_rank` store the position of each row's name in the natural sort
+    order of all Sentinel-1 or Sentinel-2 names.
+
+    Use `build_metadata_table` to create a new table.
+    """
+
+    def __init__(
+        self,
+        names: np.ndarray,
+        name_row: np.ndarray,
+        s1_position: np.ndarray,
+        country: np.ndarray,
+        season: np.ndarray,
+        split: np.ndarray,
+        flags: np.ndarray,
+        hash_keys: np.ndarray,
+        hash_position: np.ndarray,
+        s1_rank: np.ndarray,
+        s2_rank: np.ndarray,
+        mmap_directory: Optional[Path] = None,
+    ):
+        self.names = names
+        self.name_row = name_row
+        self.s1_position = s1_position
+        self.country = country
+        self.season = season
+        self.split = split
+        self.flags = flags
+        self.hash_keys = hash_keys
+        self.hash_position = hash_position
+        self.s1_rank = s1_rank
+        self.s2_rank = s2_rank
+        self.mmap_directory = mmap_directory
+        self._index: Optional["MetadataIndex"] = None
+        self._index_lock = threading.Lock()
+
+    def __reduce__(self):
+        # memory-mapped tables only transfer the directory, so that other
+        # processes attach to the same files instead of copying the arrays
+        if self.mmap_directory is not None:
+            return (load_metadata_table, (self.mmap_directory, "r"))
+        return (self.__class__, tuple(getattr(self, name) for name in TABLE_ARRAYS))
+
+    def __len__(self) -> int:
+        return len(self.country)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(patches={len(self)}, nbytes={self.nbytes})"
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes occupied by all columns."""
+        return sum(getattr(self, name).nbytes for name in TABLE_ARRAYS)
+
+    @property
+    def index(self) -> "MetadataIndex":
+        """
+        `MetadataIndex` of the table.
+        The index is built once on first access, even if multiple threads access it at once.
+        """
+        if self._index is None:
+            with self._index_lock:
+                if self._index is None:
+                    self._index = MetadataIndex(self)
+        return self._index
+
+    def get_position(self, patch_name: str) -> int:
+        """
+        Return the position of the Sentinel-1 or Sentinel-2 `patch_name` in `names`
+        or `-1` if the name is unknown.
+        Positions below `len(table)` belong to Sentinel-1 names and `name_row` maps
+        a position to the patch ID.
+        The lookup only reads the shared arrays of the table, so no per-process index is built.
+        """
+        name = patch_name.encode()
+        if len(name) > self.names.dtype.itemsize:
+            return -1
+        # for a single name, hashing it costs more than searching the sorted names directly
+        pos = int(self.names.searchsorted(name))
+        if pos == len(self.names) or self.names[pos] != name:
+            return -1
+        return pos
+
+    def _source_bounds(
+        self, sentinel_source: Optional[ben_constants.SentinelSource]
+    ) -> Tuple[int, int]:
+        n = len(self)
+        if sentinel_source is None:
+            return 0, 2 * n
+        if sentinel_source == ben_constants.SentinelSource.S1:
+            return 0, n
+        return n, 2 * n
+
+    def get_id(
+        self,
+        patch_name: str,
+        sentinel_source: Optional[ben_constants.SentinelSource] = None,
+    ) -> int:
+        """
+        Return the ID of the given Sentinel-1 or Sentinel-2 `patch_name` or `-1`
+        if the name is unknown.
+        If `sentinel_source` is given, only names from the given source are considered.
+        """
+        pos = self.get_position(patch_name)
+        if pos < 0:
+            return -1
+        if sentinel_source is not None and (pos < len(self)) != (
+            sentinel_source == _S1
+        ):
+            return -1
+        return self.name_row.item(pos)
+
+    def get_ids(
+        self,
+        patch_names: Iterable[str],
+        sentinel_source: Optional[ben_constants.SentinelSource] = None,
+    ) -> np.ndarray:
+        """
+        Vectorized version of `get_id`.
+        Return an `int64` array with the IDs of the given patch names,
+        where unknown names are set to `-1`.
+        """
+        query = _as_bytes_array(patch_names)
+        if query.size == 0:
+            return np.empty(0, dtype=np.int64)
+        lo, hi = self._source_bounds(sentinel_source)
+        if len(self.hash_keys) > 0:
+            pos = self._hash_lookup(query)
+        else:
+            pos = np.searchsorted(self.names, query)
+        valid = (pos >= lo) & (pos < hi)
+        pos = np.where(valid, pos, lo)
+        found = valid & (self.names[pos] == query)
+        return np.where(found, self.name_row[pos], -1).astype(np.int64)
+
+    def _hash_lookup(self, query: np.ndarray) -> np.ndarray:
+        """
+        Return the position in `names` of the only candidate for each name of `query`.
+        The candidates still have to be compared with the query.
+        """
+        keys = _hash_names(query, self.names.dtype.itemsize)
+        # searching sorted keys is much faster, as consecutive searches hit the same memory
+        order = np.argsort(keys)
+        idx = np.empty(len(keys), dtype=np.int64)
+        idx[order] = np.searchsorted(self.hash_keys, keys[order])
+        return self.hash_position[np.minimum(idx, len(self.hash_keys) - 1)]
+
+    def get_names(
+        self, sentinel_source: ben_constants.SentinelSource, ids=slice(None)
+    ) -> np.ndarray:
+        """
+        Return the bytes-encoded patch names of the `sentinel_source` for the given `ids`.
+        By default, the names of all patches are returned in ID order.
+        """
+        if sentinel_source == ben_constants.SentinelSource.S1:
+            return self.names[self.s1_position[ids]]
+        return self.names[len(self) :][ids]
+
+    def get_name(self, sentinel_source: ben_constants.SentinelSource, id: int) -> str:
+        """Return the patch name of the `sentinel_source` for a single `id`."""
+        if sentinel_source == _S1:
+            return self.names[self.s1_position.item(id)].decode()
+        return self.names[len(self) + id].decode()
+
+    def get_ranks(
+        self, sentinel_source: ben_constants.SentinelSource, ids=slice(None)
+    ) -> np.ndarray:
+        """
+        Return the ranks of the `sentinel_source` patch names of the given `ids`
+        in the natural sort order.
+        """
+        if sentinel_source == ben_constants.SentinelSource.S1:
+            return self.s1_rank[ids]
+        return self.s2_rank[ids]
+
+    def natsorted_ids(
+        self, sentinel_source: ben_constants.SentinelSource, ids: np.ndarray
+    ) -> np.ndarray:
+        """
+        Return the `ids` ordered by the natural sort order of their `sentinel_source`
+        patch names, i.e. the order of `natsort.natsorted`.
+        """
+        ids = np.asarray(ids)
+        order = np.argsort(self.get_ranks(sentinel_source, ids), kind="stable")
+        return ids[order]
+
+    def get_value(self, column: MetadataColumn, id: int) -> str:
+        """Return the decoded value of `column` for a single `id`."""
+        if column == _S1_NAME:
+            return self.get_name(_S1, id)
+        if column == _S2_NAME:
+            return self.get_name(_S2, id)
+        if column == _COUNTRY:
+            return COUNTRY_NAMES[self.country.item(id)]
+        return SEASON_NAMES[self.season.item(id)]
+
+    def get_values(self, column: MetadataColumn, ids=slice(None)) -> Sequence[str]:
+        """Return the decoded values of `column` for the given `ids`."""
+        if column == MetadataColumn.s1_name:
+            names = self.get_names(ben_constants.SentinelSource.S1, ids)
+            return [n.decode() for n in names.tolist()]
+        if column == MetadataColumn.s2_name:
+            names = self.get_names(ben_constants.SentinelSource.S2, ids)
+            return [n.decode() for n in names.tolist()]
+        if column == MetadataColumn.country:
+            return [COUNTRY_NAMES[c] for c in self.country[ids].tolist()]
+        return [SEASON_NAMES[s] for s in self.season[ids].tolist()]
+
+    def get_record(self, id: int) -> PatchMetadata:
+        """Return the `PatchMetadata` record of a single `id`."""
+        split = int(self.split[id])
+        flags = int(self.flags[id])
+        return PatchMetadata(
+            s1_name=self.get_name(ben_constants.SentinelSource.S1, id),
+            s2_name=self.get_name(ben_constants.SentinelSource.S2, id),
+            split=None
+            if split == NO_SPLIT
+            else ben_constants.Split(SPLIT_NAMES[split]),
+            country=COUNTRY_NAMES[self.country[id]],
+            season=SEASON_NAMES[self.season[id]],
+            snowy=bool(flags & PatchFlag.seasonal_snow),
+            cloudy_shadowy=bool(flags & PatchFlag.cloud_and_shadow),
+            has_19_class_target=not flags & PatchFlag.no_19_class_target,
+        )
+
+    def get_records(self, ids=slice(None)) -> np.ndarray:
+        """
+        Return the metadata records of the given `ids` as a structured array
+        with the dtype `patch_metadata_dtype`.
+        """
+        flags = self.flags[ids]
+        records = np.empty(len(flags), dtype=patch_metadata_dtype(self.names.itemsize))
+        records["s1_name"] = self.get_names(ben_constants.SentinelSource.S1, ids)
+        records["s2_name"] = self.get_names(ben_constants.SentinelSource.S2, ids)
+        records["split"] = self.split[ids]
+        records["country"] = self.country[ids]
+        records["season"] = self.season[ids]
+        records["snowy"] = (flags & PatchFlag.seasonal_snow) != 0
+        records["cloudy_shadowy"] = (flags & PatchFlag.cloud_and_shadow) != 0
+        records["has_19_class_target"] = (flags & PatchFlag.no_19_class_target) == 0
+        return records
+
+    def mask(self, include: int = 0, exclude: int = 0) -> np.ndarray:
+        """
+        Return a boolean mask over all patches that have *any* of the `include` flags
+        set, or all patches if `include` is `0`, and *none* of the `exclude` flags.
+        """
+        # plain ints, as combining `PatchFlag` members with NumPy arrays is slow
+        include, exclude = int(include), int(exclude)
+        if include and exclude:
+            flags = self.flags & (include | exclude)
+            return ((flags & include) != 0) & ((flags & exclude) == 0)
+        if include:
+            return (self.flags & include) != 0
+        if exclude:
+            return (self.flags & exclude) == 0
+        return np.ones(len(self), dtype=bool)
+
+
+def _bitmaps(column: np.ndarray, n_codes: int) -> np.ndarray:
+    """
+    Return the packed bitmaps of all codes `0..n_codes - 1` of `column` as
+    a `(n_codes, ceil(len(column) / 8))` `uint8` array.
+    Rows with codes outside of this range, such as `NO_SPLIT`, are not part of any bitmap.
+    """
+    codes = np.arange(n_codes, dtype=column.dtype)
+    return np.packbits(column[np.newaxis, :] == codes[:, np.newaxis], axis=1)
+
+
+class MetadataIndex:
+    """
+    Inverted index of a `MetadataTable`.
+
+    For every country, season and split code and for every bit of the `flags` column,
+    a packed bitmap marks the IDs of the patches with the given value.
+    A query is answered with a few bitwise operations on the small bitmaps
+    instead of comparing every row of the table.
+
+    Use `MetadataTable.index` to get the (cached) index of a table.
+    """
+
+    def __init__(self, table: MetadataTable):
+        self.size = len(table)
+        self.country_bitmaps = _bitmaps(table.country, len(COUNTRY_NAMES))
+        self.season_bitmaps = _bitmaps(table.season, len(SEASON_NAMES))
+        self.split_bitmaps = _bitmaps(table.split, len(SPLIT_NAMES))
+        flag_bits = np.arange(8, dtype=np.uint8)
+        self.flag_bitmaps = np.packbits(
+            (table.flags[np.newaxis, :] >> flag_bits[:, np.newaxis]) & 1, axis=1
+        )
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(patches={self.size}, nbytes={self.nbytes})"
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes occupied by all bitmaps."""
+        return (
+            self.country_bitmaps.nbytes
+            + self.season_bitmaps.nbytes
+            + self.split_bitmaps.nbytes
+            + self.flag_bitmaps.nbytes
+        )
+
+    @staticmethod
+    def _union(bitmaps: np.ndarray, codes: Iterable[int]) -> np.ndarray:
+        codes = np.unique(np.asarray(list(codes), dtype=np.int64))
+        return np.bitwise_or.reduce(bitmaps[codes], axis=0)
+
+    def _flags_union(self, flags: int) -> np.ndarray:
+        bits = [bit for bit in range(len(self.flag_bitmaps)) if flags & (1 << bit)]
+        return np.bitwise_or.reduce(self.flag_bitmaps[bits], axis=0)
+
+    def bitmap(
+        self,
+        countries: Optional[Iterable[int]] = None,
+        seasons: Optional[Iterable[int]] = None,
+        splits: Optional[Iterable[int]] = None,
+        include_flags: int = 0,
+        exclude_flags: int = 0,
+    ) -> np.ndarray:
+        """
+        Return the packed bitmap of all patches whose country, season and split code
+        is part of `countries`, `seasons` and `splits`, that have any of the
+        `include_flags` set and none of the `exclude_flags`.
+        A filter that is `None` matches all patches.
+        Note that the bits after the last patch are unspecified.
+        """
+        bitmap = np.full((self.size + 7) // 8, 0xFF, dtype=np.uint8)
+        for bitmaps, codes in (
+            (self.country_bitmaps, countries),
+            (self.season_bitmaps, seasons),
+            (self.split_bitmaps, splits),
+        ):
+            if codes is not None:
+                bitmap &= self._union(bitmaps, codes)
+        if include_flags:
+            bitmap &= self._flags_union(int(include_flags))
+        if exclude_flags:
+            bitmap &= ~self._flags_union(int(exclude_flags))
+        return bitmap
+
+    def query(
+        self,
+        countries: Optional[Iterable[int]] = None,
+        seasons: Optional[Iterable[int]] = None,
+        splits: Optional[Iterable[int]] = None,
+        include_flags: int = 0,
+        exclude_flags: int = 0,
+    ) -> np.ndarray:
+        """
+        Return the sorted IDs of all patches that match the query.
+        See `bitmap` for the meaning of the arguments.
+        """
+        bitmap = self.bitmap(countries, seasons, splits, include_flags, exclude_flags)
+        return np.flatnonzero(np.unpackbits(bitmap, count=self.size))
+
+
+def _iter_chunks(length: int) -> Iterator[slice]:
+    for start in range(0, length, _ITER_CHUNK_SIZE):
+        yield slice(start, min(start + _ITER_CHUNK_SIZE, length))
+
+
+class PatchNameSetView(collections.abc.Set):
+    """
+    Read-only set of patch names that is backed by a `MetadataTable`.
+    The set contains the names of the `sentinel_source` patches that have any of the
+    `include` flags set, or all patches if `include` is `0`, and none of the `exclude` flags.
+    All binary set operations return builtin sets and pickling the view will produce a builtin set.
+    """
+
+    def __init__(
+        self,
+        table: MetadataTable,
+        sentinel_source: ben_constants.SentinelSource,
+        include: int = 0,
+        exclude: int = 0,
+    ):
+        self._table = table
+        self._sentinel_source = sentinel_source
+        # plain ints, as combining `PatchFlag` members with NumPy scalars is slow
+        self._include = int(include)
+        self._exclude = int(exclude)
+        self._len: Optional[int] = None
+
+    @classmethod
+    def _from_iterable(cls, it):
+        return set(it)
+
+    @property
+    def nbytes(self) -> int:
+        """
+        Number of bytes owned by the view, which is `0`, as the patch names and flags
+        are part of the `MetadataTable`.
+        """
+        return 0
+
+    def _ids(self) -> np.ndarray:
+        return np.flatnonzero(self._table.mask(self._include, self._exclude))
+
+    def __contains__(self, patch_name) -> bool:
+        if not isinstance(patch_name, str):
+            return False
+        id = self._table.get_id(patch_name, self._sentinel_source)
+        if id < 0:
+            return False
+        flags = int(self._table.flags[id])
+        if self._include and not flags & self._include:
+            return False
+        return not flags & self._exclude
+
+    def __iter__(self) -> Iterator[str]:
+        ids = self._ids()
+        for chunk in _iter_chunks(len(ids)):
+            names = self._table.get_names(self._sentinel_source, ids[chunk])
+            yield from (n.decode() for n in names.tolist())
+
+    def __len__(self) -> int:
+        if self._len is None:
+            self._len = int(
+                np.count_nonzero(self._table.mask(self._include, self._exclude))
+            )
+        return self._len
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(sentinel_source={self._sentinel_source}, size={len(self)})"
+
+    def __reduce__(self):
+        return (set, (list(self),))
+
+
+class _PatchNameMappingValuesView(collections.abc.ValuesView):
+    def __iter__(self):
+        table = self._mapping._table
+        for chunk in _iter_chunks(len(table)):
+            yield from table.get_values(self._mapping._value_column, chunk)
+
+
+class _PatchNameMappingItemsView(collections.abc.ItemsView):
+    def __iter__(self):
+        table = self._mapping._table
+        key_column = self._mapping._key_column
+        value_column = self._mapping._value_column
+        for chunk in _iter_chunks(len(table)):
+            yield from zip(
+                table.get_values(key_column, chunk),
+                table.get_values(value_column, chunk),
+            )
+
+
+class PatchNameMappingView(collections.abc.Mapping):
+    """
+    Read-only mapping from the patch names of the `sentinel_source`
+    to the values of `value_column` that is backed by a `MetadataTable`.
+    Pickling the view will produce a builtin dictionary.
+    """
+
+    def __init__(
+        self,
+        table: MetadataTable,
+        sentinel_source: ben_constants.SentinelSource,
+        value_column: MetadataColumn,
+    ):
+        self._table = table
+        self._sentinel_source = sentinel_source
+        self._key_column = (
+            MetadataColumn.s1_name
+            if sentinel_source == ben_constants.SentinelSource.S1
+            else MetadataColumn.s2_name
+        )
+        self._value_column = value_column
+
+    def __getitem__(self, patch_name: str) -> str:
+        id = (
+            self._table.get_id(patch_name, self._sentinel_source)
+            if isinstance(patch_name, str)
+            else -1
+        )
+        if id < 0:
+            raise KeyError(patch_name)
+        return self._table.get_value(self._value_column, id)
+
+    def __contains__(self, patch_name) -> bool:
+        return (
+            isinstance(patch_name, str)
+            and self._table.get_id(patch_name, self._sentinel_source) >= 0
+        )
+
+    def __iter__(self) -> Iterator[str]:
+        for chunk in _iter_chunks(len(self._table)):
+            yield from self._table.get_values(self._key_column, chunk)
+
+    def __len__(self) -> int:
+        return len(self._table)
+
+    def values(self):
+        return _PatchNameMappingValuesView(self)
+
+    def items(self):
+        return _PatchNameMappingItemsView(self)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(sentinel_source={self._sentinel_source}, value_column={self._value_column}, size={len(self)})"
+
+    def __reduce__(self):
+        return (dict, (list(self.items()),))
+
+
+def _encode_categories(
+    values: Sequence[str], categories: Tuple[str, ...], name: str
+) -> np.ndarray:
+    """
+    Encode the `values` as `uint8` indexes into `categories`.
+    Raises a `ValueError` if an unknown value is encountered.
+    """
+    lut = {c: i for i, c in enumerate(categories)}
+    try:
+        return np.fromiter((lut[v] for v in values), dtype=np.uint8, count=len(values))
+    except KeyError as e:
+        raise ValueError(f"Unknown {name} value: {e}! Expected: {categories}")
+
+
+def _pad_digit_runs(names: np.ndarray) -> np.ndarray:
+    """
+    Left-pad every run of digits in the bytes-encoded `names` with zeros to the
+    length of the longest run, so that the byte order of the padded names
+    compares the numbers by their value.
+    """
+    n, width = len(names), names.dtype.itemsize
+    # one row per character position, as all names are processed column by column
+    chars = np.ascontiguousarray(
+        np.ascontiguousarray(names).view(np.uint8).reshape(n, width).T
+    )
+    is_digit = (chars >= ord("0")) & (chars <= ord("9"))
+    # number of digits from each position to the end of its run
+    run_rest = np.zeros((width + 1, n), dtype=np.int16)
+    for col in range(width - 1, -1, -1):
+        run_rest[col] = np.where(is_digit[col], run_rest[col + 1] + 1, 0)
+    pad_width = run_rest.max(initial=0)
+    if pad_width == 0:
+        return names
+    run_start = is_digit.copy()
+    run_start[1:] &= ~is_digit[:-1]
+    # number of zeros that are inserted before each character
+    growth = np.where(run_start, pad_width - run_rest[:-1], 0)
+    padded_width = width + int(growth.sum(axis=0).max())
+    padded = np.full((n, padded_width), ord("0"), dtype=np.uint8)
+    flat = padded.ravel()
+    out_pos = np.arange(n, dtype=np.int64) * padded_width
+    for col in range(width):
+        out_pos += growth[col]
+        flat[out_pos] = chars[col]
+        out_pos += chars[col] != 0
+    # clear everything after the end of each name
+    end = out_pos - np.arange(n, dtype=np.int64) * padded_width
+    padded[np.arange(padded_width) >= end[:, np.newaxis]] = 0
+    return padded.view(f"S{padded_width}").ravel()
+
+
+def _natural_sort_ranks(names: np.ndarray) -> np.ndarray:
+    """
+    Return the `int32` rank of each bytes-encoded name in the natural sort order.
+    For names that only consist of letters, digits and underscores, such as the
+    BigEarthNet patch names, the order is identical to `natsort.natsorted`.
+    """
+    order = np.argsort(_pad_digit_runs(names), kind="stable")
+    ranks = np.empty(len(names), dtype=np.int32)
+    ranks[order] = np.arange(len(names), dtype=np.int32)
+    return ranks
+
+
+def _has_duplicates(sorted_arr: np.ndarray) -> bool:
+    return bool((sorted_arr[1:] == sorted_arr[:-1]).any())
+
+
+def build_metadata_table(
+    s1_names: Sequence[str],
+    s2_names: Sequence[str],
+    countries: Sequence[str],
+    seasons: Sequence[str],
+    split_s2_names: Mapping[ben_constants.Split, Iterable[str]],
+    flag_s2_names: Mapping[PatchFlag, Iterable[str]],
+) -> MetadataTable:
+    """
+    Build a `MetadataTable` from the row-aligned `s1_names`, `s2_names`, `countries` and `seasons`.
+    `split_s2_names` maps each split to the Sentinel-2 patch names that belong to it, and
+    `flag_s2_names` maps each `PatchFlag` to the Sentinel-2 patch names that should have the flag set.
+
+    Raises a `ValueError` if the names are not unique or if an unknown Sentinel-2 patch name
+    is referenced.
+    """
+    n = len(s2_names)
+    if not (len(s1_names) == len(countries) == len(seasons) == n):
+        raise ValueError("All columns must have the same length!")
+    s2 = _as_bytes_array(s2_names)
+    order = np.argsort(s2, kind="stable")
+    s2 = s2[order]
+    s1 = _as_bytes_array(s1_names)[order]
+    s1_order = np.argsort(s1, kind="stable")
+    s1_sorted = s1[s1_order]
+    if _has_duplicates(s2) or _has_duplicates(s1_sorted):
+        raise ValueError("The patch names must be unique!")
+
+    names = np.concatenate([s1_sorted, s2])
+    if n > 0 and not names[n - 1] < names[n]:
+        raise ValueError("All Sentinel-1 names must sort before the Sentinel-2 names!")
+    name_row = np.concatenate([s1_order, np.arange(n)]).astype(np.int32)
+    hash_keys, hash_position = _build_hash_index(names)
+    s1_position = np.empty(n, dtype=np.int32)
+    s1_position[s1_order] = np.arange(n, dtype=np.int32)
+
+    table = MetadataTable(
+        names=names,
+        name_row=name_row,
+        s1_position=s1_position,
+        country=_encode_categories(countries, COUNTRY_NAMES, "country")[order],
+        season=_encode_categories(seasons, SEASON_NAMES, "season")[order],
+        split=np.full(n, NO_SPLIT, dtype=np.int8),
+        flags=np.zeros(n, dtype=np.uint8),
+        hash_keys=hash_keys,
+        hash_position=hash_position,
+        s1_rank=_natural_sort_ranks(s1),
+        s2_rank=_natural_sort_ranks(s2),
+    )
+
+    def _s2_ids(patch_names: Iterable[str]) -> np.ndarray:
+        ids = table.get_ids(patch_names, ben_constants.SentinelSource.S2)
+        if (ids < 0).any():
+            raise ValueError("Referenced an unknown Sentinel-2 patch name!")
+        return ids
+
+    for split, patch_names in split_s2_names.items():
+        ids = _s2_ids(patch_names)
+        split_code = SPLIT_NAMES.index(split)
+        table.split[ids] = split_code
+        table.flags[ids] |= np.uint8(SPLIT_FLAGS[split_code])
+    for flag, patch_names in flag_s2_names.items():
+        table.flags[_s2_ids(patch_names)] |= np.uint8(flag)
+    return table
+
+
+def save_metadata_table(table: MetadataTable, directory: Path) -> None:
+    """
+    Save the arrays of the `table` as individual uncompressed `.npy` files
+    into the existing `directory`.
+    """
+    for name in TABLE_ARRAYS:
+        np.save(directory / f"{name}.npy", getattr(table, name), allow_pickle=False)
+
+
+def load_metadata_table(
+    directory: Path, mmap_mode: Optional[Literal["r"]] = None
+) -> MetadataTable:
+    """
+    Load a `MetadataTable` that was saved with `save_metadata_table` from `directory`.
+    If `mmap_mode` is set to `"r"`, the arrays are memory-mapped read-only instead
+    of being read into memory. Memory-mapped tables share their memory with all other
+    processes that map the same directory and pickling them only transfers the `directory`.
+
+    Raises a `ValueError` if the arrays are missing or inconsistent.
+    """
+    try:
+        arrays = {
+            name: np.load(
+                directory / f"{name}.npy", mmap_mode=mmap_mode, allow_pickle=False
+            )
+            for name in TABLE_ARRAYS
+        }
+    except OSError as e:
+        raise ValueError(f"Could not load metadata table from {directory}!") from e
+    if mmap_mode is not None:
+        # plain ndarray views of the mapped memory avoid the indexing overhead of np.memmap
+        arrays = {name: arr.view(np.ndarray) for name, arr in arrays.items()}
+    n = len(arrays["country"])
+    expected_lengths = {"names": 2 * n, "name_row": 2 * n}
+    # the hash index is empty if the hash keys are not unique
+    for name in ("hash_keys", "hash_position"):
+        expected_lengths[name] = len(arrays[name]) and 2 * n
+    for name, arr in arrays.items():
+        if arr.ndim != 1 or len(arr) != expected_lengths.get(name, n):
+            raise ValueError(
+                f"Inconsistent metadata table array {name} in {directory}!"
+            )
+    return MetadataTable(
+        **arrays, mmap_directory=None if mmap_mode is None else Path(directory)
+    )
@@ -4,11 +4,13 @@ from typing import Iterable, List, Set
 
 import fastcore.all as fc
 import natsort
+import numpy as np
 import typer
 from pydantic import validate_arguments
 
 import bigearthnet_common.base as ben_base
 import bigearthnet_common.constants as ben_constants
+import bigearthnet_common.metadata as ben_metadata
 
 
 def get_all_s2_patches() -> Set[str]:
@@ -25,30 +27,55 @@ def get_all_s1_patches() -> Set[str]:
     return set(ben_base.get_complete_s1_to_s2_patch_name_mapping().keys())
 
 
+def _get_recommended_patches(
+    sentinel_source: ben_constants.SentinelSource,
+) -> Set[str]:
+    table = ben_base.get_metadata_table()
+    ids = table.index.query(exclude_flags=ben_metadata.UNRECOMMENDED_FLAGS)
+    names = table.get_names(sentinel_source, ids)
+    return {n.decode() for n in names.tolist()}
+
+
 def get_recommended_s2_patches() -> Set[str]:
-    s2_patches = get_all_s2_patches()
-    no_19_class_targets = ben_base.get_s2_patches_with_no_19_class_target()
-    recommended_s2_patches = {
-        p
-        for p in s2_patches
-        if not ben_base.is_snowy_patch(p)
-        and not ben_base.is_cloudy_shadowy_patch(p)
-        and p not in no_19_class_targets
-    }
-    return recommended_s2_patches
+    return _get_recommended_patches(ben_constants.SentinelSource.S2)
 
 
 def get_recommended_s1_patches() -> Set[str]:
-    s1_patches = get_all_s1_patches()
-    no_19_class_targets = ben_base.get_s1_patches_with_no_19_class_target()
-    recommended_s1_patches = {
-        p
-        for p in s1_patches
-        if not ben_base.is_snowy_patch(p)
-        and not ben_base.is_cloudy_shadowy_patch(p)
-        and p not in no_19_class_targets
-    }
-    return recommended_s1_patches
+    return _get_recommended_patches(ben_constants.SentinelSource.S1)
+
+
+def _get_patch_ids(
+    sentinel_source: ben_constants.SentinelSource,
+    patches: List[str],
+    ignore_unknown: bool = False,
+) -> np.ndarray:
+    """
+    Return the IDs of the `sentinel_source` `patches`, which are `-1` for unknown patches.
+    Raises a `KeyError` for unknown patches, unless `ignore_unknown` is set.
+    """
+    ids = ben_base.get_metadata_table().get_ids(patches, sentinel_source)
+    unknown = ids < 0
+    if unknown.any() and not ignore_unknown:
+        raise KeyError(patches[int(np.argmax(unknown))])
+    return ids
+
+
+def _filter_patches_by_column(
+    sentinel_source: ben_constants.SentinelSource,
+    patches: Iterable[str],
+    column: np.ndarray,
+    code: int,
+    ignore_unknown: bool = False,
+) -> List[str]:
+    """
+    Return the `patches` of the `sentinel_source` whose `column` value
+    in the metadata table is equal to `code`, while keeping the input order.
+    Raises a `KeyError` for unknown patches, unless `ignore_unknown` is set.
+    """
+    patches = list(patches)
+    ids = _get_patch_ids(sentinel_source, patches, ignore_unknown)
+    keep = (column[ids] == code) & (ids >= 0)
+    return [p for p, k in zip(patches, keep.tolist()) if k]
 
 
 @validate_arguments
@@ -60,10 +87,12 @@ def filter_s2_patches_by_country(
             f"{country} is not one of the BEN countries: {ben_constants.COUNTRIES}!"
         )
 
-    patch_country_mapping = ben_base.get_patches_to_country_mapping(
-        use_s2_patch_names=True
+    return _filter_patches_by_column(
+        ben_constants.SentinelSource.S2,
+        patches,
+        ben_base.get_metadata_table().country,
+        ben_metadata.COUNTRY_NAMES.index(country),
     )
-    return [p for p in patches if patch_country_mapping[p] == country]
 
 
 @validate_arguments
@@ -75,10 +104,12 @@ def filter_s1_patches_by_country(
             f"{country} is not one of the BEN countries: {ben_constants.COUNTRIES}!"
         )
 
-    patch_country_mapping = ben_base.get_patches_to_country_mapping(
-        use_s2_patch_names=False
+    return _filter_patches_by_column(
+        ben_constants.SentinelSource.S1,
+        patches,
+        ben_base.get_metadata_table().country,
+        ben_metadata.COUNTRY_NAMES.index(country),
     )
-    return [p for p in patches if patch_country_mapping[p] == country]
 
 
 @validate_arguments
@@ -102,20 +133,24 @@ def filter_patches_by_country(
 def filter_s2_patches_by_season(
     patches: Iterable[str], season: ben_constants.Season
 ) -> List[str]:
-    patch_season_mapping = ben_base.get_patches_to_season_mapping(
-        use_s2_patch_names=True
+    return _filter_patches_by_column(
+        ben_constants.SentinelSource.S2,
+        patches,
+        ben_base.get_metadata_table().season,
+        ben_metadata.SEASON_NAMES.index(season),
     )
-    return [p for p in patches if patch_season_mapping[p] == season]
 
 
 @validate_arguments
 def filter_s1_patches_by_season(
     patches: Iterable[str], season: ben_constants.Season
 ) -> List[str]:
-    patch_season_mapping = ben_base.get_patches_to_season_mapping(
-        use_s2_patch_names=False
+    return _filter_patches_by_column(
+        ben_constants.SentinelSource.S1,
+        patches,
+        ben_base.get_metadata_table().season,
+        ben_metadata.SEASON_NAMES.index(season),
     )
-    return [p for p in patches if patch_season_mapping[p] == season]
 
 
 @validate_arguments
@@ -139,26 +174,26 @@ def filter_patches_by_season(
 def filter_s1_patches_by_split(
     patches: Iterable[str], split: ben_constants.Split
 ) -> List[str]:
-    get_split_func = {
-        split.train: ben_base.get_s1_patches_from_original_train_split,
-        split.validation: ben_base.get_s1_patches_from_original_validation_split,
-        split.test: ben_base.get_s1_patches_from_original_test_split,
-    }
-    split_patches = get_split_func[split]()
-    return [p for p in patches if p in split_patches]
+    return _filter_patches_by_column(
+        ben_constants.SentinelSource.S1,
+        patches,
+        ben_base.get_metadata_table().split,
+        ben_metadata.SPLIT_NAMES.index(split),
+        ignore_unknown=True,
+    )
 
 
 @validate_arguments
 def filter_s2_patches_by_split(
     patches: Iterable, split: ben_constants.Split
 ) -> List[str]:
-    get_split_func = {
-        split.train: ben_base.get_s2_patches_from_original_train_split,
-        split.validation: ben_base.get_s2_patches_from_original_validation_split,
-        split.test: ben_base.get_s2_patches_from_original_test_split,
-    }
-    split_patches = get_split_func[split]()
-    return [p for p in patches if p in split_patches]
+    return _filter_patches_by_column(
+        ben_constants.SentinelSource.S2,
+        patches,
+        ben_base.get_metadata_table().split,
+        ben_metadata.SPLIT_NAMES.index(split),
+        ignore_unknown=True,
+    )
 
 
 @validate_arguments
@@ -178,6 +213,47 @@ def filter_patches_by_split(
     )
 
 
+@validate_arguments
+def filter_patches_by_flags(
+    sentinel_source: ben_constants.SentinelSource,
+    patches: Iterable[str],
+    include: int = 0,
+    exclude: int = 0,
+) -> List[str]:
+    """
+    Given Sentinel-1/2 named-patches, return only those patches that have any of the
+    `include` flags, or all patches if `include` is `0`, and none of the `exclude` flags,
+    while keeping the input order.
+    The flags are combinations of `metadata.PatchFlag`, such as `metadata.UNRECOMMENDED_FLAGS`.
+
+    Unlike the split filters, which drop unknown patches, this function raises a `KeyError`
+    for patches that are not part of the `sentinel_source` archive, like the country
+    and season filters.
+    """
+    patches = list(patches)
+    # all patches are known patches of the `sentinel_source` after this check
+    _get_patch_ids(sentinel_source, patches)
+    keep = ben_base.match_patch_flags(patches, include, exclude)
+    return [p for p, k in zip(patches, keep.tolist()) if k]
+
+
+def _natsorted_patches(
+    sentinel_source: ben_constants.SentinelSource, patches: Iterable[str]
+) -> List[str]:
+    """
+    Return the `patches` of the `sentinel_source` in natural sort order.
+    Known patches are ordered by the precomputed natural sort ranks of the metadata table.
+    """
+    patches = list(patches)
+    table = ben_base.get_metadata_table()
+    ids = table.get_ids(patches, sentinel_source)
+    if (ids < 0).any():
+        # unknown patches have no precomputed rank
+        return natsort.natsorted(patches)
+    order = np.argsort(table.get_ranks(sentinel_source, ids), kind="stable")
+    return [patches[i] for i in order.tolist()]
+
+
 @validate_arguments
 def build_set(
     sentinel_source: ben_constants.SentinelSource,
@@ -190,28 +266,25 @@ def build_set(
     The returned list will be naturally sorted to produce
     deterministic results.
     """
-    use_s1 = sentinel_source == ben_constants.SentinelSource.S1
-    # FUTURE: could be split up into higher level functions
-    if remove_unrecommended_dl_patches:
-        patches = (
-            get_recommended_s1_patches() if use_s1 else get_recommended_s2_patches()
-        )
-    else:
-        patches = get_all_s1_patches() if use_s1 else get_all_s2_patches()
-
-    if len(seasons) > 0:
-        patches = [
-            patch
-            for season in seasons
-            for patch in filter_patches_by_season(sentinel_source, patches, season)
-        ]
-    if len(countries) > 0:
-        patches = [
-            patch
-            for country in countries
-            for patch in filter_patches_by_country(sentinel_source, patches, country)
-        ]
-    return natsort.natsorted(patches)
+    table = ben_base.get_metadata_table()
+    season_codes = [ben_metadata.SEASON_NAMES.index(season) for season in seasons]
+    country_codes = [ben_metadata.COUNTRY_NAMES.index(country) for country in countries]
+    ids = table.index.query(
+        seasons=season_codes or None,
+        countries=country_codes or None,
+        exclude_flags=ben_metadata.UNRECOMMENDED_FLAGS
+        if remove_unrecommended_dl_patches
+        else 0,
+    )
+    ids = table.natsorted_ids(sentinel_source, ids)
+    # a season or country that is given multiple times adds its patches multiple times
+    repeats = np.ones(len(ids), dtype=np.int64)
+    for column, codes in ((table.season, season_codes), (table.country, country_codes)):
+        if codes:
+            counts = np.bincount(codes)
+            repeats *= counts[column[ids]]
+    names = table.get_names(sentinel_source, np.repeat(ids, repeats))
+    return [n.decode() for n in names.tolist()]
 
 
 @fc.delegates(build_set)
@@ -234,7 +307,7 @@ def build_csv_sets(
     """
 
     def _write_csv(fp, patches):
-        sorted_patches = natsort.natsorted(patches)
+        sorted_patches = _natsorted_patches(sentinel_source, patches)
         with open(fp.with_suffix(".csv"), "w") as csv_file:
             writer = csv.writer(csv_file)
             for patch in sorted_patches:
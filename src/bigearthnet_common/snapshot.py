@@ -0,0 +1,577 @@
+"""
+BigEarthNet Metadata Snapshots:
+
+The labels, coordinates, projections and acquisition times of the patches are only
+available in the `_labels_metadata.json` files of the archive.
+A `MetadataSnapshot` holds these values for all patches of an archive in a compact columnar form,
+so that the hundreds of thousands of json files only have to be read once:
+
+- The labels are stored as `uint64` bitmasks, where bit `i` marks the label `LABEL_NAMES[i]`.
+- The coordinates are stored as an `int32` array with the columns `COORDINATE_KEYS`.
+- The projections and the scene (S1) or tile (S2) sources are interned
+  into small integer codes and a table of the distinct values.
+- The acquisition times are stored as `datetime64[s]`.
+- The modification times (`mtime_ns`) and sizes of the json files at the time they were read
+  are stored as a manifest, so that `update_metadata_snapshot` only has to re-read
+  the json files of the patches that were added or changed since the last scan.
+
+The rows are sorted by the patch names.
+A snapshot is saved as a single uncompressed `.npz` file, whose arrays are memory-mapped
+when the snapshot is loaded, so loading a snapshot of the complete archive is nearly instant.
+"""
+
+import concurrent.futures
+import io
+import mmap
+import os
+import struct
+import tempfile
+import zipfile
+from pathlib import Path
+from typing import Dict, Iterable, List, Literal, NamedTuple, Optional, Tuple, Union
+
+import numpy as np
+
+import bigearthnet_common.base as ben_base
+import bigearthnet_common.constants as ben_constants
+from bigearthnet_common.metadata import _as_bytes_array
+
+# increase if the layout of the snapshot file changes
+SNAPSHOT_FORMAT_VERSION = 1
+LABEL_NAMES = tuple(ben_constants.OLD_LABELS)
+COORDINATE_KEYS = ("ulx", "uly", "lrx", "lry")
+# names of the arrays that define a `MetadataSnapshot`
+SNAPSHOT_ARRAYS = (
+    "names",
+    "labels",
+    "coordinates",
+    "projection",
+    "projections",
+    "source",
+    "sources",
+    "acquisition_time",
+    "mtime_ns",
+    "size",
+)
+
+_LABEL_BITS = {label: 1 << i for i, label in enumerate(LABEL_NAMES)}
+# size of the fixed part of a local file header of a zip archive
+_ZIP_LOCAL_HEADER_SIZE = 30
+# upper bound of the `.npy` header size of the snapshot arrays
+_NPY_MAX_HEADER_SIZE = 4_096
+
+
+def labels_to_bits(labels: Iterable[str]) -> int:
+    """
+    Return the bitmask of the `labels`.
+    If an unknown label is given, a `KeyError` is raised.
+    """
+    bits = 0
+    for label in labels:
+        bits |= _LABEL_BITS[label]
+    return bits
+
+
+def bits_to_labels(bits: int) -> List[str]:
+    """Return the labels of the bitmask `bits` in the order of `LABEL_NAMES`."""
+    bits = int(bits)
+    return [label for label, bit in _LABEL_BITS.items() if bits & bit]
+
+
+class MetadataSnapshot:
+    """
+    Columnar snapshot of the json metadata of the Sentinel-1 or Sentinel-2 patches of an archive.
+    Build it with `build_metadata_snapshot` and persist it with `save_metadata_snapshot`.
+    """
+
+    def __init__(
+        self,
+        sentinel_source: ben_constants.SentinelSource,
+        names: np.ndarray,
+        labels: np.ndarray,
+        coordinates: np.ndarray,
+        projection: np.ndarray,
+        projections: np.ndarray,
+        source: np.ndarray,
+        sources: np.ndarray,
+        acquisition_time: np.ndarray,
+        mtime_ns: np.ndarray,
+        size: np.ndarray,
+        file_path: Optional[Path] = None,
+    ):
+        self.sentinel_source = ben_constants.SentinelSource(sentinel_source)
+        self.names = names
+        self.labels = labels
+        self.coordinates = coordinates
+        self.projection = projection
+        self.projections = projections
+        self.source = source
+        self.sources = sources
+        self.acquisition_time = acquisition_time
+        self.mtime_ns = mtime_ns
+        self.size = size
+        self.file_path = file_path
+
+    def __reduce__(self):
+        # memory-mapped snapshots only transfer the file path
+        if self.file_path is not None:
+            return (load_metadata_snapshot, (self.file_path, "r"))
+        return (
+            self.__class__,
+            (
+                self.sentinel_source,
+                *(getattr(self, name) for name in SNAPSHOT_ARRAYS),
+            ),
+        )
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def __repr__(self) -> str:
+        return f"{self.__class__.__name__}(sentinel_source={self.sentinel_source}, patches={len(self)}, nbytes={self.nbytes})"
+
+    @property
+    def nbytes(self) -> int:
+        """Number of bytes occupied by all columns."""
+        return sum(getattr(self, name).nbytes for name in SNAPSHOT_ARRAYS)
+
+    @property
+    def source_key(self) -> str:
+        """Json key of the `sources`: `scene_source` for S1 and `tile_source` for S2."""
+        if self.sentinel_source == ben_constants.SentinelSource.S1:
+            return "scene_source"
+        return "tile_source"
+
+    def get_rows(self, patch_names: Iterable[str]) -> np.ndarray:
+        """
+        Return the rows of the `patch_names` and -1 for patches that are not part of the snapshot.
+        """
+        names = _as_bytes_array(patch_names)
+        if len(self) == 0:
+            return np.full(len(names), -1)
+        rows = np.searchsorted(self.names, names)
+        clipped = np.minimum(rows, len(self) - 1)
+        found = (rows < len(self)) & (self.names[clipped] == names)
+        return np.where(found, rows, -1)
+
+    def get_labels(self, row: int) -> List[str]:
+        """Return the labels of the patch in `row` in the order of `LABEL_NAMES`."""
+        return bits_to_labels(self.labels[row])
+
+    def has_labels(self, labels: Iterable[str], match_all: bool = False) -> np.ndarray:
+        """
+        Return a boolean mask of the patches that have any of the `labels` or, if `match_all`
+        is set, all of the `labels`.
+        """
+        bits = np.uint64(labels_to_bits(labels))
+        matched = self.labels & bits
+        return matched == bits if match_all else matched != 0
+
+    def get_record(self, row: int) -> ben_base.BEN_JSON_DATA:
+        """
+        Return the json data of the patch in `row` like `read_S1_json`/`read_S2_json`.
+        The labels are in the order of `LABEL_NAMES` and the S1 `corresponding_s2_patch`
+        is not part of the snapshot, as it is given by `base.s1_to_s2_patch_name`.
+        """
+        time_key = (
+            "acquisition_time"
+            if self.sentinel_source == ben_constants.SentinelSource.S1
+            else "acquisition_date"
+        )
+        acquisition_time = self.acquisition_time[row].item()
+        return {
+            "labels": self.get_labels(row),
+            "coordinates": dict(
+                zip(COORDINATE_KEYS, (int(c) for c in self.coordinates[row]))
+            ),
+            "projection": self.projections[self.projection[row]].decode(),
+            self.source_key: self.sources[self.source[row]].decode(),
+            time_key: acquisition_time.isoformat(
+                sep="T" if time_key == "acquisition_time" else " "
+            ),
+        }
+
+
+def _intern(values: List[str], vocabulary: Dict[str, int]) -> np.ndarray:
+    return np.array([vocabulary.setdefault(v, len(vocabulary)) for v in values])
+
+
+def _patch_directories(
+    patch_paths: Union[str, Path, Iterable[Union[str, Path]]],
+    sentinel_source: ben_constants.SentinelSource,
+) -> List[Path]:
+    if isinstance(patch_paths, (str, Path)):
+        get_patch_directories = (
+            ben_base.get_s1_patch_directories
+            if sentinel_source == ben_constants.SentinelSource.S1
+            else ben_base.get_s2_patch_directories
+        )
+        return sorted(get_patch_directories(patch_paths))
+    return [Path(p) for p in patch_paths]
+
+
+def _stat_json_files(patch_dirs: List[Path]) -> Tuple[List[int], List[int]]:
+    mtime_ns, size = [], []
+    for patch_dir in patch_dirs:
+        try:
+            stat = os.stat(patch_dir / f"{patch_dir.name}_labels_metadata.json")
+        except FileNotFoundError:
+            mtime_ns.append(-1)
+            size.append(-1)
+            continue
+        mtime_ns.append(stat.st_mtime_ns)
+        size.append(stat.st_size)
+    return mtime_ns, size
+
+
+def _stat_patch_jsons(
+    patch_dirs: List[Path], max_workers: Optional[int]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Return the modification times in nanoseconds and the sizes of the json files
+    of the `patch_dirs`, which are `-1` for missing json files.
+    The files are stat-ed by `max_workers` threads, as the latency of network file systems dominates.
+    """
+    chunk_size = 4_096
+    mtime_ns, size = [], []
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        chunks = [
+            patch_dirs[i : i + chunk_size]
+            for i in range(0, len(patch_dirs), chunk_size)
+        ]
+        for chunk_mtime_ns, chunk_sizes in executor.map(_stat_json_files, chunks):
+            mtime_ns.extend(chunk_mtime_ns)
+            size.extend(chunk_sizes)
+    return np.array(mtime_ns, dtype=np.int64), np.array(size, dtype=np.int64)
+
+
+def build_metadata_snapshot(
+    patch_paths: Union[str, Path, Iterable[Union[str, Path]]],
+    sentinel_source: ben_constants.SentinelSource,
+    max_workers: Optional[int] = None,
+    use_processes: bool = False,
+) -> MetadataSnapshot:
+    """
+    Read the json files of all `patch_paths` and return their `MetadataSnapshot`.
+    `patch_paths` is the root directory of the archive or an iterable of patch directories
+    of the `sentinel_source`.
+    The files are read with `read_S1_jsons`/`read_S2_jsons` with the given
+    `max_workers` and `use_processes`.
+    """
+    sentinel_source = ben_constants.SentinelSource(sentinel_source)
+    patch_dirs = _patch_directories(patch_paths, sentinel_source)
+    # stat before reading, so that files that change while reading are re-read by the next update
+    mtime_ns, size = _stat_patch_jsons(patch_dirs, max_workers)
+    missing = mtime_ns < 0
+    if missing.any():
+        patch_dir = patch_dirs[int(np.argmax(missing))]
+        raise FileNotFoundError(
+            f"{patch_dir} does not contain the json file {patch_dir.name}_labels_metadata.json!"
+        )
+    is_s1 = sentinel_source == ben_constants.SentinelSource.S1
+    reader = ben_base.read_S1_jsons if is_s1 else ben_base.read_S2_jsons
+    source_key = "scene_source" if is_s1 else "tile_source"
+    time_key = "acquisition_time" if is_s1 else "acquisition_date"
+
+    names, labels, coordinates = [], [], []
+    projections, sources, acquisition_times = [], [], []
+    for name, data in reader(
+        patch_dirs,
+        max_workers=max_workers,
+        use_processes=use_processes,
+        intern_strings=True,
+    ):
+        names.append(name)
+        labels.append(labels_to_bits(data["labels"]))
+        coordinates.append([data["coordinates"][k] for k in COORDINATE_KEYS])
+        projections.append(data["projection"])
+        sources.append(data[source_key])
+        acquisition_times.append(str(data[time_key]))
+
+    projection_codes: Dict[str, int] = {}
+    source_codes: Dict[str, int] = {}
+    projection = _intern(projections, projection_codes)
+    source = _intern(sources, source_codes)
+    names_arr = _as_bytes_array(names)
+    order = np.argsort(names_arr, kind="stable")
+    return MetadataSnapshot(
+        sentinel_source,
+        names=names_arr[order],
+        labels=np.array(labels, dtype=np.uint64)[order],
+        coordinates=np.array(coordinates, dtype=np.int32).reshape(-1, 4)[order],
+        projection=projection.astype(np.min_scalar_type(len(projection_codes)))[order],
+        projections=_as_bytes_array(list(projection_codes)),
+        source=source.astype(np.min_scalar_type(len(source_codes)))[order],
+        sources=_as_bytes_array(list(source_codes)),
+        acquisition_time=ben_base.parse_datetimes(acquisition_times)[order],
+        mtime_ns=mtime_ns[order],
+        size=size[order],
+    )
+
+
+def _merge_interned(
+    codes: Tuple[np.ndarray, np.ndarray], values: Tuple[np.ndarray, np.ndarray]
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Concatenate the interned `codes` of two snapshots and return the new codes and
+    the values that are still in use.
+    """
+    vocabulary = np.unique(np.concatenate(values))
+    merged = np.concatenate(
+        [np.searchsorted(vocabulary, v)[c] for c, v in zip(codes, values)]
+    )
+    used, merged = np.unique(merged, return_inverse=True)
+    return merged.astype(np.min_scalar_type(len(used))), vocabulary[used]
+
+
+def _merge_snapshots(
+    snapshot: MetadataSnapshot, rows: np.ndarray, other: MetadataSnapshot
+) -> MetadataSnapshot:
+    """
+    Return a new snapshot with the `rows` of `snapshot` and all rows of `other`,
+    which must not contain any of the patches of the `rows`.
+    """
+    columns = {
+        name: np.concatenate([getattr(snapshot, name)[rows], getattr(other, name)])
+        for name in (
+            "names",
+            "labels",
+            "coordinates",
+            "acquisition_time",
+            "mtime_ns",
+            "size",
+        )
+    }
+    for codes, values in (("projection", "projections"), ("source", "sources")):
+        columns[codes], columns[values] = _merge_interned(
+            (getattr(snapshot, codes)[rows], getattr(other, codes)),
+            (getattr(snapshot, values), getattr(other, values)),
+        )
+    order = np.argsort(columns["names"], kind="stable")
+    for name in (
+        "names",
+        "labels",
+        "coordinates",
+        "projection",
+        "source",
+        "acquisition_time",
+        "mtime_ns",
+        "size",
+    ):
+        columns[name] = columns[name][order]
+    return MetadataSnapshot(snapshot.sentinel_source, **columns)
+
+
+def save_metadata_snapshot(snapshot: MetadataSnapshot, file_path: Path) -> None:
+    """
+    Atomically save the `snapshot` as a single uncompressed `.npz` file to `file_path`.
+    """
+    file_path = Path(file_path)
+    arrays = {name: getattr(snapshot, name) for name in SNAPSHOT_ARRAYS}
+    arrays["sentinel_source"] = np.array(snapshot.sentinel_source.value)
+    arrays["format_version"] = np.array(SNAPSHOT_FORMAT_VERSION)
+    fd, tmp_path = tempfile.mkstemp(dir=file_path.parent, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def _mmap_npz(file_path: Path) -> Dict[str, np.ndarray]:
+    """
+    Memory-map the arrays of the uncompressed `.npz` file `file_path` read-only.
+    """
+    with open(file_path, "rb") as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    arrays = {}
+    with zipfile.ZipFile(file_path) as zip_file:
+        for info in zip_file.infolist():
+            if info.compress_type != zipfile.ZIP_STORED:
+                raise ValueError(f"{info.filename} in {file_path} is compressed!")
+            header = info.header_offset
+            name_length, extra_length = struct.unpack(
+                "<HH", buffer[header + 26 : header + _ZIP_LOCAL_HEADER_SIZE]
+            )
+            offset = header + _ZIP_LOCAL_HEADER_SIZE + name_length + extra_length
+            member = io.BytesIO(buffer[offset : offset + _NPY_MAX_HEADER_SIZE])
+            version = np.lib.format.read_magic(member)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(member)
+            elif version == (2, 0):
+                header = np.lib.format.read_array_header_2_0(member)
+            else:
+                raise ValueError(f"Unsupported .npy format version {version}!")
+            shape, fortran_order, dtype = header
+            if dtype.hasobject:
+                raise ValueError(f"{info.filename} in {file_path} contains objects!")
+            arr = np.frombuffer(
+                buffer,
+                dtype=dtype,
+                count=int(np.prod(shape)),
+                offset=offset + member.tell(),
+            )
+            arrays[info.filename[: -len(".npy")]] = arr.reshape(
+                shape, order="F" if fortran_order else "C"
+            )
+    return arrays
+
+
+def load_metadata_snapshot(
+    file_path: Path, mmap_mode: Optional[Literal["r"]] = "r"
+) -> MetadataSnapshot:
+    """
+    Load a `MetadataSnapshot` that was saved with `save_metadata_snapshot` from `file_path`.
+    By default, the arrays are memory-mapped read-only and pickling the snapshot only
+    transfers the `file_path`.
+    Set `mmap_mode` to `None` to read the arrays into memory instead.
+
+    Raises a `ValueError` if the file is not a snapshot, was written by an incompatible
+    version or is inconsistent.
+    """
+    file_path = Path(file_path)
+    try:
+        if mmap_mode is None:
+            with np.load(file_path, allow_pickle=False) as npz:
+                arrays = {name: npz[name] for name in npz.files}
+        else:
+            arrays = _mmap_npz(file_path)
+    except (OSError, zipfile.BadZipFile, struct.error) as e:
+        raise ValueError(f"Could not load metadata snapshot from {file_path}!") from e
+    missing = {*SNAPSHOT_ARRAYS, "sentinel_source", "format_version"} - arrays.keys()
+    if missing:
+        raise ValueError(f"{file_path} is missing the arrays: {missing}!")
+    if arrays["format_version"] != SNAPSHOT_FORMAT_VERSION:
+        raise ValueError(
+            f"{file_path} has the format version {arrays['format_version']}, "
+            f"but {SNAPSHOT_FORMAT_VERSION} is expected!"
+        )
+    n = len(arrays["names"])
+    for name in SNAPSHOT_ARRAYS:
+        if name not in ("names", "projections", "sources") and len(arrays[name]) != n:
+            raise ValueError(f"Inconsistent snapshot array {name} in {file_path}!")
+    return MetadataSnapshot(
+        str(arrays["sentinel_source"]),
+        **{name: arrays[name] for name in SNAPSHOT_ARRAYS},
+        file_path=None if mmap_mode is None else file_path.absolute(),
+    )
+
+
+def write_metadata_snapshot(
+    root_dir: Path,
+    sentinel_source: ben_constants.SentinelSource,
+    file_path: Path,
+    max_workers: Optional[int] = None,
+    use_processes: bool = False,
+) -> MetadataSnapshot:
+    """
+    Scan the json files of the BigEarthNet-S1/S2 archive in `root_dir` once
+    and save their `MetadataSnapshot` to `file_path`.
+    """
+    snapshot = build_metadata_snapshot(
+        root_dir, sentinel_source, max_workers=max_workers, use_processes=use_processes
+    )
+    save_metadata_snapshot(snapshot, file_path)
+    return snapshot
+
+
+class SnapshotUpdate(NamedTuple):
+    """
+    Result of `update_metadata_snapshot` with the names of the patches whose
+    json files were `added`, `changed` or `removed` since the last scan.
+    """
+
+    snapshot: MetadataSnapshot
+    added: List[str]
+    changed: List[str]
+    removed: List[str]
+
+
+def update_metadata_snapshot(
+    root_dir: Path,
+    sentinel_source: ben_constants.SentinelSource,
+    file_path: Path,
+    max_workers: Optional[int] = None,
+    use_processes: bool = False,
+) -> SnapshotUpdate:
+    """
+    Incrementally update the `MetadataSnapshot` in `file_path` to the current state of the
+    BigEarthNet-S1/S2 archive in `root_dir`.
+    Only the json files whose modification time or size differs from the manifest of the
+    snapshot and the json files of new patch directories are read.
+    The rows of removed patch directories and of patch directories without a json file,
+    for example of a partially re-synced archive, are dropped.
+    If `file_path` does not exist yet, the complete archive is scanned like with
+    `write_metadata_snapshot`.
+
+    The updated snapshot is saved atomically to `file_path`, only if anything changed.
+    Raises a `ValueError` if `file_path` is not a snapshot of the `sentinel_source`.
+    """
+    sentinel_source = ben_constants.SentinelSource(sentinel_source)
+    file_path = Path(file_path)
+    patch_dirs = _patch_directories(root_dir, sentinel_source)
+    mtime_ns, size = _stat_patch_jsons(patch_dirs, max_workers)
+    # patches without a json file are not part of the archive
+    has_json = mtime_ns >= 0
+    if not has_json.all():
+        patch_dirs = [p for p, exists in zip(patch_dirs, has_json.tolist()) if exists]
+        mtime_ns, size = mtime_ns[has_json], size[has_json]
+    if not file_path.exists():
+        snapshot = build_metadata_snapshot(
+            patch_dirs, sentinel_source, max_workers, use_processes
+        )
+        save_metadata_snapshot(snapshot, file_path)
+        return SnapshotUpdate(snapshot, [p.name for p in patch_dirs], [], [])
+
+    # read into memory, as the file is replaced
+    snapshot = load_metadata_snapshot(file_path, mmap_mode=None)
+    if snapshot.sentinel_source != sentinel_source:
+        raise ValueError(
+            f"{file_path} is a snapshot of {snapshot.sentinel_source}, not of {sentinel_source}!"
+        )
+    names = _as_bytes_array([p.name for p in patch_dirs])
+    rows = snapshot.get_rows(names)
+    known = rows >= 0
+    unchanged = known.copy()
+    unchanged[known] = (snapshot.mtime_ns[rows[known]] == mtime_ns[known]) & (
+        snapshot.size[rows[known]] == size[known]
+    )
+    present = np.zeros(len(snapshot), dtype=bool)
+    present[rows[known]] = True
+
+    update = SnapshotUpdate(
+        snapshot,
+        added=[n.decode() for n in names[~known].tolist()],
+        changed=[n.decode() for n in names[known & ~unchanged].tolist()],
+        removed=[n.decode() for n in snapshot.names[~present].tolist()],
+    )
+    if unchanged.all() and present.all():
+        return update
+    new_rows = build_metadata_snapshot(
+        [p for p, is_unchanged in zip(patch_dirs, unchanged) if not is_unchanged],
+        sentinel_source,
+        max_workers,
+        use_processes,
+    )
+    snapshot = _merge_snapshots(snapshot, rows[unchanged], new_rows)
+    save_metadata_snapshot(snapshot, file_path)
+    return update._replace(snapshot=snapshot)
+
+
+def write_metadata_snapshot_cli():
+    # the command line dependencies are only imported by the entry points
+    import typer
+
+    app = typer.Typer(name="ben_build_metadata_snapshot", rich_markup_mode="markdown")
+    app.command()(write_metadata_snapshot)
+    app()
+
+
+def update_metadata_snapshot_cli():
+    import typer
+
+    app = typer.Typer(name="ben_update_metadata_snapshot", rich_markup_mode="markdown")
+    app.command()(update_metadata_snapshot)
+    app()
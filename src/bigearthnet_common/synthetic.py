@@ -0,0 +1,254 @@
+"""
+BigEarthNet Synthetic Archives:
+
+Generate structurally valid BigEarthNet-S1/S2 archive directories for local load testing,
+without downloading the complete archive.
+
+The patch directories use the *real* patch names of the packaged metadata and contain
+schema-correct `_labels_metadata.json` files and placeholder band files with the sizes of the
+original GeoTIFF files.
+The band files only contain zeros and are *not* valid GeoTIFF files.
+The JSON files contain plausible but synthetic labels, coordinates and scene names.
+Patches without a 19-class target only receive labels that have no 19-class counterpart.
+Like in the original S1 archive, the S1 coordinates use the `lly` key instead of `lry`.
+
+The generated archives are deterministic for a given `fraction` and `seed`.
+"""
+
+import concurrent.futures
+import json
+import random
+import re
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import bigearthnet_common.base as ben_base
+import bigearthnet_common.constants as ben_constants
+import bigearthnet_common.metadata as ben_metadata
+
+# file sizes of the GeoTIFF bands of the original archive in bytes
+S2_BAND_FILE_SIZES: Dict[str, int] = {
+    **{band: 29_192 for band in ben_constants.BEN_10m_CHANNELS},
+    **{band: 7_560 for band in ben_constants.BEN_20m_CHANNELS},
+    **{band: 1_160 for band in ben_constants.BEN_60m_CHANNELS},
+}
+S1_BAND_FILE_SIZES: Dict[str, int] = {"VV": 58_024, "VH": 58_024}
+
+MAX_LABELS_PER_PATCH = 6
+
+_LABELS_WITH_19_CLASS_TARGET = tuple(
+    label for label, new in ben_constants.OLD2NEW_LABELS_DICT.items() if new is not None
+)
+_LABELS_WITHOUT_19_CLASS_TARGET = tuple(
+    label for label, new in ben_constants.OLD2NEW_LABELS_DICT.items() if new is None
+)
+_UTM_PROJECTION = (
+    'PROJCS["WGS 84 / UTM zone {zone}N",GEOGCS["WGS 84",DATUM["WGS_1984",'
+    'SPHEROID["WGS 84",6378137,298.257223563,AUTHORITY["EPSG","7030"]],'
+    'AUTHORITY["EPSG","6326"]],PRIMEM["Greenwich",0,AUTHORITY["EPSG","8901"]],'
+    'UNIT["degree",0.0174532925199433,AUTHORITY["EPSG","9122"]],AXIS["Latitude",NORTH],'
+    'AXIS["Longitude",EAST],AUTHORITY["EPSG","4326"]],PROJECTION["Transverse_Mercator"],'
+    'PARAMETER["latitude_of_origin",0],PARAMETER["central_meridian",{central_meridian}],'
+    'PARAMETER["scale_factor",0.9996],PARAMETER["false_easting",500000],'
+    'PARAMETER["false_northing",0],UNIT["metre",1,AUTHORITY["EPSG","9001"]],'
+    'AXIS["Easting",EAST],AXIS["Northing",NORTH],AUTHORITY["EPSG","326{zone:02}"]]'
+)
+# upper left corner of the patch grid of a tile
+_GRID_ORIGIN = (300_000, 5_500_000)
+
+
+def _acquisition_datetime(match: "re.Match") -> datetime:
+    # the seconds can be 60 or 61 in the archive, so they are added to the datetime
+    return datetime(
+        int(match["year"]),
+        int(match["month"]),
+        int(match["day"]),
+        int(match["hour"]),
+        int(match["minute"]),
+    ) + timedelta(seconds=int(match["second"]))
+
+
+def _patch_coordinates(match: "re.Match") -> Tuple[int, int, int, int]:
+    ulx = _GRID_ORIGIN[0] + int(match["horizontal_id"]) * ben_constants.BEN_PATCH_SIZE_M
+    uly = _GRID_ORIGIN[1] - int(match["vertical_id"]) * ben_constants.BEN_PATCH_SIZE_M
+    return (
+        ulx,
+        uly,
+        ulx + ben_constants.BEN_PATCH_SIZE_M,
+        uly - ben_constants.BEN_PATCH_SIZE_M,
+    )
+
+
+def _sample_labels(rng: random.Random, has_19_class_target: bool) -> List[str]:
+    if not has_19_class_target:
+        return sorted(rng.sample(_LABELS_WITHOUT_19_CLASS_TARGET, rng.randint(1, 2)))
+    # at least one label has a 19-class counterpart
+    labels = {rng.choice(_LABELS_WITH_19_CLASS_TARGET)}
+    labels.update(
+        rng.sample(
+            ben_constants.OLD_LABELS_ORIGINAL_ORDER,
+            rng.randint(0, MAX_LABELS_PER_PATCH - 1),
+        )
+    )
+    return [
+        label for label in ben_constants.OLD_LABELS_ORIGINAL_ORDER if label in labels
+    ]
+
+
+def s1_patch_metadata(
+    s1_patch_name: str, s2_patch_name: str, labels: Sequence[str]
+) -> ben_base.BEN_JSON_DATA:
+    """
+    Return synthetic but schema-correct BigEarthNet-S1 JSON data for the patch `s1_patch_name`.
+    """
+    s1_match = ben_constants.BEN_S1_RE.fullmatch(s1_patch_name)
+    if s1_match is None:
+        raise ValueError(f"{s1_patch_name} is not a valid S1 patch name!")
+    start = _acquisition_datetime(s1_match)
+    stamp = f"{start:%Y%m%dT%H%M%S}"
+    ulx, uly, lrx, lry = _patch_coordinates(s1_match)
+    zone = int(s1_match["sentinel_2_l1c_tile_area"][:2])
+    return {
+        "labels": list(labels),
+        # the original S1 archive uses the `lly` key instead of `lry`
+        "coordinates": {"ulx": ulx, "uly": uly, "lrx": lrx, "lly": lry},
+        "projection": _UTM_PROJECTION.format(
+            zone=zone, central_meridian=zone * 6 - 183
+        ),
+        "corresponding_s2_patch": s2_patch_name,
+        "scene_source": f"{s1_match['sentinel_mission']}_IW_GRDH_1SDV_{stamp}_{start + timedelta(seconds=25):%Y%m%dT%H%M%S}_000000_000000_0000",
+        "acquisition_time": f"{start:%Y-%m-%dT%H:%M:%S}",
+    }
+
+
+def s2_patch_metadata(
+    s2_patch_name: str, s1_patch_name: str, labels: Sequence[str]
+) -> ben_base.BEN_JSON_DATA:
+    """
+    Return synthetic but schema-correct BigEarthNet-S2 JSON data for the patch `s2_patch_name`.
+    The projection and tile are taken from the corresponding `s1_patch_name`.
+    """
+    s2_match = ben_constants.BEN_S2_RE.fullmatch(s2_patch_name)
+    s1_match = ben_constants.BEN_S1_RE.fullmatch(s1_patch_name)
+    if s2_match is None:
+        raise ValueError(f"{s2_patch_name} is not a valid S2 patch name!")
+    if s1_match is None:
+        raise ValueError(f"{s1_patch_name} is not a valid S1 patch name!")
+    start = _acquisition_datetime(s2_match)
+    stamp = f"{start:%Y%m%dT%H%M%S}"
+    ulx, uly, lrx, lry = _patch_coordinates(s2_match)
+    tile = s1_match["sentinel_2_l1c_tile_area"]
+    zone = int(tile[:2])
+    return {
+        "labels": list(labels),
+        "coordinates": {"ulx": ulx, "uly": uly, "lrx": lrx, "lry": lry},
+        "projection": _UTM_PROJECTION.format(
+            zone=zone, central_meridian=zone * 6 - 183
+        ),
+        "tile_source": f"{s2_match['sentinel_mission']}_MSIL1C_{stamp}_N0205_R000_T{tile}_{stamp}.SAFE",
+        "acquisition_date": f"{start:%Y-%m-%d %H:%M:%S}",
+    }
+
+
+def _write_placeholder(file_path: Path, size: int, sparse: bool) -> None:
+    with open(file_path, "wb") as f:
+        if sparse:
+            f.truncate(size)
+        else:
+            f.write(bytes(size))
+
+
+def _write_patches(
+    root_dir: Path,
+    sentinel_source: ben_constants.SentinelSource,
+    patches: Sequence[Tuple[int, str, str, bool]],
+    seed: int,
+    sparse: bool,
+) -> None:
+    is_s2 = sentinel_source == ben_constants.SentinelSource.S2
+    band_file_sizes = S2_BAND_FILE_SIZES if is_s2 else S1_BAND_FILE_SIZES
+    for id, s1_name, s2_name, has_19_class_target in patches:
+        # seeding per patch keeps the output independent of the number of workers
+        labels = _sample_labels(
+            random.Random(seed * ben_constants.BEN_COMPLETE_SIZE + id),
+            has_19_class_target,
+        )
+        if is_s2:
+            name, metadata = s2_name, s2_patch_metadata(s2_name, s1_name, labels)
+        else:
+            name, metadata = s1_name, s1_patch_metadata(s1_name, s2_name, labels)
+        patch_dir = root_dir / name
+        patch_dir.mkdir(exist_ok=True)
+        (patch_dir / f"{name}_labels_metadata.json").write_text(json.dumps(metadata))
+        for band, size in band_file_sizes.items():
+            _write_placeholder(patch_dir / f"{name}_{band}.tif", size, sparse)
+
+
+def generate_synthetic_archive(
+    root_dir: Path,
+    sentinel_source: ben_constants.SentinelSource,
+    fraction: float = 1.0,
+    seed: int = 0,
+    sparse: bool = True,
+    max_workers: Optional[int] = None,
+) -> List[str]:
+    """
+    Generate a synthetic BigEarthNet-S1/S2 archive with a `fraction` of all patches in `root_dir`.
+    The patches are drawn at random with the given `seed` from the packaged patch names.
+    Every patch directory contains a `_labels_metadata.json` file and a placeholder file
+    for each band with the size of the original band file.
+    If `sparse` is set, the placeholder files are created as sparse files, which take
+    (almost) no disk space. Otherwise, they are filled with zeros.
+    The patch directories are written by `max_workers` threads.
+
+    Returns the generated patch names in the order of the metadata table.
+    """
+    if not 0 < fraction <= 1:
+        raise ValueError(f"The fraction must be in (0, 1], but is {fraction}!")
+    sentinel_source = ben_constants.SentinelSource(sentinel_source)
+    table = ben_base.get_metadata_table()
+    num_patches = max(1, round(fraction * len(table)))
+    rng = np.random.default_rng(seed)
+    ids = np.sort(rng.choice(len(table), size=num_patches, replace=False))
+    has_19_class_target = (
+        table.flags[ids] & ben_metadata.PatchFlag.no_19_class_target
+    ) == 0
+    s1_names, s2_names = (
+        [n.decode() for n in table.get_names(source, ids).tolist()]
+        for source in (ben_constants.SentinelSource.S1, ben_constants.SentinelSource.S2)
+    )
+    patches = list(zip(ids.tolist(), s1_names, s2_names, has_19_class_target.tolist()))
+
+    root_dir = Path(root_dir)
+    root_dir.mkdir(parents=True, exist_ok=True)
+    chunk_size = 1_000
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as executor:
+        futures = [
+            executor.submit(
+                _write_patches,
+                root_dir,
+                sentinel_source,
+                patches[i : i + chunk_size],
+                seed,
+                sparse,
+            )
+            for i in range(0, len(patches), chunk_size)
+        ]
+        for future in futures:
+            future.result()
+    is_s2 = sentinel_source == ben_constants.SentinelSource.S2
+    return [s2_name if is_s2 else s1_name for _, s1_name, s2_name, _ in patches]
+
+
+def generate_synthetic_archive_cli():
+    # the command line dependencies are only imported by the entry points
+    import typer
+
+    app = typer.Typer(
+        name="ben_generate_synthetic_archive", rich_markup_mode="markdown"
+    )
+    app.command()(generate_synthetic_archive)
+    app()
@@ -1,15 +1,41 @@
+import concurrent.futures
+import os
+import subprocess
+import sys
+import threading
+import time
+import warnings
 from datetime import date
 from importlib import resources
 from typing import Counter
 
 import fastcore.test as fc_test
+import numpy as np
 import pytest
 from dateutil.parser import ParserError
 from pydantic import ValidationError
 from rich.table import Table
 
 import bigearthnet_common
+import bigearthnet_common._cache as ben_cache
+from bigearthnet_common._cache import cached_resource
 from bigearthnet_common.base import *
+from bigearthnet_common.base import (
+    _METADATA_CACHE_TMP_MAX_AGE,
+    _get_csv_column,
+    _get_metadata_cache_key,
+    _read_header_bz2_csv_resource,
+    describe_patch,
+)
+from bigearthnet_common.metadata import (
+    COUNTRY_NAMES,
+    NO_SPLIT,
+    SEASON_NAMES,
+    SPLIT_NAMES,
+    UNRECOMMENDED_FLAGS,
+    PatchFlag,
+)
+from bigearthnet_common.synthetic import generate_synthetic_archive
 
 
 @pytest.fixture
@@ -47,6 +73,241 @@ def test_available_resources(resource):
     assert resources.is_resource(bigearthnet_common, resource)
 
 
+def test_mapping_resource_is_parsed_once(tmp_path, monkeypatch):
+    import bigearthnet_common.base as ben_base
+
+    calls = []
+
+    def _counting_reader(resource):
+        calls.append(resource)
+        return _read_header_bz2_csv_resource(resource)
+
+    monkeypatch.setattr(ben_base, "_read_header_bz2_csv_resource", _counting_reader)
+    # ensure that the table is not loaded from the persistent cache
+    monkeypatch.setattr(ben_base, "METADATA_CACHE_DIR", tmp_path)
+    get_metadata_table.cache_clear()
+    get_complete_s1_to_s2_patch_name_mapping()
+    get_complete_s2_to_s1_patch_name_mapping()
+    get_patches_to_country_mapping(use_s2_patch_names=True)
+    get_patches_to_country_mapping(use_s2_patch_names=False)
+    get_patches_to_season_mapping(use_s2_patch_names=True)
+    get_patches_to_season_mapping(use_s2_patch_names=False)
+    get_all_s1_patch_names()
+    get_all_s2_patch_names()
+    assert calls == [Resource.s1_s2_mapping]
+    get_metadata_table.cache_clear()
+
+
+def test_unknown_resource_column():
+    with pytest.raises(ValueError, match="unknown"):
+        _get_csv_column({"s1_name": []}, "unknown")
+
+
+def test_metadata_table_views_pickle_to_builtins():
+    import pickle
+
+    snowy = pickle.loads(pickle.dumps(get_s2_patches_with_seasonal_snow()))
+    assert isinstance(snowy, set)
+    assert len(snowy) == ben_constants.BEN_SNOWY_PATCHES_COUNT
+    country_mapping = pickle.loads(pickle.dumps(get_patches_to_country_mapping()))
+    assert isinstance(country_mapping, dict)
+    assert country_mapping["S2A_MSIL2A_20171221T112501_56_35"] == "Portugal"
+
+
+@pytest.fixture
+def tmp_metadata_cache(tmp_path, monkeypatch):
+    import bigearthnet_common.base as ben_base
+    import bigearthnet_common.metadata as ben_metadata
+
+    s1_name = "S1A_IW_GRDH_1SDV_20171221T064238_29SND_56_35"
+    s2_name = "S2A_MSIL2A_20171221T112501_56_35"
+    builds = []
+
+    def _build_tiny_table():
+        builds.append(1)
+        return ben_metadata.build_metadata_table(
+            [s1_name], [s2_name], ["Portugal"], ["Winter"], {}, {}
+        )
+
+    cache_dir = tmp_path / "metadata_cache"
+    monkeypatch.setattr(ben_base, "METADATA_CACHE_DIR", cache_dir)
+    monkeypatch.setattr(ben_base, "_build_metadata_table", _build_tiny_table)
+    get_metadata_table.cache_clear()
+    yield cache_dir, builds
+    get_metadata_table.cache_clear()
+
+
+def test_metadata_cache_roundtrip(tmp_metadata_cache):
+    cache_dir, builds = tmp_metadata_cache
+    (cache_dir / f"{bigearthnet_common.__version__}-stale").mkdir(parents=True)
+
+    table = get_metadata_table()
+    assert len(builds) == 1
+    entries = list(cache_dir.iterdir())
+    assert len(entries) == 1
+    assert entries[0].name == _get_metadata_cache_key()
+
+    get_metadata_table.cache_clear()
+    cached_table = get_metadata_table()
+    assert len(builds) == 1
+    for name in ("names", "name_row", "s1_position", "country", "season", "split"):
+        assert (getattr(table, name) == getattr(cached_table, name)).all()
+
+
+def test_metadata_cache_eviction(tmp_metadata_cache):
+    cache_dir, _ = tmp_metadata_cache
+    other_version_entry = cache_dir / f"0.0.0-{'0' * 32}"
+    # written before the entries were prefixed with the version
+    unversioned_entry = cache_dir / ("c2d768e8" * 4)
+    fresh_tmp_dir = cache_dir / ".tmp-fresh"
+    old_tmp_dir = cache_dir / ".tmp-old"
+    for entry in (other_version_entry, unversioned_entry, fresh_tmp_dir, old_tmp_dir):
+        entry.mkdir(parents=True)
+    old = time.time() - 2 * _METADATA_CACHE_TMP_MAX_AGE
+    os.utime(old_tmp_dir, (old, old))
+
+    get_metadata_table()
+    assert {entry.name for entry in cache_dir.iterdir()} == {
+        _get_metadata_cache_key(),
+        other_version_entry.name,
+        fresh_tmp_dir.name,
+    }
+
+
+def test_metadata_cache_invalid_entry(tmp_metadata_cache):
+    cache_dir, builds = tmp_metadata_cache
+    get_metadata_table()
+    (cache_dir / _get_metadata_cache_key() / "names.npy").write_text("corrupted")
+    get_metadata_table.cache_clear()
+    assert len(get_metadata_table()) == 1
+    assert len(builds) == 2
+
+
+def test_metadata_cache_is_memory_mapped(tmp_metadata_cache):
+    cache_dir, _ = tmp_metadata_cache
+    table = get_metadata_table()
+    assert table.mmap_directory == cache_dir / _get_metadata_cache_key()
+    assert not table.names.flags.writeable
+
+
+def test_metadata_cache_without_mmap(tmp_metadata_cache, monkeypatch):
+    monkeypatch.setenv(METADATA_MMAP_ENV_VAR, "0")
+    get_metadata_table()
+    get_metadata_table.cache_clear()
+    table = get_metadata_table()
+    assert table.mmap_directory is None
+    assert table.names.flags.writeable
+
+
+def _call_concurrently(func, num_threads: int = 16) -> list:
+    """Call `func` from `num_threads` threads at once and return all results."""
+    barrier = threading.Barrier(num_threads)
+
+    def _call():
+        barrier.wait()
+        return func()
+
+    with concurrent.futures.ThreadPoolExecutor(num_threads) as pool:
+        futures = [pool.submit(_call) for _ in range(num_threads)]
+        return [f.result() for f in futures]
+
+
+def test_metadata_table_single_flight(tmp_metadata_cache, monkeypatch):
+    import bigearthnet_common.base as ben_base
+
+    _, builds = tmp_metadata_cache
+    build_tiny_table = ben_base._build_metadata_table
+
+    def _slow_build():
+        time.sleep(0.1)
+        return build_tiny_table()
+
+    monkeypatch.setattr(ben_base, "_build_metadata_table", _slow_build)
+    tables = _call_concurrently(get_metadata_table)
+    assert len(builds) == 1
+    assert all(table is tables[0] for table in tables)
+
+
+def test_patch_name_sets_single_flight():
+    get_s2_patches_with_seasonal_snow.cache_clear()
+    snowy = _call_concurrently(get_s2_patches_with_seasonal_snow)
+    assert all(s is snowy[0] for s in snowy)
+    assert get_s2_patches_with_seasonal_snow() is snowy[0]
+
+
+def test_cached_resource_single_flight(monkeypatch):
+    # keep the test resource out of the global stats registry
+    monkeypatch.setattr(ben_cache, "_RESOURCE_COUNTERS", {})
+    calls = []
+
+    @cached_resource
+    def _loader():
+        calls.append(1)
+        time.sleep(0.05)
+        if len(calls) == 1:
+            raise OSError("first load fails")
+        return object()
+
+    # the failed load is not cached, the following load is shared by all waiting callers
+    with pytest.raises(OSError):
+        _call_concurrently(_loader)
+    assert len(calls) == 2
+    assert _loader() is _loader()
+    assert len(calls) == 2
+    _loader.cache_clear()
+    _loader()
+    assert len(calls) == 3
+
+
+def _private_memory_mb():
+    """Return the private resident memory of the process in MB or `None` if unknown."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("RssAnon:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    return None
+
+
+def _spawned_worker_lookup(s2_name):
+    import bigearthnet_common.base as ben_base
+
+    table = ben_base.get_metadata_table()
+    before = _private_memory_mb()
+    s1_name = ben_base.s2_to_s1_patch_name(s2_name)
+    ben_base.is_snowy_patch(s1_name)
+    ben_base.get_country_from_patch_name(s2_name)
+    after = _private_memory_mb()
+    growth = None if before is None else after - before
+    return table.mmap_directory, s1_name, growth
+
+
+def test_spawned_workers_attach_to_memory_mapped_table():
+    import multiprocessing
+    from concurrent.futures import ProcessPoolExecutor
+
+    s2_name = "S2A_MSIL2A_20171221T112501_56_35"
+    table = get_metadata_table()
+    ctx = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=2, mp_context=ctx) as executor:
+        results = list(executor.map(_spawned_worker_lookup, [s2_name] * 2))
+    for mmap_directory, s1_name, growth in results:
+        assert mmap_directory == table.mmap_directory
+        assert s1_name == s2_to_s1_patch_name(s2_name)
+        # single-name lookups read the shared table and do not copy the names,
+        # which would take more than 100 MB
+        if growth is not None:
+            assert growth < 32
+
+
+def test_metadata_cache_key_depends_on_version(monkeypatch):
+    key = _get_metadata_cache_key()
+    monkeypatch.setattr(bigearthnet_common, "__version__", "0.0.0")
+    assert key != _get_metadata_cache_key()
+
+
 def test_parse_valid_datetime():
     d1 = parse_datetime("2017-06-13 10:10:31")
     d2 = parse_datetime("13.06.2017 10:10:31")
@@ -69,6 +330,43 @@ def test_parse_invalid_datetime_format():
         parse_datetime(time)
 
 
+@pytest.mark.parametrize(
+    "time", ["2017-06-13 10:10:31", "2017-06-13T10:10:31", "2016-02-29T23:59:59"]
+)
+def test_parse_fixed_format_datetime(time):
+    import dateutil.parser
+
+    assert parse_datetime(time) == dateutil.parser.parse(time)
+
+
+def test_parse_datetimes():
+    inputs = [
+        "2017-06-13 10:10:31",
+        "2017-06-13T16:50:43",
+        "13.06.2017 10:10:31",
+        "2017-06-13T10:10:31+02:00",
+        datetime(year=2017, month=6, day=13),
+    ]
+    times = parse_datetimes(inputs)
+    assert times.dtype == np.dtype("datetime64[s]")
+    assert times.tolist() == [
+        datetime(2017, 6, 13, 10, 10, 31),
+        datetime(2017, 6, 13, 16, 50, 43),
+        datetime(2017, 6, 13, 10, 10, 31),
+        datetime(2017, 6, 13, 8, 10, 31),
+        datetime(2017, 6, 13),
+    ]
+    assert len(parse_datetimes([])) == 0
+
+
+@pytest.mark.parametrize(
+    "time", ["2017-13-13 10:10:31", "2017-02-29T10:10:31", "2017-06-13T10:10:60"]
+)
+def test_parse_datetimes_out_of_range(time):
+    with pytest.raises(ParserError):
+        parse_datetimes(["2017-06-13 10:10:31", time])
+
+
 def test_read_S2_json(s2_json_path):
     s2_data = read_S2_json(s2_json_path)
     assert all(k in ben_constants.BEN_S2_V1_0_JSON_KEYS for k in s2_data)
@@ -91,6 +389,50 @@ def test_read_S1_invalid_json(s2_json_path):
         read_S1_json(s2_json_path)
 
 
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_read_S1_jsons(s1_json_folder, use_processes):
+    patch_dirs = sorted(get_s1_patch_directories(s1_json_folder))
+    records = list(read_S1_jsons(s1_json_folder, use_processes=use_processes))
+    assert [name for name, _ in records] == [p.name for p in patch_dirs]
+    for (_, data), patch_dir in zip(records, patch_dirs):
+        assert data == read_S1_json(
+            patch_dir / f"{patch_dir.name}_labels_metadata.json"
+        )
+        assert "lry" in data["coordinates"]
+
+
+def test_read_S2_jsons_keeps_order(s2_json_folder):
+    patch_dirs = sorted(get_s2_patch_directories(s2_json_folder), reverse=True)
+    records = list(read_S2_jsons(patch_dirs * 3, max_workers=2, chunk_size=1))
+    assert [name for name, _ in records] == [p.name for p in patch_dirs * 3]
+
+
+@pytest.mark.parametrize("use_processes", [False, True])
+def test_read_jsons_intern_strings(tmp_path, use_processes):
+    generate_synthetic_archive(tmp_path, "S2", fraction=0.0002)
+    records = [
+        data
+        for _, data in read_S2_jsons(
+            tmp_path, use_processes=use_processes, intern_strings=True, chunk_size=8
+        )
+    ]
+    assert records == [data for _, data in read_S2_jsons(tmp_path)]
+    for key in ["projection", "tile_source"]:
+        values = {}
+        for data in records:
+            assert values.setdefault(data[key], data[key]) is data[key]
+
+
+def test_read_S2_jsons_checks_keys(s1_json_folder):
+    with pytest.raises(ValueError, match="missing entries"):
+        list(read_S2_jsons(get_s1_patch_directories(s1_json_folder)))
+
+
+def test_read_jsons_invalid_chunk_size(s2_json_folder):
+    with pytest.raises(ValueError):
+        read_S2_jsons(s2_json_folder, chunk_size=0)
+
+
 def test_get_s2_patch_directories(s2_json_folder, s1_json_folder):
     assert len(get_s2_patch_directories(s2_json_folder)) == 2
     assert len(get_s2_patch_directories(s1_json_folder)) == 0
@@ -430,6 +772,17 @@ def test_validate_ben_s2_root_directory(s2_json_folder):
     )
 
 
+def test_example_patch_files_are_complete():
+    from bigearthnet_common.base import _are_s1_files_complete, _are_s2_files_complete
+    from bigearthnet_common.example_data import (
+        get_s1_example_patch_path,
+        get_s2_example_patch_path,
+    )
+
+    assert _are_s1_files_complete(get_s1_example_patch_path())
+    assert _are_s2_files_complete(get_s2_example_patch_path())
+
+
 @pytest.mark.parametrize(
     "inp",
     [
@@ -455,3 +808,216 @@ def test_describe_patch_invalid_name():
 def test_describe_patch_invalid_type():
     with pytest.raises(ValidationError):
         describe_patch("not-a-list")
+
+
+# dependencies that are only required by the CLI and presentation functions
+LAZY_MODULES = ("click", "dateutil", "fastcore", "natsort", "pydantic", "rich", "typer")
+
+
+def _import_time_and_modules(statement: str):
+    """
+    Import `statement` in a fresh interpreter and return the total import time in seconds
+    and the top-level names of all imported modules.
+    """
+    proc = subprocess.run(
+        [
+            sys.executable,
+            "-X",
+            "importtime",
+            "-c",
+            f"{statement}; import sys; print(*sys.modules)",
+        ],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    total_us = 0
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative_us, name = line.split("|")
+        # only sum up the modules that were not imported by another module
+        if not name.startswith("  "):
+            total_us += int(cumulative_us)
+    return total_us / 1e6, {m.split(".")[0] for m in proc.stdout.split()}
+
+
+def test_base_import_is_lean():
+    base_time, modules = _import_time_and_modules("import bigearthnet_common.base")
+    assert modules.isdisjoint(LAZY_MODULES), modules & set(LAZY_MODULES)
+    lazy_time, _ = _import_time_and_modules(f"import {', '.join(LAZY_MODULES)}")
+    assert base_time < lazy_time
+
+
+def test_cli_functions_are_loaded_on_access():
+    import bigearthnet_common.base as ben_base
+    import bigearthnet_common.cli as ben_cli
+
+    assert ben_base.describe_patch is ben_cli.describe_patch
+    assert ben_base.describe_patch_cli is ben_cli.describe_patch_cli
+    with pytest.raises(AttributeError):
+        ben_base.not_a_function
+
+
+BATCH_PATCH_NAMES = [
+    "S2A_MSIL2A_20180205T100211_2_0",
+    "S1A_IW_GRDH_1SDV_20180417T155012_34WFV_59_20",
+    "S2B_MSIL2A_20170906T101019_33_85",
+    "S2A_MSIL2A_20171221T112501_56_35",
+    "S1A_IW_GRDH_1SDV_20170716T180622_29UPV_72_73",
+    "S2A_MSIL2A_20170717T113321_28_87",
+    "S2B_MSIL2A_20170812T092029_75_6",
+    "S1B_IW_GRDH_1SDV_20170701T182622_29SND_64_30",
+]
+
+
+@pytest.mark.parametrize(
+    "batch_func,func,names",
+    [
+        (get_countries_from_patch_names, get_country_from_patch_name, COUNTRY_NAMES),
+        (get_seasons_from_patch_names, get_season_from_patch_name, SEASON_NAMES),
+    ],
+)
+def test_batch_category_lookup(batch_func, func, names):
+    codes = batch_func(np.array(BATCH_PATCH_NAMES))
+    assert codes.dtype == np.uint8
+    assert [names[c] for c in codes] == [func(p) for p in BATCH_PATCH_NAMES]
+    assert len(batch_func([])) == 0
+    with pytest.raises(KeyError, match="hello"):
+        batch_func(BATCH_PATCH_NAMES + ["hello"])
+
+
+@pytest.mark.parametrize(
+    "batch_func,func",
+    [
+        (are_snowy_patches, is_snowy_patch),
+        (are_cloudy_shadowy_patches, is_cloudy_shadowy_patch),
+        (have_19_class_targets, has_19_class_target),
+    ],
+)
+def test_batch_flag_lookup(batch_func, func):
+    inp = BATCH_PATCH_NAMES + ["hello"]
+    flags = batch_func(inp)
+    assert flags.dtype == bool
+    assert flags.tolist() == [func(p) for p in inp]
+
+
+def test_batch_split_lookup():
+    inp = BATCH_PATCH_NAMES + ["hello"]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected = [get_original_split_from_patch_name(p) for p in inp]
+    num_without_split = expected.count(None)
+    with pytest.warns(UserWarning, match=f"Provided {num_without_split} input patch"):
+        codes = get_original_splits_from_patch_names(inp)
+    assert codes.dtype == np.int8
+    assert [None if c == NO_SPLIT else SPLIT_NAMES[c] for c in codes] == expected
+
+
+def test_match_patch_flags():
+    inp = BATCH_PATCH_NAMES + ["hello"]
+    recommended = match_patch_flags(inp, exclude=UNRECOMMENDED_FLAGS)
+    assert recommended.dtype == bool
+    assert recommended.tolist() == [
+        p != "hello"
+        and not is_snowy_patch(p)
+        and not is_cloudy_shadowy_patch(p)
+        and has_19_class_target(p)
+        for p in inp
+    ]
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        splits = [get_original_split_from_patch_name(p) for p in inp]
+    snowy_train = match_patch_flags(
+        inp, include=PatchFlag.train, exclude=PatchFlag.seasonal_snow
+    )
+    assert snowy_train.tolist() == [
+        s == "train" and not is_snowy_patch(p) for p, s in zip(inp, splits)
+    ]
+    assert not match_patch_flags(["hello"]).any()
+
+
+def test_get_patch_names_by_flags():
+    recommended = get_patch_names_by_flags("S2", exclude=UNRECOMMENDED_FLAGS)
+    assert len(recommended) == len(get_all_s2_patch_names()) - len(
+        get_s2_patches_with_seasonal_snow()
+        | get_s2_patches_with_cloud_and_shadow()
+        | get_s2_patches_with_no_19_class_target()
+    )
+    assert (
+        get_patch_names_by_flags("S1", include=PatchFlag.test)
+        == get_s1_patches_from_original_test_split()
+    )
+
+
+def test_summarize_split_warnings():
+    inp = BATCH_PATCH_NAMES + ["hello"]
+    num_without_split = (
+        np.count_nonzero(
+            match_patch_flags(
+                inp, exclude=PatchFlag.train | PatchFlag.validation | PatchFlag.test
+            )
+        )
+        + 1
+    )
+    with warnings.catch_warnings(record=True) as record:
+        warnings.simplefilter("always")
+        with summarize_split_warnings():
+            splits = [get_original_split_from_patch_name(p) for p in inp]
+    assert splits.count(None) == num_without_split
+    assert len(record) == 1
+    assert f"Provided {num_without_split} input patch names" in str(record[0].message)
+    # the per-patch warnings are restored after the context exits
+    with pytest.warns(UserWarning, match="Provided an input patch name"):
+        get_original_split_from_patch_name("hello")
+
+
+def test_prewarm():
+    loads = prewarm()
+    assert {"metadata_table", "metadata_index"} <= loads.keys()
+    assert "get_s2_patches_with_seasonal_snow" in loads
+    table = get_metadata_table()
+    assert loads["metadata_table"].rows == len(table)
+    assert loads["metadata_table"].nbytes == table.nbytes
+    assert loads["get_s1_patches_from_original_test_split"].rows == len(
+        get_s1_patches_from_original_test_split()
+    )
+    for name, load in loads.items():
+        assert load.name == name
+        assert load.seconds >= 0
+
+
+def test_prewarm_in_background():
+    future = prewarm(background=True, max_workers=2)
+    loads = future.result(timeout=600)
+    assert loads.keys() == prewarm().keys()
+
+
+def test_get_patch_metadata():
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        for patch_name in BATCH_PATCH_NAMES:
+            metadata = get_patch_metadata(patch_name)
+            assert patch_name in (metadata.s1_name, metadata.s2_name)
+            assert metadata.s2_name == s1_to_s2_patch_name(metadata.s1_name)
+            assert metadata.split == get_original_split_from_patch_name(patch_name)
+            assert metadata.country == get_country_from_patch_name(patch_name)
+            assert metadata.season == get_season_from_patch_name(patch_name)
+            assert metadata.snowy == is_snowy_patch(patch_name)
+            assert metadata.cloudy_shadowy == is_cloudy_shadowy_patch(patch_name)
+            assert metadata.has_19_class_target == has_19_class_target(patch_name)
+    with pytest.raises(KeyError):
+        get_patch_metadata("hello")
+
+
+def test_get_patches_metadata():
+    records = get_patches_metadata(BATCH_PATCH_NAMES)
+    assert len(records) == len(BATCH_PATCH_NAMES)
+    for patch_name, record in zip(BATCH_PATCH_NAMES, records):
+        metadata = get_patch_metadata(patch_name)
+        assert record["s1_name"] == metadata.s1_name
+        assert record["s2_name"] == metadata.s2_name
+        assert COUNTRY_NAMES[record["country"]] == metadata.country
+        assert record["snowy"] == metadata.snowy
+    with pytest.raises(KeyError):
+        get_patches_metadata(BATCH_PATCH_NAMES + ["hello"])
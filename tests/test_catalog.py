@@ -0,0 +1,168 @@
+import pickle
+import shutil
+import sqlite3
+
+import pytest
+
+import bigearthnet_common.base as ben_base
+import bigearthnet_common.metadata as ben_metadata
+import bigearthnet_common.sets as ben_sets
+from bigearthnet_common.catalog import *
+from bigearthnet_common.snapshot import build_metadata_snapshot
+from bigearthnet_common.synthetic import generate_synthetic_archive
+
+
+@pytest.fixture(scope="module")
+def snapshot(tmp_path_factory):
+    root_dir = tmp_path_factory.mktemp("S2")
+    generate_synthetic_archive(root_dir, "S2", fraction=0.001)
+    return build_metadata_snapshot(root_dir, "S2")
+
+
+@pytest.fixture(scope="module")
+def catalog_path(tmp_path_factory, snapshot):
+    return build_catalog(tmp_path_factory.mktemp("catalog") / "ben.sqlite", [snapshot])
+
+
+@pytest.fixture
+def catalog(catalog_path):
+    with MetadataCatalog(catalog_path) as catalog:
+        yield catalog
+
+
+def test_query_matches_build_set(catalog):
+    filters = dict(countries=["Serbia", "Austria"], seasons=["Summer"])
+    for sentinel_source in ["S1", "S2"]:
+        assert catalog.query(sentinel_source, **filters) == list(
+            ben_sets.build_set(
+                sentinel_source, remove_unrecommended_dl_patches=False, **filters
+            )
+        )
+
+
+def test_recommended_patches(catalog):
+    assert catalog.query(exclude_flags=ben_metadata.UNRECOMMENDED_FLAGS) == list(
+        ben_sets.build_set("S2")
+    )
+
+
+def test_splits_and_flags(catalog):
+    test_patches = catalog.query(splits=["test"], countries=["Portugal"])
+    assert len(test_patches) > 0
+    assert all(
+        ben_base.get_original_split_from_patch_name(p) == "test" for p in test_patches
+    )
+    assert catalog.count(splits=["test"]) == len(
+        ben_base.get_s2_patches_from_original_test_split()
+    )
+    assert catalog.count(include_flags=ben_metadata.PatchFlag.seasonal_snow) == len(
+        ben_base.get_s2_patches_with_seasonal_snow()
+    )
+
+
+def test_labels(catalog, snapshot):
+    labels = ["Pastures", "Mixed forest"]
+    names = [n.decode() for n in snapshot.names.tolist()]
+    for kwargs, mask in (
+        ({"labels": labels}, snapshot.has_labels(labels)),
+        ({"all_labels": labels}, snapshot.has_labels(labels, match_all=True)),
+        ({"exclude_labels": labels}, ~snapshot.has_labels(labels)),
+    ):
+        expected = {n for n, m in zip(names, mask) if m}
+        result = catalog.query(**kwargs)
+        if "exclude_labels" in kwargs:
+            # patches without json data have no labels
+            assert expected <= set(result)
+        else:
+            assert set(result) == expected
+
+
+def test_acquisition_time(catalog):
+    names = catalog.query("S1", start="2017-07-01", end="2017-07-02 12:00")
+    assert len(names) > 0
+    for name in names:
+        timestamp = name.split("_")[4]
+        assert "20170701T000000" <= timestamp < "20170702T120000"
+
+
+def test_tiles(catalog):
+    names = catalog.query("S1", tiles=["33UUP"])
+    assert len(names) > 0
+    assert all(name.split("_")[5] == "33UUP" for name in names)
+
+
+def test_uses_indexes(catalog):
+    assert "patches_country" in catalog.explain(countries=["Portugal"])
+    assert "patch_labels" in catalog.explain(labels=["Agro-forestry areas"])
+
+
+def test_limit(catalog):
+    assert len(catalog.query(countries=["Portugal"], limit=3)) == 3
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [{"countries": ["Atlantis"]}, {"seasons": ["Monsoon"]}, {"labels": ["Unknown"]}],
+)
+def test_invalid_filters(catalog, kwargs):
+    with pytest.raises(ValueError):
+        catalog.query(**kwargs)
+
+
+def test_catalog_without_labels(catalog_path, tmp_path):
+    file_path = tmp_path / "no_labels.sqlite"
+    shutil.copyfile(catalog_path, file_path)
+    with sqlite3.connect(file_path) as connection:
+        connection.execute("UPDATE meta SET value = '0' WHERE key = 'has_labels'")
+    with MetadataCatalog(file_path) as catalog:
+        assert not catalog.has_labels
+        with pytest.raises(ValueError, match="no labels"):
+            catalog.query(labels=["Pastures"])
+
+
+def test_read_only(catalog):
+    with pytest.raises(sqlite3.OperationalError):
+        catalog.execute("DELETE FROM patches")
+
+
+def test_pickle(catalog):
+    unpickled = pickle.loads(pickle.dumps(catalog))
+    assert unpickled.count(countries=["Portugal"]) == catalog.count(
+        countries=["Portugal"]
+    )
+    unpickled.close()
+
+
+def test_invalid_catalog(tmp_path):
+    with pytest.raises(ValueError):
+        MetadataCatalog(tmp_path / "missing.sqlite")
+    file_path = tmp_path / "invalid.sqlite"
+    file_path.write_bytes(b"no catalog")
+    with pytest.raises(ValueError):
+        MetadataCatalog(file_path)
+
+
+def test_query_catalog_cli(catalog_path, capsys):
+    query_catalog(
+        countries=["Portugal"], seasons=["Summer"], count=True, catalog=catalog_path
+    )
+    with MetadataCatalog(catalog_path) as catalog:
+        expected = catalog.count(countries=["Portugal"], seasons=["Summer"])
+    assert capsys.readouterr().out.strip() == str(expected)
+    query_catalog(countries=["Portugal"], limit=2, catalog=catalog_path)
+    assert len(capsys.readouterr().out.split()) == 2
+    query_catalog(
+        countries=["Portugal"],
+        exclude_flags=["seasonal_snow", "cloud_and_shadow"],
+        count=True,
+        catalog=catalog_path,
+    )
+    with MetadataCatalog(catalog_path) as catalog:
+        expected = catalog.count(
+            countries=["Portugal"],
+            exclude_flags=ben_metadata.PatchFlag.seasonal_snow
+            | ben_metadata.PatchFlag.cloud_and_shadow,
+        )
+    assert capsys.readouterr().out.strip() == str(expected)
+    with pytest.raises(ValueError):
+        query_catalog(exclude_flags=["snowy"], catalog=catalog_path)
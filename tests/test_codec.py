@@ -0,0 +1,143 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+from bigearthnet_common.base import get_metadata_table
+from bigearthnet_common.codec import *
+from bigearthnet_common.constants import BEN_S1_RE, BEN_S2_RE
+
+NAMES = [
+    "S1A_IW_GRDH_1SDV_20170613T165043_33UUP_61_39",
+    "S1B_IW_GRDH_1SDV_20171221T064238_29SND_5_0",
+    "S2A_MSIL2A_20170613T101031_61_39",
+    "S2B_MSIL2A_20170924T93020_41_73",
+    "S2B_MSIL2A_20170924T093020_41_73",
+    "S2B_MSIL2A_20180204T94160_0_2",
+]
+
+INVALID_NAMES = [
+    "",
+    "S2A_MSIL2A_20170613T101031_61",
+    "S2A_MSIL2A_20170613T101031_61_39_",
+    "S2A_MSIL2A_20170613T101031_061_39",
+    "S2A_MSIL2A_20170613T101031_61_09",
+    "S2A_MSIL2A_20170231T101031_61_39",
+    "S2A_MSIL2A_20171313T101031_61_39",
+    "S2A_MSIL2A_20170613T241031_61_39",
+    "S2A_MSIL2A_20170613T106231_61_39",
+    "S2A_MSIL2A_20170613T1031_61_39",
+    "S2C_MSIL2A_20170613T101031_61_39",
+    "S1A_IW_GRDH_1SDV_20170613T65043_33UUP_61_39",
+    "S1A_IW_GRDH_1SDV_20170613T165043_33IUP_61_39",
+    "S1A_IW_GRDH_1SDV_20170613T165043_61UUP_61_39",
+    "S1A_IW_GRDH_1SDV_20170613T165043_33UU_61_39",
+    "S1A_IW_GRDH_1SDV_20500613T165043_33UUP_61_39",
+]
+
+
+@pytest.mark.parametrize("name", NAMES)
+def test_roundtrip(name):
+    code = encode_patch_name(name)
+    assert isinstance(code, int)
+    assert decode_patch_name(code) == name
+
+
+def test_short_hour_is_preserved():
+    assert encode_patch_name(NAMES[3]) != encode_patch_name(NAMES[4])
+
+
+def test_sources_are_separated():
+    codes = encode_patch_names(NAMES)
+    assert codes.dtype == np.uint64
+    np.testing.assert_array_equal(is_s1_code(codes), [True, True] + [False] * 4)
+    assert INVALID_CODE not in codes
+
+
+@pytest.mark.parametrize("name", INVALID_NAMES)
+def test_invalid_names(name):
+    with pytest.raises(ValueError):
+        encode_patch_name(name)
+
+
+def test_non_strict_batch_encoding():
+    codes = encode_patch_names(INVALID_NAMES + NAMES, strict=False)
+    assert (codes[: len(INVALID_NAMES)] == INVALID_CODE).all()
+    np.testing.assert_array_equal(
+        decode_patch_names(codes[len(INVALID_NAMES) :]), NAMES
+    )
+
+
+def test_invalid_codes():
+    with pytest.raises(ValueError):
+        decode_patch_name(INVALID_CODE)
+    with pytest.raises(ValueError):
+        decode_patch_names([encode_patch_name(NAMES[0]), INVALID_CODE])
+
+
+def test_empty_batches():
+    assert len(encode_patch_names([])) == 0
+    assert len(decode_patch_names(np.array([], dtype=np.uint64))) == 0
+
+
+def test_archive_roundtrip():
+    names = get_metadata_table().names
+    codes = encode_patch_names(names)
+    assert len(np.unique(codes)) == len(codes)
+    np.testing.assert_array_equal(decode_patch_names(codes), names.astype(str))
+
+
+def test_parse_patch_name():
+    assert parse_patch_name(NAMES[0]) == PatchName(
+        "S1A", datetime(2017, 6, 13, 16, 50, 43), "33UUP", 61, 39
+    )
+    assert parse_patch_name(NAMES[2]) == PatchName(
+        "S2A", datetime(2017, 6, 13, 10, 10, 31), "", 61, 39
+    )
+    with pytest.raises(ValueError):
+        parse_patch_name(INVALID_NAMES[1])
+
+
+def test_parse_patch_names_short_hour():
+    parsed = parse_patch_names(NAMES[3:])
+    assert parsed.dtype == PATCH_NAME_DTYPE
+    assert parsed["acquisition_time"][0] == parsed["acquisition_time"][1]
+    # the seconds `60` roll over into the next minute
+    assert parsed["acquisition_time"][2] == np.datetime64("2018-02-04T09:42:00")
+
+
+def test_non_strict_parsing():
+    parsed = parse_patch_names(INVALID_NAMES + NAMES, strict=False)
+    invalid = parsed[: len(INVALID_NAMES)]
+    assert np.isnat(invalid["acquisition_time"]).all()
+    assert (invalid["mission"] == "").all()
+    np.testing.assert_array_equal(
+        parsed[len(INVALID_NAMES) :], parse_patch_names(NAMES)
+    )
+    assert len(parse_patch_names([])) == 0
+
+
+def test_parse_archive_patch_names():
+    table = get_metadata_table()
+    ids = np.arange(0, len(table), 997)
+    for source in ["S1", "S2"]:
+        names = table.get_names(source, ids).astype(str)
+        parsed = parse_patch_names(names)
+        for name, row in zip(names, parsed):
+            regex = BEN_S1_RE if source == "S1" else BEN_S2_RE
+            match = regex.fullmatch(name)
+            assert row["mission"] == match["sentinel_mission"]
+            assert row["horizontal_id"] == int(match["horizontal_id"])
+            assert row["vertical_id"] == int(match["vertical_id"])
+            expected_time = datetime(
+                int(match["year"]),
+                int(match["month"]),
+                int(match["day"]),
+                int(match["hour"]),
+                int(match["minute"]),
+            ) + timedelta(seconds=int(match["second"]))
+            assert row["acquisition_time"].item() == expected_time
+            if source == "S1":
+                assert row["tile"] == match["sentinel_2_l1c_tile_area"]
+            else:
+                assert row["tile"] == ""
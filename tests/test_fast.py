@@ -0,0 +1,82 @@
+import warnings
+
+import pytest
+
+import bigearthnet_common.base as ben_base
+import bigearthnet_common.fast as ben_fast
+
+PATCH_NAMES = [
+    "hello",
+    "S2A_MSIL2A_20180205T100211_2_0",
+    "S1A_IW_GRDH_1SDV_20180417T155012_34WFV_59_20",
+    "S2B_MSIL2A_20170906T101019_33_85",
+    "S1A_IW_GRDH_1SDV_20170904T161304_34VDN_33_85",
+    "S2A_MSIL2A_20171221T112501_56_35",
+    "S1A_IW_GRDH_1SDV_20170716T180622_29UPV_72_73",
+    "S2A_MSIL2A_20170717T113321_61_13",
+    "S2A_MSIL2A_20170717T113321_28_87",
+    "S2B_MSIL2A_20170812T092029_75_6",
+    "S2A_MSIL2A_20170717T113321_28_88",
+    "S1B_IW_GRDH_1SDV_20170701T182622_29SND_64_30",
+]
+
+KNOWN_PATCH_NAMES = [n for n in PATCH_NAMES if n != "hello"]
+
+
+@pytest.mark.parametrize(
+    "func",
+    [
+        "is_s1_patch",
+        "is_s2_patch",
+        "is_snowy_patch",
+        "is_cloudy_shadowy_patch",
+        "has_19_class_target",
+        "get_original_split_from_patch_name",
+    ],
+)
+@pytest.mark.parametrize("patch_name", PATCH_NAMES)
+def test_same_as_validated_version(func, patch_name):
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore")
+        expected = getattr(ben_base, func)(patch_name)
+    assert getattr(ben_fast, func)(patch_name) == expected
+
+
+@pytest.mark.parametrize(
+    "func",
+    ["get_country_from_patch_name", "get_season_from_patch_name"],
+)
+@pytest.mark.parametrize("patch_name", KNOWN_PATCH_NAMES)
+def test_same_values_as_base(func, patch_name):
+    assert getattr(ben_fast, func)(patch_name) == getattr(ben_base, func)(patch_name)
+
+
+def test_name_conversion():
+    s1_name = "S1A_IW_GRDH_1SDV_20170613T165043_33UUP_87_48"
+    s2_name = "S2A_MSIL2A_20170613T101031_87_48"
+    assert ben_fast.s1_to_s2_patch_name(s1_name) == s2_name
+    assert ben_fast.s2_to_s1_patch_name(s2_name) == s1_name
+    with pytest.raises(KeyError):
+        ben_fast.s1_to_s2_patch_name(s2_name)
+    with pytest.raises(KeyError):
+        ben_fast.s2_to_s1_patch_name(s1_name)
+
+
+@pytest.mark.parametrize(
+    "func",
+    ["get_country_from_patch_name", "get_season_from_patch_name"],
+)
+def test_unknown_patch(func):
+    with pytest.raises(KeyError):
+        getattr(ben_fast, func)("hello")
+
+
+def test_no_split_warning():
+    with warnings.catch_warnings():
+        warnings.simplefilter("error")
+        assert (
+            ben_fast.get_original_split_from_patch_name(
+                "S2B_MSIL2A_20170906T101019_33_85"
+            )
+            is None
+        )
@@ -1,7 +1,99 @@
+import sys
+
+import pytest
 from packaging import version
 
 import bigearthnet_common
+import bigearthnet_common._cache as ben_cache
+from bigearthnet_common._cache import cached_resource
+from bigearthnet_common.base import (
+    get_metadata_table,
+    get_s2_patches_with_seasonal_snow,
+)
+
+
+@pytest.fixture
+def isolated_resource_stats(monkeypatch):
+    """Register the resources of a test in a separate registry."""
+    monkeypatch.setattr(ben_cache, "_RESOURCE_COUNTERS", {})
 
 
 def test_version():
     assert isinstance(version.parse(bigearthnet_common.__version__), version.Version)
+
+
+def test_stats():
+    table = get_metadata_table()
+    name = "bigearthnet_common.base.get_metadata_table"
+    before = bigearthnet_common.stats()[name]
+    get_metadata_table()
+    after = bigearthnet_common.stats()[name]
+    assert after.hits == before.hits + 1
+    assert after.misses >= 1
+    assert after.rows == len(table)
+    assert after.nbytes == table.nbytes
+    assert after.load_seconds >= 0
+
+
+def test_stats_callback(isolated_resource_stats):
+    @cached_resource
+    def _stats_test_resource():
+        return [1, 2, 3]
+
+    (name,) = bigearthnet_common.stats()
+    assert name == f"{__name__}.test_stats_callback.<locals>._stats_test_resource"
+    assert bigearthnet_common.stats()[name].misses == 0
+    received = []
+    bigearthnet_common.set_stats_callback(received.append)
+    try:
+        _stats_test_resource()
+        _stats_test_resource()
+    finally:
+        bigearthnet_common.set_stats_callback(None)
+    assert len(received) == 1
+    assert received[0].name == name
+    assert received[0].misses == 1
+    assert received[0].rows == 3
+    assert bigearthnet_common.stats()[name].hits == 1
+
+
+def test_stats_registry_is_isolated(monkeypatch):
+    with monkeypatch.context() as m:
+        m.setattr(ben_cache, "_RESOURCE_COUNTERS", {})
+
+        @cached_resource
+        def _isolated_resource():
+            return {"a", "b"}
+
+        _isolated_resource()
+        (name,) = bigearthnet_common.stats()
+    assert name not in bigearthnet_common.stats()
+
+
+def test_stats_nbytes(isolated_resource_stats):
+    @cached_resource
+    def _set_resource():
+        return frozenset(str(i) for i in range(100))
+
+    resource = _set_resource()
+    (stats,) = bigearthnet_common.stats().values()
+    assert stats.nbytes > sys.getsizeof(resource)
+    assert ben_cache.estimate_nbytes(object()) is None
+    assert ben_cache.estimate_nbytes(get_s2_patches_with_seasonal_snow()) == 0
+
+
+def test_failing_stats_callback(isolated_resource_stats):
+    @cached_resource
+    def _failing_callback_resource():
+        return object()
+
+    def _callback(_):
+        raise ValueError("broken callback")
+
+    bigearthnet_common.set_stats_callback(_callback)
+    try:
+        with pytest.warns(RuntimeWarning, match="broken callback"):
+            resource = _failing_callback_resource()
+    finally:
+        bigearthnet_common.set_stats_callback(None)
+    assert _failing_callback_resource() is resource
@@ -0,0 +1,332 @@
+import concurrent.futures
+import pickle
+
+import natsort
+import numpy as np
+import pytest
+
+import bigearthnet_common.constants as ben_constants
+import bigearthnet_common.metadata as ben_metadata
+from bigearthnet_common.metadata import *
+
+S1_NAMES = [
+    "S1A_IW_GRDH_1SDV_20171221T064238_29SND_56_35",
+    "S1B_IW_GRDH_1SDV_20170701T182622_29SND_64_30",
+    "S1A_IW_GRDH_1SDV_20170613T165043_33UUP_61_39",
+]
+S2_NAMES = [
+    "S2A_MSIL2A_20171221T112501_56_35",
+    "S2B_MSIL2A_20170701T113321_64_30",
+    "S2A_MSIL2A_20170613T101031_61_39",
+]
+
+
+@pytest.fixture
+def table():
+    return build_metadata_table(
+        s1_names=S1_NAMES,
+        s2_names=S2_NAMES,
+        countries=["Portugal", "Portugal", "Austria"],
+        seasons=["Winter", "Summer", "Summer"],
+        split_s2_names={
+            ben_constants.Split.train: [S2_NAMES[0]],
+            ben_constants.Split.test: [S2_NAMES[2]],
+        },
+        flag_s2_names={
+            PatchFlag.seasonal_snow: [S2_NAMES[1]],
+            PatchFlag.no_19_class_target: [S2_NAMES[1], S2_NAMES[2]],
+        },
+    )
+
+
+def test_shared_id(table):
+    for s1, s2 in zip(S1_NAMES, S2_NAMES):
+        id = table.get_id(s1)
+        assert id >= 0
+        assert id == table.get_id(s2)
+        assert table.get_name(ben_constants.SentinelSource.S1, id) == s1
+        assert table.get_name(ben_constants.SentinelSource.S2, id) == s2
+
+
+def test_get_id_unknown(table):
+    assert table.get_id("unknown") == -1
+    assert table.get_id(S1_NAMES[0], ben_constants.SentinelSource.S2) == -1
+    assert table.get_id(S2_NAMES[0], ben_constants.SentinelSource.S1) == -1
+
+
+def test_get_id_matches_get_ids(table):
+    names = S1_NAMES + S2_NAMES + ["unknown"]
+    for source in [None, *ben_constants.SentinelSource]:
+        assert [table.get_id(n, source) for n in names] == table.get_ids(
+            names, source
+        ).tolist()
+
+
+def test_get_position(table):
+    n = len(table)
+    for s1, s2 in zip(S1_NAMES, S2_NAMES):
+        s1_pos, s2_pos = table.get_position(s1), table.get_position(s2)
+        assert 0 <= s1_pos < n <= s2_pos < 2 * n
+        assert table.name_row[s1_pos] == table.name_row[s2_pos] == table.get_id(s1)
+    assert table.get_position("unknown") == -1
+    assert table.get_position("") == -1
+    assert table.get_position(S2_NAMES[0][:-1]) == -1
+    assert table.get_position(S1_NAMES[0] + "_too_long") == -1
+
+
+def test_get_ids(table):
+    ids = table.get_ids(S1_NAMES + ["unknown"] + S2_NAMES)
+    assert ids.dtype == np.int64
+    np.testing.assert_array_equal(ids[:3], ids[4:])
+    assert ids[3] == -1
+    assert (ids[:3] >= 0).all()
+    np.testing.assert_array_equal(table.get_ids(np.array(S2_NAMES)), ids[4:])
+    assert len(table.get_ids([])) == 0
+
+
+def test_get_ids_independent_of_query_itemsize(table):
+    long_name = "S2A_MSIL2A_20170613T101031_61_39" + "0" * 40
+    ids = table.get_ids(np.array(S2_NAMES + [long_name], dtype="S80"))
+    np.testing.assert_array_equal(ids[:3], table.get_ids(S2_NAMES))
+    assert ids[3] == -1
+    np.testing.assert_array_equal(
+        table.get_ids(np.array(S2_NAMES, dtype="S40")), ids[:3]
+    )
+
+
+def test_get_ids_without_hash_index(table):
+    ids = table.get_ids(S1_NAMES + ["unknown"] + S2_NAMES)
+    table.hash_keys = np.empty(0, dtype=np.uint64)
+    table.hash_position = np.empty(0, dtype=np.int32)
+    np.testing.assert_array_equal(table.get_ids(S1_NAMES + ["unknown"] + S2_NAMES), ids)
+    np.testing.assert_array_equal(
+        table.get_ids(S2_NAMES, ben_constants.SentinelSource.S1), [-1] * 3
+    )
+
+
+def test_columns(table):
+    id = table.get_id(S2_NAMES[2])
+    assert table.get_value(MetadataColumn.country, id) == "Austria"
+    assert table.get_value(MetadataColumn.season, id) == "Summer"
+    assert SPLIT_NAMES[table.split[id]] == ben_constants.Split.test
+    assert table.split[table.get_id(S2_NAMES[1])] == NO_SPLIT
+    assert table.flags[id] == PatchFlag.no_19_class_target | PatchFlag.test
+
+
+def test_get_record(table):
+    record = table.get_record(table.get_id(S1_NAMES[1]))
+    assert record == PatchMetadata(
+        s1_name=S1_NAMES[1],
+        s2_name=S2_NAMES[1],
+        split=None,
+        country="Portugal",
+        season="Summer",
+        snowy=True,
+        cloudy_shadowy=False,
+        has_19_class_target=False,
+    )
+    assert pickle.loads(pickle.dumps(record)) == record
+    with pytest.raises(AttributeError):
+        record.unknown_field = 1
+
+
+def test_get_records(table):
+    ids = table.get_ids(S2_NAMES)
+    records = table.get_records(ids)
+    assert records.dtype == patch_metadata_dtype(table.names.itemsize)
+    for id, record in zip(ids, records):
+        expected = table.get_record(id)
+        assert record["s1_name"] == expected.s1_name
+        assert record["s2_name"] == expected.s2_name
+        split = None if record["split"] == NO_SPLIT else SPLIT_NAMES[record["split"]]
+        assert split == expected.split
+        assert COUNTRY_NAMES[record["country"]] == expected.country
+        assert SEASON_NAMES[record["season"]] == expected.season
+        assert record["snowy"] == expected.snowy
+        assert record["cloudy_shadowy"] == expected.cloudy_shadowy
+        assert record["has_19_class_target"] == expected.has_19_class_target
+    assert len(table.get_records()) == len(table)
+
+
+def test_index_query(table):
+    index = table.index
+    assert index is table.index
+
+    def ids(*names):
+        return sorted(table.get_id(n) for n in names)
+
+    portugal = COUNTRY_NAMES.index("Portugal")
+    summer = SEASON_NAMES.index("Summer")
+    test = SPLIT_NAMES.index("test")
+    np.testing.assert_array_equal(index.query(), ids(*S2_NAMES))
+    np.testing.assert_array_equal(
+        index.query(countries=[portugal]), ids(S2_NAMES[0], S2_NAMES[1])
+    )
+    np.testing.assert_array_equal(
+        index.query(countries=[portugal], seasons=[summer]), ids(S2_NAMES[1])
+    )
+    np.testing.assert_array_equal(index.query(splits=[test]), ids(S2_NAMES[2]))
+    np.testing.assert_array_equal(
+        index.query(exclude_flags=PatchFlag.no_19_class_target), ids(S2_NAMES[0])
+    )
+    np.testing.assert_array_equal(
+        index.query(seasons=[summer], exclude_flags=PatchFlag.seasonal_snow),
+        ids(S2_NAMES[2]),
+    )
+    assert len(index.query(countries=[])) == 0
+
+
+def test_index_is_built_once(table):
+    with concurrent.futures.ThreadPoolExecutor(8) as pool:
+        indexes = list(pool.map(lambda _: table.index, range(32)))
+    assert all(index is indexes[0] for index in indexes)
+
+
+def test_natsorted_ids(table):
+    ids = np.arange(len(table))
+    for source, names in (
+        (ben_constants.SentinelSource.S1, S1_NAMES),
+        (ben_constants.SentinelSource.S2, S2_NAMES),
+    ):
+        sorted_names = [
+            table.get_name(source, id) for id in table.natsorted_ids(source, ids)
+        ]
+        assert sorted_names == natsort.natsorted(names)
+
+
+def test_natural_sort_ranks():
+    names = [
+        "S2A_MSIL2A_20180204T94160_0_2",
+        "S2A_MSIL2A_20180204T100131_10_2",
+        "S2A_MSIL2A_20180204T94160_10_2",
+        "S2A_MSIL2A_20180204T94160_9_12",
+        "S2A_MSIL2A_20180204T94160_9_2",
+        "S2B_MSIL2A_20170204T94160_0_2",
+    ]
+    ranks = ben_metadata._natural_sort_ranks(np.array(names, dtype=bytes))
+    assert [names[i] for i in np.argsort(ranks)] == natsort.natsorted(names)
+
+
+def test_set_view(table):
+    snowy = PatchNameSetView(
+        table, ben_constants.SentinelSource.S1, include=PatchFlag.seasonal_snow
+    )
+    assert len(snowy) == 1
+    assert S1_NAMES[1] in snowy
+    assert S2_NAMES[1] not in snowy
+    assert S1_NAMES[0] not in snowy
+    assert snowy == {S1_NAMES[1]}
+    assert isinstance(snowy | {"other"}, set)
+    assert pickle.loads(pickle.dumps(snowy)) == {S1_NAMES[1]}
+
+
+def test_split_flags(table):
+    for id in range(len(table)):
+        flags = int(table.flags[id])
+        split_flags = [flag for flag in SPLIT_FLAGS if flags & flag]
+        if table.split[id] == NO_SPLIT:
+            assert split_flags == []
+        else:
+            assert split_flags == [SPLIT_FLAGS[table.split[id]]]
+
+
+def test_mask(table):
+    def names(mask):
+        return {
+            table.get_name(ben_constants.SentinelSource.S2, id)
+            for id in np.flatnonzero(mask)
+        }
+
+    assert names(table.mask()) == set(S2_NAMES)
+    assert names(table.mask(exclude=UNRECOMMENDED_FLAGS)) == {S2_NAMES[0]}
+    assert names(table.mask(include=PatchFlag.train | PatchFlag.test)) == {
+        S2_NAMES[0],
+        S2_NAMES[2],
+    }
+    assert names(
+        table.mask(include=PatchFlag.no_19_class_target, exclude=PatchFlag.test)
+    ) == {S2_NAMES[1]}
+    np.testing.assert_array_equal(
+        table.index.query(
+            include_flags=PatchFlag.no_19_class_target, exclude_flags=PatchFlag.test
+        ),
+        np.flatnonzero(table.mask(PatchFlag.no_19_class_target, PatchFlag.test)),
+    )
+
+
+def test_set_view_exclude(table):
+    recommended = PatchNameSetView(
+        table, ben_constants.SentinelSource.S2, exclude=UNRECOMMENDED_FLAGS
+    )
+    assert recommended == {S2_NAMES[0]}
+    assert S2_NAMES[0] in recommended
+    assert S2_NAMES[1] not in recommended
+
+
+def test_mapping_view(table):
+    mapping = PatchNameMappingView(
+        table, ben_constants.SentinelSource.S2, MetadataColumn.s1_name
+    )
+    assert dict(mapping) == dict(zip(S2_NAMES, S1_NAMES))
+    assert dict(mapping.items()) == dict(zip(S2_NAMES, S1_NAMES))
+    assert set(mapping.values()) == set(S1_NAMES)
+    with pytest.raises(KeyError):
+        mapping[S1_NAMES[0]]
+    assert pickle.loads(pickle.dumps(mapping)) == dict(zip(S2_NAMES, S1_NAMES))
+
+
+def test_unknown_country():
+    with pytest.raises(ValueError, match="country"):
+        build_metadata_table(S1_NAMES[:1], S2_NAMES[:1], ["Norway"], ["Winter"], {}, {})
+
+
+def test_duplicate_names():
+    with pytest.raises(ValueError, match="unique"):
+        build_metadata_table(
+            S1_NAMES[:2], [S2_NAMES[0]] * 2, ["Austria"] * 2, ["Winter"] * 2, {}, {}
+        )
+
+
+def test_unknown_flag_patch():
+    with pytest.raises(ValueError, match="unknown"):
+        build_metadata_table(
+            S1_NAMES,
+            S2_NAMES,
+            ["Austria"] * 3,
+            ["Winter"] * 3,
+            {},
+            {PatchFlag.seasonal_snow: ["S2A_MSIL2A_20171221T112501_1_1"]},
+        )
+
+
+@pytest.mark.parametrize("mmap_mode", [None, "r"])
+def test_save_load_roundtrip(table, tmp_path, mmap_mode):
+    save_metadata_table(table, tmp_path)
+    loaded = load_metadata_table(tmp_path, mmap_mode=mmap_mode)
+    for name in TABLE_ARRAYS:
+        np.testing.assert_array_equal(getattr(table, name), getattr(loaded, name))
+    assert loaded.get_id(S1_NAMES[0]) == table.get_id(S1_NAMES[0])
+    assert (loaded.mmap_directory is None) == (mmap_mode is None)
+    assert loaded.names.flags.writeable == (mmap_mode is None)
+
+
+def test_pickle_memory_mapped_table(table, tmp_path):
+    save_metadata_table(table, tmp_path)
+    loaded = load_metadata_table(tmp_path, mmap_mode="r")
+    dumped = pickle.dumps(loaded)
+    # only the directory is transferred
+    assert len(dumped) < loaded.nbytes
+    unpickled = pickle.loads(dumped)
+    assert unpickled.mmap_directory == tmp_path
+    assert unpickled.get_id(S2_NAMES[1]) == table.get_id(S2_NAMES[1])
+
+
+def test_pickle_in_memory_table(table):
+    unpickled = pickle.loads(pickle.dumps(table))
+    assert unpickled.mmap_directory is None
+    np.testing.assert_array_equal(unpickled.names, table.names)
+
+
+def test_load_missing_table(tmp_path):
+    with pytest.raises(ValueError, match="Could not load"):
+        load_metadata_table(tmp_path)
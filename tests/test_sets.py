@@ -1,9 +1,12 @@
 from pathlib import Path
 
+import natsort
 import pytest
 from pydantic import ValidationError
 
 import bigearthnet_common.constants as ben_constants
+import bigearthnet_common.metadata as ben_metadata
+from bigearthnet_common.base import s2_to_s1_patch_name
 from bigearthnet_common.sets import *
 
 
@@ -75,6 +78,22 @@ def test_filter_patches_by_country_order():
     assert lithuania_patches == out
 
 
+def test_filter_patches_by_flags():
+    patches = list(get_all_s2_patches())[:1000][::-1]
+    recommended = get_recommended_s2_patches()
+    out = filter_patches_by_flags(
+        "S2", patches, exclude=ben_metadata.UNRECOMMENDED_FLAGS
+    )
+    assert out == [p for p in patches if p in recommended]
+    with pytest.raises(KeyError):
+        filter_patches_by_flags("S2", patches + ["hello"])
+    # S1 patch names are unknown patches of the S2 archive
+    s1_patch = s2_to_s1_patch_name(patches[0])
+    with pytest.raises(KeyError):
+        filter_patches_by_flags("S2", [s1_patch])
+    assert filter_patches_by_flags("S1", [s1_patch]) == [s1_patch]
+
+
 def test_build_sets():
     assert len(build_set("S1", seasons=["Winter"])) < len(
         build_set("S2", seasons=["Winter", "Fall"])
@@ -100,6 +119,14 @@ def test_build_sets():
     )
 
 
+def test_build_set_repeated_values():
+    winter = build_set("S2", seasons=["Winter"], countries=["Serbia"])
+    assert len(winter) > 0
+    assert build_set(
+        "S2", seasons=["Winter", "Winter"], countries=["Serbia"]
+    ) == natsort.natsorted(winter * 2)
+
+
 @pytest.mark.parametrize(
     "inp_kwargs",
     [
@@ -0,0 +1,193 @@
+import json
+import pickle
+import shutil
+
+import numpy as np
+import pytest
+
+import bigearthnet_common.base as ben_base
+from bigearthnet_common.snapshot import *
+from bigearthnet_common.synthetic import (
+    generate_synthetic_archive,
+    s1_patch_metadata,
+    s2_patch_metadata,
+)
+
+FRACTION = 0.0005
+
+
+@pytest.fixture(scope="module", params=["S1", "S2"])
+def archive(request, tmp_path_factory):
+    root_dir = tmp_path_factory.mktemp(request.param)
+    patch_names = generate_synthetic_archive(root_dir, request.param, fraction=FRACTION)
+    return request.param, root_dir, patch_names
+
+
+@pytest.fixture(scope="module")
+def snapshot_path(archive, tmp_path_factory):
+    sentinel_source, root_dir, _ = archive
+    file_path = tmp_path_factory.mktemp("snapshot") / "snapshot.npz"
+    write_metadata_snapshot(root_dir, sentinel_source, file_path)
+    return file_path
+
+
+def test_labels_to_bits():
+    bits = labels_to_bits(["Pastures", "Airports"])
+    assert bits_to_labels(bits) == ["Airports", "Pastures"]
+    with pytest.raises(KeyError):
+        labels_to_bits(["Unknown"])
+
+
+@pytest.mark.parametrize("mmap_mode", ["r", None])
+def test_records_match_json_files(archive, snapshot_path, mmap_mode):
+    sentinel_source, root_dir, patch_names = archive
+    snapshot = load_metadata_snapshot(snapshot_path, mmap_mode=mmap_mode)
+    assert len(snapshot) == len(patch_names)
+    assert snapshot.sentinel_source == sentinel_source
+    read_json = (
+        ben_base.read_S1_json if sentinel_source == "S1" else ben_base.read_S2_json
+    )
+    rows = snapshot.get_rows(patch_names)
+    assert (rows >= 0).all()
+    for name, row in zip(patch_names, rows):
+        data = read_json(root_dir / name / f"{name}_labels_metadata.json")
+        data.pop("corresponding_s2_patch", None)
+        record = snapshot.get_record(row)
+        assert sorted(record.pop("labels")) == sorted(data.pop("labels"))
+        assert record == data
+
+
+def test_arrays_are_memory_mapped(snapshot_path):
+    snapshot = load_metadata_snapshot(snapshot_path)
+    assert not snapshot.labels.flags.writeable
+    assert snapshot.file_path == snapshot_path
+    # only the file path is pickled
+    assert len(pickle.dumps(snapshot)) < 1_000
+    unpickled = pickle.loads(pickle.dumps(snapshot))
+    np.testing.assert_array_equal(unpickled.names, snapshot.names)
+
+
+def test_interned_columns(snapshot_path):
+    snapshot = load_metadata_snapshot(snapshot_path)
+    assert len(snapshot.projections) < len(snapshot)
+    assert snapshot.projection.max() < len(snapshot.projections)
+    assert snapshot.source.max() < len(snapshot.sources)
+    assert snapshot.acquisition_time.dtype == np.dtype("datetime64[s]")
+
+
+def test_has_labels(snapshot_path):
+    snapshot = load_metadata_snapshot(snapshot_path)
+    labels = ["Pastures", "Mixed forest"]
+    any_mask = snapshot.has_labels(labels)
+    all_mask = snapshot.has_labels(labels, match_all=True)
+    for row in range(len(snapshot)):
+        row_labels = set(snapshot.get_labels(row))
+        assert any_mask[row] == bool(row_labels & set(labels))
+        assert all_mask[row] == row_labels.issuperset(labels)
+
+
+def test_unknown_rows(snapshot_path):
+    snapshot = load_metadata_snapshot(snapshot_path)
+    assert snapshot.get_rows(["S2A_MSIL2A_20000101T000000_0_0", ""]).tolist() == [
+        -1,
+        -1,
+    ]
+
+
+def test_invalid_snapshot(tmp_path):
+    file_path = tmp_path / "invalid.npz"
+    file_path.write_bytes(b"no snapshot")
+    with pytest.raises(ValueError):
+        load_metadata_snapshot(file_path)
+    np.savez(file_path, names=np.array([b"a"]))
+    for mmap_mode in ["r", None]:
+        with pytest.raises(ValueError, match="missing"):
+            load_metadata_snapshot(file_path, mmap_mode=mmap_mode)
+
+
+def test_manifest_matches_json_files(archive, snapshot_path):
+    _, root_dir, _ = archive
+    snapshot = load_metadata_snapshot(snapshot_path)
+    for name, mtime_ns, size in zip(snapshot.names, snapshot.mtime_ns, snapshot.size):
+        name = name.decode()
+        stat = (root_dir / name / f"{name}_labels_metadata.json").stat()
+        assert (mtime_ns, size) == (stat.st_mtime_ns, stat.st_size)
+
+
+@pytest.mark.parametrize("sentinel_source", ["S1", "S2"])
+def test_update_metadata_snapshot(tmp_path, sentinel_source):
+    root_dir = tmp_path / "archive"
+    file_path = tmp_path / "snapshot.npz"
+    patch_names = generate_synthetic_archive(
+        root_dir, sentinel_source, fraction=FRACTION
+    )
+    update = update_metadata_snapshot(root_dir, sentinel_source, file_path)
+    assert sorted(update.added) == sorted(patch_names)
+    assert update.changed == update.removed == []
+
+    update = update_metadata_snapshot(root_dir, sentinel_source, file_path)
+    assert update.added == update.changed == update.removed == []
+
+    changed, removed = patch_names[:2]
+    json_fp = root_dir / changed / f"{changed}_labels_metadata.json"
+    data = json.loads(json_fp.read_text())
+    data["labels"] = ["Airports"]
+    json_fp.write_text(json.dumps(data))
+    shutil.rmtree(root_dir / removed)
+    s1_name, s2_name = next(
+        (s1_name, s2_name)
+        for s1_name, s2_name in ben_base.get_complete_s1_to_s2_patch_name_mapping().items()
+        if (s1_name if sentinel_source == "S1" else s2_name) not in patch_names
+    )
+    if sentinel_source == "S1":
+        added, data = s1_name, s1_patch_metadata(s1_name, s2_name, ["Pastures"])
+    else:
+        added, data = s2_name, s2_patch_metadata(s2_name, s1_name, ["Pastures"])
+    (root_dir / added).mkdir()
+    (root_dir / added / f"{added}_labels_metadata.json").write_text(json.dumps(data))
+    update = update_metadata_snapshot(root_dir, sentinel_source, file_path)
+    assert (update.added, update.changed, update.removed) == (
+        [added],
+        [changed],
+        [removed],
+    )
+
+    # the updated snapshot is identical to a complete re-scan
+    expected = build_metadata_snapshot(root_dir, sentinel_source)
+    snapshot = load_metadata_snapshot(file_path)
+    assert snapshot.get_labels(snapshot.get_rows([changed])[0]) == ["Airports"]
+    np.testing.assert_array_equal(snapshot.names, expected.names)
+    for row in range(len(expected)):
+        assert snapshot.get_record(row) == expected.get_record(row)
+    for name in ("labels", "coordinates", "acquisition_time", "mtime_ns", "size"):
+        np.testing.assert_array_equal(getattr(snapshot, name), getattr(expected, name))
+    assert len(snapshot.projections) == len(expected.projections)
+    assert len(snapshot.sources) == len(expected.sources)
+
+
+def test_update_metadata_snapshot_missing_json(tmp_path):
+    root_dir = tmp_path / "archive"
+    file_path = tmp_path / "snapshot.npz"
+    patch_names = generate_synthetic_archive(root_dir, "S2", fraction=FRACTION)
+    update_metadata_snapshot(root_dir, "S2", file_path)
+
+    # the patch directory of a partially re-synced archive is left without its json file
+    removed = patch_names[0]
+    (root_dir / removed / f"{removed}_labels_metadata.json").unlink()
+    update = update_metadata_snapshot(root_dir, "S2", file_path)
+    assert (update.added, update.changed, update.removed) == ([], [], [removed])
+    snapshot = load_metadata_snapshot(file_path)
+    assert len(snapshot) == len(patch_names) - 1
+    assert snapshot.get_rows([removed])[0] == -1
+
+    update = update_metadata_snapshot(root_dir, "S2", tmp_path / "new_snapshot.npz")
+    assert removed not in update.added
+    with pytest.raises(FileNotFoundError, match=removed):
+        build_metadata_snapshot([root_dir / removed], "S2")
+
+
+def test_update_metadata_snapshot_checks_source(archive, snapshot_path):
+    sentinel_source, root_dir, _ = archive
+    other_source = "S2" if sentinel_source == "S1" else "S1"
+    with pytest.raises(ValueError):
+        update_metadata_snapshot(root_dir, other_source, snapshot_path)
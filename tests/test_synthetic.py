@@ -0,0 +1,97 @@
+import contextlib
+import io
+
+import pytest
+
+import bigearthnet_common.base as ben_base
+import bigearthnet_common.constants as ben_constants
+from bigearthnet_common.synthetic import *
+
+FRACTION = 0.0005
+
+
+@pytest.fixture(scope="module")
+def s1_archive(tmp_path_factory):
+    root_dir = tmp_path_factory.mktemp("S1")
+    return root_dir, generate_synthetic_archive(root_dir, "S1", fraction=FRACTION)
+
+
+@pytest.fixture(scope="module")
+def s2_archive(tmp_path_factory):
+    root_dir = tmp_path_factory.mktemp("S2")
+    return root_dir, generate_synthetic_archive(root_dir, "S2", fraction=FRACTION)
+
+
+def test_size(s2_archive):
+    root_dir, patch_names = s2_archive
+    assert len(patch_names) == round(FRACTION * ben_constants.BEN_COMPLETE_SIZE)
+    assert sorted(p.name for p in root_dir.iterdir()) == sorted(patch_names)
+    assert all(ben_base.is_s2_patch(p) for p in patch_names)
+
+
+@pytest.mark.parametrize("archive", ["s1_archive", "s2_archive"])
+def test_only_missing_directories_are_reported(archive, request):
+    root_dir, patch_names = request.getfixturevalue(archive)
+    validate = (
+        ben_base.validate_ben_s1_root_directory
+        if archive == "s1_archive"
+        else ben_base.validate_ben_s2_root_directory
+    )
+    with contextlib.redirect_stdout(io.StringIO()):
+        invalid = validate(root_dir)
+    assert len(invalid) == ben_constants.BEN_COMPLETE_SIZE - len(patch_names)
+    assert not any(root_dir / p in invalid for p in patch_names)
+
+
+def test_band_file_sizes(s1_archive, s2_archive):
+    for (root_dir, patch_names), band_file_sizes in (
+        (s1_archive, S1_BAND_FILE_SIZES),
+        (s2_archive, S2_BAND_FILE_SIZES),
+    ):
+        name = patch_names[0]
+        for band, size in band_file_sizes.items():
+            assert (root_dir / name / f"{name}_{band}.tif").stat().st_size == size
+
+
+def test_json_files_are_readable(s1_archive, s2_archive):
+    s1_root, s1_names = s1_archive
+    s2_root, s2_names = s2_archive
+    for s1_name, s2_name in zip(s1_names, s2_names):
+        s1_data = ben_base.read_S1_json(
+            s1_root / s1_name / f"{s1_name}_labels_metadata.json"
+        )
+        s2_data = ben_base.read_S2_json(
+            s2_root / s2_name / f"{s2_name}_labels_metadata.json"
+        )
+        assert s1_data["corresponding_s2_patch"] == s2_name
+        assert s1_data["coordinates"] == s2_data["coordinates"]
+        ben_base.parse_datetime(s1_data["acquisition_time"])
+        ben_base.parse_datetime(s2_data["acquisition_date"])
+        has_19_class_target = ben_base.has_19_class_target(s2_name)
+        assert (ben_base.old2new_labels(s2_data["labels"]) is not None) == (
+            has_19_class_target
+        )
+
+
+def test_deterministic(tmp_path, s2_archive):
+    root_dir, patch_names = s2_archive
+    assert (
+        generate_synthetic_archive(tmp_path, "S2", fraction=FRACTION, max_workers=1)
+        == patch_names
+    )
+    name = patch_names[-1]
+    json_name = f"{name}/{name}_labels_metadata.json"
+    assert (tmp_path / json_name).read_text() == (root_dir / json_name).read_text()
+
+
+def test_short_hour_and_leap_seconds():
+    s2_name = "S2B_MSIL2A_20180204T94160_0_2"
+    s1_name = ben_base.s2_to_s1_patch_name(s2_name)
+    data = s2_patch_metadata(s2_name, s1_name, ["Pastures"])
+    assert data["acquisition_date"] == "2018-02-04 09:42:00"
+
+
+@pytest.mark.parametrize("fraction", [0, -0.1, 1.5])
+def test_invalid_fraction(tmp_path, fraction):
+    with pytest.raises(ValueError):
+        generate_synthetic_archive(tmp_path, "S2", fraction=fraction)